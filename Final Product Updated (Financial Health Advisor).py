@@ -1,25 +1,356 @@
-from flask import Flask, render_template_string, request, jsonify, redirect, url_for
+from flask import Flask, Blueprint, current_app, g, render_template, request, jsonify, redirect, url_for, send_from_directory
+from flask import session as browser_session
+from flask.cli import AppGroup
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.serving import make_server
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import scoped_session, sessionmaker, configure_mappers
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import safe_join
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor, IsolationForest
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-import joblib
 from datetime import datetime, timedelta
 import os
+import re
+import math
+import time
+import codecs
+import click
+import sys
+import warnings
+import hashlib
+import hmac
+import gzip
+import mimetypes
+import shutil
+import queue
+import threading
+import itertools
+import random
+import contextlib
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import gc
+import json
+import signal
+import atexit
+import socket
+import subprocess
+import types
+import importlib.util
+from multiprocessing import shared_memory, resource_tracker
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///financial_health.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Heavy libraries are imported on first use rather than when this module is imported
+class LazyModule(types.ModuleType):
+    def __getattr__(self, name):
+        # Only called until the first import; afterwards attributes come from __dict__
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+# Returns None for optional libraries that are not installed
+def lazy_import(name):
+    if importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+joblib = lazy_import('joblib')
+pa = lazy_import('pyarrow')
+duckdb = lazy_import('duckdb')
+brotli = lazy_import('brotli')
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# JSON provider backed by orjson, which serializes NumPy arrays and scalars natively
+class OrjsonProvider(DefaultJSONProvider):
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.options | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+# Application factory
+# Importing this module only defines models, routes and commands, and creating the app
+# only configures it: tables are created by `flask init-db`, the model is loaded on the
+# first prediction (or up front with MODEL_PRELOAD=1) and the efficient frontier on the
+# first robo-advisory request.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your_secret_key'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///financial_health.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Response serializer: 'orjson' (when installed) or the standard library 'json'
+    app.config['JSON_SERIALIZER'] = os.environ.get('JSON_SERIALIZER', 'orjson' if orjson else 'json')
+
+    # Monte Carlo goal planning settings
+    app.config['MONTE_CARLO_PATHS'] = 10000
+    app.config['MONTE_CARLO_CHUNK_SIZE'] = 2000
+    app.config['MONTE_CARLO_MONTH_BLOCK'] = 120
+    # Seconds after which to stop at the end of a chunk, or None to always simulate every path;
+    # seeded results only repeat while the budget isn't reached ('paths' in the result says)
+    app.config['MONTE_CARLO_TIME_BUDGET'] = None
+    app.config['MONTE_CARLO_SEED'] = 42
+    app.config['MONTE_CARLO_EXPECTED_RETURN'] = 0.06
+    app.config['MONTE_CARLO_VOLATILITY'] = 0.12
+    app.config['MONTE_CARLO_INFLATION'] = 0.03
+    app.config['MONTE_CARLO_CONFIDENCE_LEVELS'] = [0.5, 0.75, 0.9]
+
+    # Robo-advisory asset classes: annual expected return and volatility, plus correlations
+    app.config['ASSET_CLASSES'] = {
+        'Treasury Bills': {'expected_return': 0.035, 'volatility': 0.01},
+        'Bonds': {'expected_return': 0.045, 'volatility': 0.06},
+        'High Yield Bonds': {'expected_return': 0.06, 'volatility': 0.10},
+        'Real Estate': {'expected_return': 0.07, 'volatility': 0.16},
+        'Index Funds': {'expected_return': 0.08, 'volatility': 0.16},
+        'Stocks': {'expected_return': 0.09, 'volatility': 0.20},
+        'Cryptocurrency': {'expected_return': 0.15, 'volatility': 0.70}
+    }
+    app.config['ASSET_CORRELATIONS'] = [
+        [1.0, 0.3, 0.1, 0.0, 0.0, 0.0, 0.0],
+        [0.3, 1.0, 0.4, 0.2, 0.1, 0.1, 0.0],
+        [0.1, 0.4, 1.0, 0.5, 0.6, 0.6, 0.2],
+        [0.0, 0.2, 0.5, 1.0, 0.6, 0.6, 0.2],
+        [0.0, 0.1, 0.6, 0.6, 1.0, 0.9, 0.3],
+        [0.0, 0.1, 0.6, 0.6, 0.9, 1.0, 0.3],
+        [0.0, 0.0, 0.2, 0.2, 0.3, 0.3, 1.0]
+    ]
+    # Position on the efficient frontier between its least (0) and most (1) volatile portfolio
+    app.config['RISK_TOLERANCE_LEVELS'] = {'low': 0.1, 'medium': 0.4, 'high': 0.8}
+    app.config['FRONTIER_POINTS'] = 60
+
+    # Model preloading for pre-forked workers
+    app.config['MODEL_PRELOAD'] = os.environ.get('MODEL_PRELOAD') == '1'
+    app.config['MODEL_SHARED_MEMORY'] = os.environ.get('MODEL_SHARED_MEMORY') == '1'
+
+    # Model variant served by predict_savings_rate: 'full' or 'compact'
+    app.config['MODEL_VARIANT'] = os.environ.get('MODEL_VARIANT', 'full')
+    # Model inputs: 'latest' (the four latest values) or 'history' (those plus the user's
+    # rolling features from the feature store)
+    app.config['MODEL_FEATURES'] = os.environ.get('MODEL_FEATURES', 'latest')
+    app.config['COMPACT_N_ESTIMATORS'] = 20
+    app.config['COMPACT_MAX_DEPTH'] = 10
+    app.config['COMPACT_MAX_LEAF_NODES'] = 256
+
+    # Horizontal sharding of FinancialData: 0 keeps every row in the main database
+    app.config['FINANCIAL_DATA_SHARDS'] = int(os.environ.get('FINANCIAL_DATA_SHARDS', 0))
+    app.config['SHARD_URI_TEMPLATE'] = 'sqlite:///financial_health_shard_{}.db'
+    # After moving a user, seconds to wait for writes that picked the old shard before the
+    # switch; rows they add are moved too, until a wait turns up none
+    app.config['RESHARD_SETTLE_SECONDS'] = 0.5
+
+    # Online anomaly scoring: robust z-score of each new row against the user's recent rows
+    app.config['ANOMALY_WINDOW'] = 24
+    app.config['ANOMALY_MIN_HISTORY'] = 6
+    app.config['ANOMALY_THRESHOLD'] = 3.5
+    # Floor for the spread, relative to the median, so near-constant histories don't flag noise
+    app.config['ANOMALY_MIN_RELATIVE_SCALE'] = 0.02
+
+    # Data tiering: rows older than this many months are compacted into monthly aggregates
+    app.config['RETENTION_MONTHS'] = int(os.environ.get('RETENTION_MONTHS', 24))
+
+    # Seasonal forecasting (additive Holt-Winters fitted over a users x months matrix)
+    app.config['FORECAST_HORIZON'] = 3
+    app.config['FORECAST_SEASON_LENGTH'] = 12
+    # Smoothing parameters tried for every user; the one with the lowest one-step error wins
+    app.config['FORECAST_ALPHAS'] = [0.2, 0.5, 0.8]
+    app.config['FORECAST_BETAS'] = [0.05, 0.2]
+    app.config['FORECAST_GAMMAS'] = [0.05, 0.3]
+    app.config['FORECAST_BATCH_USERS'] = 5000
+
+    # Largest page the history table endpoint returns
+    app.config['HISTORY_PAGE_MAX'] = 500
+
+    # Expense categories offered on the dashboard; expenses not assigned to one are
+    # counted under the last (catch-all) category
+    app.config['EXPENSE_CATEGORIES'] = ['Rent', 'Groceries', 'Utilities', 'Transport', 'Entertainment', 'Others']
+
+    # Bank statement import (CSV or OFX): transactions are read IMPORT_CHUNK_ROWS at a time
+    app.config['IMPORT_CHUNK_ROWS'] = 50000
+    app.config['IMPORT_MAX_BYTES'] = 200 * 1024 * 1024
+    # Read ambiguous CSV dates such as 03/04/2024 as day first
+    app.config['IMPORT_DAYFIRST'] = os.environ.get('IMPORT_DAYFIRST') == '1'
+    # Read CSV amounts such as 1.234,56 with a decimal comma (and dots or spaces between thousands)
+    app.config['IMPORT_DECIMAL_COMMA'] = os.environ.get('IMPORT_DECIMAL_COMMA') == '1'
+    # Categorization rules, tried in this order; a debit matching none of them counts under
+    # the catch-all category. Keywords match whole words, case-insensitively; patterns are
+    # regular expressions searched in the description.
+    app.config['CATEGORY_KEYWORDS'] = {
+        'Rent': ['rent', 'landlord', 'letting', 'mortgage', 'property management'],
+        'Groceries': ['grocery', 'groceries', 'supermarket', 'tesco', 'sainsbury', 'asda', 'aldi', 'lidl', 'walmart',
+                      'kroger', 'safeway', 'costco', 'whole foods', 'trader joe'],
+        'Utilities': ['electric', 'electricity', 'water', 'gas', 'energy', 'internet', 'broadband', 'mobile', 'phone',
+                      'utility', 'utilities', 'council tax', 'comcast', 'verizon', 'vodafone'],
+        'Transport': ['uber', 'lyft', 'taxi', 'fuel', 'petrol', 'gasoline', 'shell', 'chevron', 'transit', 'metro',
+                      'railway', 'train', 'bus', 'parking', 'toll', 'tfl'],
+        'Entertainment': ['netflix', 'spotify', 'hulu', 'disney', 'cinema', 'theatre', 'theater', 'steam',
+                          'playstation', 'xbox', 'restaurant', 'bar', 'pub', 'concert', 'ticketmaster']
+    }
+    app.config['CATEGORY_PATTERNS'] = {}
+
+    # Server-Sent Events: seconds between keep-alive comments on idle streams
+    app.config['SSE_HEARTBEAT_SECONDS'] = 15
+
+    # Columnar analytics replica (Parquet files queried with DuckDB)
+    app.config['REPLICA_PATH'] = os.environ.get('REPLICA_PATH', 'analytics_replica')
+    app.config['REPLICA_BATCH_SIZE'] = 50000
+    # Where get_training_data() reads from: 'simulated' or 'replica'
+    app.config['MODEL_TRAINING_SOURCE'] = os.environ.get('MODEL_TRAINING_SOURCE', 'simulated')
+    app.config['MODEL_TRAINING_MIN_ROWS'] = 500
+
+    # Warmup before serving: 'blocking' (create_app returns a warm app), 'background'
+    # (warm in a thread while /ready answers 503) or 'off'
+    app.config['WARMUP'] = os.environ.get('WARMUP', 'blocking')
+    app.config['WARMUP_PREDICTIONS'] = 20
+
+    # Admission control for CPU-heavy routes, per process: each listed route runs at most
+    # `concurrency` requests and queues at most `queue` more; together they never take the
+    # last ADMISSION_RESERVED of ADMISSION_CAPACITY slots, which stay free for other routes
+    app.config['ADMISSION_LIMITS'] = {
+        '/get_financial_health': {'concurrency': 4, 'queue': 32},
+        '/anomaly_detection': {'concurrency': 4, 'queue': 16},
+        '/financial_forecasting': {'concurrency': 2, 'queue': 8},
+        '/goal_based_planning': {'concurrency': 2, 'queue': 8},
+        '/import_statement': {'concurrency': 2, 'queue': 4}
+    }
+    app.config['ADMISSION_CAPACITY'] = 16
+    app.config['ADMISSION_RESERVED'] = 4
+    app.config['ADMISSION_QUEUE_TIMEOUT'] = 5.0
+    app.config['ADMISSION_RETRY_AFTER'] = 2
+
+    # Single-flight: concurrent identical per-user computations share one result. Set a
+    # lock directory to share them across worker processes too (Unix only).
+    app.config['SINGLE_FLIGHT'] = True
+    app.config['SINGLE_FLIGHT_LOCK_DIR'] = os.environ.get('SINGLE_FLIGHT_LOCK_DIR')
+    app.config['SINGLE_FLIGHT_TIMEOUT'] = 30
+    app.config['SINGLE_FLIGHT_RESULT_TTL'] = 60
+
+    # Opt-in memory profiling with tracemalloc: peak and retained memory and the top
+    # allocation sites per route and model call. Off, nothing is traced or hooked.
+    app.config['MEMORY_PROFILING'] = os.environ.get('MEMORY_PROFILING') == '1'
+    app.config['MEMORY_PROFILE_SAMPLE_RATE'] = float(os.environ.get('MEMORY_PROFILE_SAMPLE_RATE', 0.1))
+    app.config['MEMORY_PROFILE_FRAMES'] = 10
+    app.config['MEMORY_PROFILE_TOP'] = 10
+    # Snapshots taken through /admin/memory/snapshot are also dumped here when set
+    app.config['MEMORY_PROFILE_DIR'] = os.environ.get('MEMORY_PROFILE_DIR')
+    # Bearer token for the /admin endpoints; without one they only answer local requests
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+
+    # Write-behind for add_financial_data: entries are acknowledged once fsynced to this
+    # process's journal and written to the database in group commits of up to
+    # WRITE_BEHIND_BATCH_SIZE rows every WRITE_BEHIND_INTERVAL seconds (Unix only)
+    app.config['WRITE_BEHIND'] = os.environ.get('WRITE_BEHIND') == '1'
+    app.config['WRITE_BEHIND_DIR'] = os.environ.get('WRITE_BEHIND_DIR', 'journal')
+    app.config['WRITE_BEHIND_BATCH_SIZE'] = 100
+    app.config['WRITE_BEHIND_INTERVAL'] = 0.05
+    # How long a user's next request waits for their own queued entries to be written
+    app.config['WRITE_BEHIND_READ_TIMEOUT'] = 2.0
+    # The journal is truncated once everything in it is written and it is at least this big
+    app.config['WRITE_BEHIND_JOURNAL_MAX_BYTES'] = 1 << 20
+
+    # Self-hosted front-end assets: `bundle-assets` stores them in ASSET_DIR under
+    # content-hashed names (plus .gz/.br copies); until then pages use these CDN URLs
+    app.config['ASSET_DIR'] = os.environ.get('ASSET_DIR', 'assets')
+    app.config['VENDOR_ASSETS'] = {
+        'tailwind.min.css': 'https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css',
+        'chart.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+        'jquery.min.js': 'https://code.jquery.com/jquery-3.6.0.min.js'
+    }
+    # Hashed names change with the content, so browsers may keep them for a year
+    app.config['ASSET_MAX_AGE'] = 365 * 24 * 3600
+
+    # Response compression: HTML and JSON bodies of at least COMPRESS_MIN_SIZE bytes are
+    # sent with brotli (when installed) or gzip, whichever the client accepts
+    app.config['COMPRESS'] = True
+    app.config['COMPRESS_MIN_SIZE'] = 1024
+    app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json']
+    app.config['COMPRESS_GZIP_LEVEL'] = 6
+    app.config['COMPRESS_BROTLI_QUALITY'] = 5
+
+    if config:
+        app.config.update(config)
+
+    if app.config['JSON_SERIALIZER'] == 'orjson':
+        app.json = OrjsonProvider(app)
+    # Models trained on history features take more inputs, so they are stored separately
+    model_suffix = '.history' if app.config['MODEL_FEATURES'] == 'history' else ''
+    app.config.setdefault('MODEL_PATH', f'financial_health_model{model_suffix}.joblib')
+    app.config.setdefault('COMPACT_MODEL_PATH', f'financial_health_model{model_suffix}.compact.joblib')
+    app.config.setdefault('SQLALCHEMY_BINDS', {
+        f'shard_{shard}': app.config['SHARD_URI_TEMPLATE'].format(shard)
+        for shard in range(app.config['FINANCIAL_DATA_SHARDS'])
+    })
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    app.teardown_appcontext(remove_shard_sessions)
+    app.extensions['page_templates'] = {}
+    app.extensions['asset_manifest'] = None
+    app.extensions['warmup'] = {'status': 'pending', 'seconds': None, 'error': None}
+    app.extensions['admission'] = AdmissionController(
+        app.config['ADMISSION_LIMITS'], app.config['ADMISSION_CAPACITY'], app.config['ADMISSION_RESERVED']
+    )
+    app.extensions['single_flight'] = SingleFlight(
+        app.config['SINGLE_FLIGHT_LOCK_DIR'], app.config['SINGLE_FLIGHT_TIMEOUT'], app.config['SINGLE_FLIGHT_RESULT_TTL']
+    )
+    if app.config['MEMORY_PROFILING']:
+        app.extensions['memory_profiler'] = MemoryProfiler(
+            app.config['MEMORY_PROFILE_FRAMES'], app.config['MEMORY_PROFILE_TOP'], app.config['MEMORY_PROFILE_SAMPLE_RATE']
+        )
+        app.before_request(start_memory_profile)
+        app.teardown_request(finish_memory_profile)
+    app.extensions['categorizer'] = TransactionCategorizer(
+        app.config['CATEGORY_KEYWORDS'], app.config['CATEGORY_PATTERNS'], app.config['EXPENSE_CATEGORIES'][-1]
+    )
+    app.extensions['write_behind'] = None
+    if app.config['WRITE_BEHIND'] and fcntl:
+        app.extensions['write_behind'] = WriteBehindJournal(
+            app.config['WRITE_BEHIND_DIR'], app.config['WRITE_BEHIND_BATCH_SIZE'], app.config['WRITE_BEHIND_INTERVAL'],
+            app.config['WRITE_BEHIND_JOURNAL_MAX_BYTES']
+        )
+
+    if app.config['MODEL_PRELOAD'] or os.environ.get('MODEL_SHM_NAME'):
+        with app.app_context():
+            preload_model()
+    # Other CLI commands don't serve requests; serve-prefork warms the master itself and
+    # starts the journal in each worker
+    if serving_process():
+        start_warmup(app)
+        start_journal(app)
+    return app
+
+def serving_process():
+    if not os.environ.get('FLASK_RUN_FROM_CLI'):
+        return True
+    context = click.get_current_context(silent=True)
+    return context is not None and context.info_name == 'run'
+
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+bp = Blueprint('main', __name__, cli_group=None)
 
 # User model
 class User(UserMixin, db.Model):
@@ -44,38 +375,372 @@ class FinancialData(db.Model):
     debts = db.Column(db.Float, nullable=False)
     investments = db.Column(db.Float, nullable=False)
     savings_rate = db.Column(db.Float, nullable=False)
+    # Robust z-score assigned when the row is written (NULL until enough history exists)
+    anomaly_score = db.Column(db.Float)
+    is_anomaly = db.Column(db.Boolean)
+    expense_items = db.relationship('ExpenseItem', lazy=True)
+
+    __table_args__ = (
+        db.Index('ix_financial_data_user_date', 'user_id', 'date'),
+        db.Index('ix_financial_data_user_anomaly', 'user_id', 'is_anomaly'),
+    )
+
+# Monthly aggregates of FinancialData rows older than the retention horizon
+class FinancialDataArchive(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    entries = db.Column(db.Integer, nullable=False)
+    income = db.Column(db.Float, nullable=False)
+    expenses = db.Column(db.Float, nullable=False)
+    debts = db.Column(db.Float, nullable=False)
+    investments = db.Column(db.Float, nullable=False)
+    savings_rate = db.Column(db.Float, nullable=False)
+
+# Shard directory: which FinancialData shard holds each user's rows
+class ShardAssignment(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    shard = db.Column(db.Integer, nullable=False)
+
+# Nightly anomaly sweep: one row per run, a checkpoint per partition, and the results
+class AnomalySweep(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    partitions = db.Column(db.Integer, nullable=False)
+
+class AnomalySweepCheckpoint(db.Model):
+    sweep_id = db.Column(db.Integer, db.ForeignKey('anomaly_sweep.id'), primary_key=True)
+    partition = db.Column(db.Integer, primary_key=True)
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    done = db.Column(db.Boolean, nullable=False, default=False)
+
+# Precomputed forecasts, one row per user, metric and month ahead
+class Forecast(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    metric = db.Column(db.String(20), primary_key=True)
+    step = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    value = db.Column(db.Float)
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Anomaly(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    sweep_id = db.Column(db.Integer, db.ForeignKey('anomaly_sweep.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    financial_data_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+# Feature store: running monthly sums per user and the rolling features derived from the
+# most recent months, both updated in the same transaction as every new row
+class UserMonthlyStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    entries = db.Column(db.Integer, nullable=False)
+    income_sum = db.Column(db.Float, nullable=False)
+    expenses_sum = db.Column(db.Float, nullable=False)
+    savings_rate_sum = db.Column(db.Float, nullable=False)
+    # Balances rather than flows: the latest value in the month
+    debts = db.Column(db.Float, nullable=False)
+    investments = db.Column(db.Float, nullable=False)
+
+    def means(self):
+        return (self.income_sum / self.entries, self.expenses_sum / self.entries,
+                self.savings_rate_sum / self.entries, self.debts, self.investments)
+
+class UserFeatures(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    months = db.Column(db.Integer, nullable=False)
+    income_mean_3m = db.Column(db.Float, nullable=False)
+    income_mean_6m = db.Column(db.Float, nullable=False)
+    income_mean_12m = db.Column(db.Float, nullable=False)
+    expenses_mean_3m = db.Column(db.Float, nullable=False)
+    expenses_mean_6m = db.Column(db.Float, nullable=False)
+    expenses_mean_12m = db.Column(db.Float, nullable=False)
+    savings_rate_mean_3m = db.Column(db.Float, nullable=False)
+    savings_rate_mean_6m = db.Column(db.Float, nullable=False)
+    savings_rate_mean_12m = db.Column(db.Float, nullable=False)
+    savings_rate_volatility = db.Column(db.Float, nullable=False)
+    expense_trend = db.Column(db.Float, nullable=False)
+    debt_change = db.Column(db.Float, nullable=False)
+    # The last ANOMALY_WINDOW [income, expenses, savings_rate] entries as JSON, oldest first
+    recent = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# Write-behind journal checkpoints: every entry of the journal up to `sequence` that
+# belongs to this database has been written; stored with the rows it covers
+class JournalCheckpoint(db.Model):
+    journal = db.Column(db.String(100), primary_key=True)
+    sequence = db.Column(db.Integer, nullable=False)
+
+# A FinancialData entry's expenses split by category (the amounts add up to the entry's expenses)
+class ExpenseItem(db.Model):
+    financial_data_id = db.Column(db.Integer, db.ForeignKey('financial_data.id'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    amount = db.Column(db.Float, nullable=False)
+
+# Per-user monthly expense totals by category, kept up to date as entries are written;
+# they outlive the entries' items when the month is compacted into the archive
+class UserMonthlyCategoryTotal(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    amount = db.Column(db.Float, nullable=False)
+    entries = db.Column(db.Integer, nullable=False)
+
+# Add columns and indexes introduced after a database file was first created
+def upgrade_schema(engine, table):
+    existing = {column['name'] for column in db.inspect(engine).get_columns(table.name)}
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column_ddl}'))
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
 
 # Create database tables
-with app.app_context():
-    db.create_all()
+def init_db():
+    # The models live in the main database; shard tables are created explicitly below
+    db.create_all(bind_key=None)
+    upgrade_schema(db.engine, FinancialData.__table__)
+    for bind_key in current_app.config['SQLALCHEMY_BINDS']:
+        FinancialData.__table__.create(db.engines[bind_key], checkfirst=True)
+        FinancialDataArchive.__table__.create(db.engines[bind_key], checkfirst=True)
+        UserMonthlyStats.__table__.create(db.engines[bind_key], checkfirst=True)
+        UserFeatures.__table__.create(db.engines[bind_key], checkfirst=True)
+        JournalCheckpoint.__table__.create(db.engines[bind_key], checkfirst=True)
+        ExpenseItem.__table__.create(db.engines[bind_key], checkfirst=True)
+        UserMonthlyCategoryTotal.__table__.create(db.engines[bind_key], checkfirst=True)
+        upgrade_schema(db.engines[bind_key], FinancialData.__table__)
+
+@bp.cli.command('init-db')
+def init_db_command():
+    init_db()
+    click.echo('Database tables are up to date')
+
+# Start the session's transaction now instead of at its first write (SQLite otherwise
+# begins one lazily): the reads that follow see one snapshot, and with immediate=True the
+# database's write lock is held from here, so a read-modify-write can't interleave
+def begin_transaction(session, immediate=False):
+    connection = session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+
+# Shard routing
+shard_sessions = {}
+
+def hash_shard(user_id, shard_count):
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shard_count
+
+# Sessions are keyed by engine so that every app created in this process gets its own
+def get_shard_session(shard):
+    engine = db.engines[f'shard_{shard}']
+    if engine not in shard_sessions:
+        shard_sessions[engine] = scoped_session(sessionmaker(bind=engine))
+    return shard_sessions[engine]
+
+# New users are placed by hash; the directory lets the reshard command move them later
+def shard_for_user(user_id):
+    assignment = db.session.get(ShardAssignment, user_id)
+    if assignment is not None:
+        return assignment.shard
+    # Recorded in a session of its own, so the caller's pending work isn't committed with it
+    with sessionmaker(bind=db.engine)() as session:
+        session.add(ShardAssignment(user_id=user_id, shard=hash_shard(user_id, current_app.config['FINANCIAL_DATA_SHARDS'])))
+        try:
+            session.commit()
+        except IntegrityError:
+            # Another request placed the user first
+            session.rollback()
+        return session.get(ShardAssignment, user_id).shard
+
+def financial_data_session(user_id):
+    if not current_app.config['FINANCIAL_DATA_SHARDS']:
+        return db.session
+    return get_shard_session(shard_for_user(user_id))
+
+def user_financial_data(user_id):
+    return financial_data_session(user_id).query(FinancialData).filter_by(user_id=user_id)
+
+# Run func(session) against every shard in parallel and return the results in shard order
+def fan_out(func):
+    shard_count = current_app.config['FINANCIAL_DATA_SHARDS']
+    if not shard_count:
+        return [func(db.session)]
+
+    app = current_app._get_current_object()
+
+    def run(shard):
+        with app.app_context():
+            session = get_shard_session(shard)
+            try:
+                return func(session)
+            finally:
+                session.remove()
+
+    with ThreadPoolExecutor(max_workers=shard_count) as pool:
+        return list(pool.map(run, range(shard_count)))
+
+def remove_shard_sessions(exception=None):
+    for session in shard_sessions.values():
+        session.remove()
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Analytics replica
+# FinancialData rows are exported incrementally (by id watermark per source database) into
+# Parquet files partitioned by month. Heavy cross-user scans run on the replica with
+# DuckDB instead of competing with request traffic on the SQLite row stores.
+REPLICA_COLUMNS = ['id', 'user_id', 'date', 'income', 'expenses', 'debts', 'investments', 'savings_rate']
+
+def replica_sources():
+    sources = [('main', db.session)]
+    for shard in range(current_app.config['FINANCIAL_DATA_SHARDS']):
+        sources.append((f'shard_{shard}', get_shard_session(shard)))
+    return sources
+
+def replica_state_path():
+    return os.path.join(current_app.config['REPLICA_PATH'], '_state.json')
+
+def load_replica_state():
+    if not os.path.exists(replica_state_path()):
+        return {'watermarks': {}, 'exported_at': None}
+    with open(replica_state_path()) as state_file:
+        return json.load(state_file)
+
+def save_replica_state(state):
+    temporary_path = replica_state_path() + '.tmp'
+    with open(temporary_path, 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(temporary_path, replica_state_path())
+
+def write_replica_batch(source, rows):
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    columns = list(zip(*rows))
+    table = pa.table({name: list(values) for name, values in zip(REPLICA_COLUMNS, columns)})
+    table = table.append_column('source', pa.array([source] * len(rows)))
+    table = table.append_column('month', pc.strftime(table['date'], format='%Y-%m'))
+    pq.write_to_dataset(table, current_app.config['REPLICA_PATH'], partition_cols=['month'],
+                        basename_template=f'{source}-{rows[-1][0]}-{{i}}.parquet')
+
+def export_replica(full=False):
+    if pa is None:
+        raise RuntimeError('The analytics replica needs pyarrow installed.')
+    if full:
+        shutil.rmtree(current_app.config['REPLICA_PATH'], ignore_errors=True)
+    os.makedirs(current_app.config['REPLICA_PATH'], exist_ok=True)
+
+    state = load_replica_state()
+    batch_size = current_app.config['REPLICA_BATCH_SIZE']
+    exported = 0
+    for source, session in replica_sources():
+        watermark = state['watermarks'].get(source, 0)
+        query = (session.query(*[getattr(FinancialData, name) for name in REPLICA_COLUMNS])
+                 .filter(FinancialData.id > watermark)
+                 .order_by(FinancialData.id)
+                 .yield_per(batch_size))
+        batch = []
+        for row in query:
+            batch.append(tuple(row))
+            if len(batch) == batch_size:
+                write_replica_batch(source, batch)
+                state['watermarks'][source] = batch[-1][0]
+                save_replica_state(state)
+                exported += len(batch)
+                batch = []
+        if batch:
+            write_replica_batch(source, batch)
+            state['watermarks'][source] = batch[-1][0]
+            exported += len(batch)
+
+    state['exported_at'] = datetime.utcnow().isoformat()
+    save_replica_state(state)
+    return exported
+
+# Freshness of the replica: time since the last export and rows not yet exported
+def replica_lag():
+    state = load_replica_state()
+    pending = sum(
+        session.query(FinancialData).filter(FinancialData.id > state['watermarks'].get(source, 0)).count()
+        for source, session in replica_sources()
+    )
+    exported_at = state['exported_at']
+    seconds = (datetime.utcnow() - datetime.fromisoformat(exported_at)).total_seconds() if exported_at else None
+    return {'seconds_since_export': seconds, 'pending_rows': pending}
+
+# Run SQL against the replica; the rows are exposed as the financial_data view
+def query_replica(sql, params=None):
+    if duckdb is None:
+        raise RuntimeError('Querying the analytics replica needs duckdb installed.')
+    connection = duckdb.connect()
+    pattern = os.path.join(current_app.config['REPLICA_PATH'], '**', '*.parquet').replace("'", "''")
+    connection.execute(f"CREATE VIEW financial_data AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+    return connection.execute(sql, params or []).df()
+
+# Monthly cohort statistics across all users
+def cohort_stats():
+    return query_replica('''
+        SELECT month,
+               count(DISTINCT user_id) AS users,
+               avg(income) AS avg_income,
+               avg(expenses) AS avg_expenses,
+               avg(savings_rate) AS avg_savings_rate,
+               median(savings_rate) AS median_savings_rate
+        FROM financial_data
+        GROUP BY month
+        ORDER BY month
+    ''')
+
+# Simulated training data for the savings-rate model
+def get_training_data():
+    from sklearn.model_selection import train_test_split
+
+    if current_app.config['MODEL_FEATURES'] == 'history':
+        X, y = feature_training_data()
+        return train_test_split(X, y, test_size=0.2, random_state=42)
+
+    if current_app.config['MODEL_TRAINING_SOURCE'] == 'replica':
+        df = query_replica('SELECT income, expenses, debts, investments, savings_rate FROM financial_data')
+        if len(df) >= current_app.config['MODEL_TRAINING_MIN_ROWS']:
+            X = df[['income', 'expenses', 'debts', 'investments']]
+            y = df['savings_rate'].clip(0, 100)
+            return train_test_split(X, y, test_size=0.2, random_state=42)
+
+    np.random.seed(42)
+    n_samples = 1000
+    data = {
+        'income': np.random.normal(5000, 1500, n_samples),
+        'expenses': np.random.normal(3000, 1000, n_samples),
+        'debts': np.random.normal(10000, 5000, n_samples),
+        'investments': np.random.normal(20000, 10000, n_samples),
+        'savings_rate': np.random.normal(20, 10, n_samples)
+    }
+    df = pd.DataFrame(data)
+    df['savings_rate'] = (df['income'] - df['expenses']) / df['income'] * 100
+    df['savings_rate'] = df['savings_rate'].clip(0, 100)
+
+    X = df[['income', 'expenses', 'debts', 'investments']]
+    y = df['savings_rate']
+
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
 # Load or train the ML model
 def get_ml_model():
-    model_path = 'financial_health_model.joblib'
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    model_path = current_app.config['MODEL_PATH']
     if os.path.exists(model_path):
         return joblib.load(model_path)
     else:
-        np.random.seed(42)
-        n_samples = 1000
-        data = {
-            'income': np.random.normal(5000, 1500, n_samples),
-            'expenses': np.random.normal(3000, 1000, n_samples),
-            'debts': np.random.normal(10000, 5000, n_samples),
-            'investments': np.random.normal(20000, 10000, n_samples),
-            'savings_rate': np.random.normal(20, 10, n_samples)
-        }
-        df = pd.DataFrame(data)
-        df['savings_rate'] = (df['income'] - df['expenses']) / df['income'] * 100
-        df['savings_rate'] = df['savings_rate'].clip(0, 100)
-
-        X = df[['income', 'expenses', 'debts', 'investments']]
-        y = df['savings_rate']
-
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        X_train, X_test, y_train, y_test = get_training_data()
 
         scaler = StandardScaler()
         X_train_scaled = scaler.fit_transform(X_train)
@@ -87,7 +752,220 @@ def get_ml_model():
         joblib.dump((model, scaler), model_path)
         return model, scaler
 
-ml_model, scaler = get_ml_model()
+# The served model, loaded on first use by load_model()
+ml_model = None
+scaler = None
+model_lock = threading.Lock()
+
+# Flat model storage for pre-forked workers
+# The forest is copied into a few contiguous NumPy arrays. Workers forked after
+# preload_model() share those buffers copy-on-write: unlike the per-tree Python objects
+# of the sklearn model, array data is never written by refcounting or the garbage
+# collector, so the pages stay shared for the lifetime of the worker.
+flat_model = None
+model_shm = None
+MODEL_SHM_HEADER_SIZE = 4096
+
+def flatten_model(model, scaler, dtype='float64'):
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    left = np.concatenate([np.where(t.children_left >= 0, t.children_left + o, -1) for t, o in zip(trees, offsets)])
+    right = np.concatenate([np.where(t.children_right >= 0, t.children_right + o, -1) for t, o in zip(trees, offsets)])
+    return {
+        'roots': offsets[:-1].astype(np.int32),
+        'left': left.astype(np.int32),
+        'right': right.astype(np.int32),
+        'feature': np.concatenate([np.maximum(t.feature, 0) for t in trees]).astype(np.int32),
+        'threshold': np.concatenate([t.threshold for t in trees]).astype(dtype),
+        'value': np.concatenate([t.value[:, 0, 0] for t in trees]).astype(dtype),
+        'scaler_mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_, dtype=np.float64)
+    }
+
+def predict_flat(flat, X):
+    # sklearn compares float32 features against float64 thresholds; do the same
+    X = ((np.asarray(X, dtype=np.float64) - flat['scaler_mean']) / flat['scaler_scale']).astype(np.float32)
+    rows = np.arange(X.shape[0])[:, None]
+    nodes = np.broadcast_to(flat['roots'], (X.shape[0], flat['roots'].size)).copy()
+    while True:
+        left = flat['left'][nodes]
+        internal = left >= 0
+        if not internal.any():
+            break
+        go_left = X[rows, flat['feature'][nodes]] <= flat['threshold'][nodes]
+        nodes = np.where(internal, np.where(go_left, left, flat['right'][nodes]), nodes)
+    return flat['value'][nodes].mean(axis=1)
+
+# Copy the flat arrays into one shared memory segment with a JSON layout header
+def share_flat_model(flat):
+    layout = []
+    offset = MODEL_SHM_HEADER_SIZE
+    for name, array in flat.items():
+        offset = (offset + 63) // 64 * 64
+        layout.append({'name': name, 'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset})
+        offset += array.nbytes
+
+    shm = shared_memory.SharedMemory(create=True, size=offset)
+    header = json.dumps(layout).encode()
+    shm.buf[:len(header)] = header
+    for entry in layout:
+        array = flat[entry['name']]
+        target = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=entry['offset'])
+        target[...] = array
+    return shm
+
+def shared_flat_model_arrays(shm):
+    layout = json.loads(bytes(shm.buf[:MODEL_SHM_HEADER_SIZE]).rstrip(b'\x00'))
+    return {
+        entry['name']: np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']),
+                                  buffer=shm.buf, offset=entry['offset'])
+        for entry in layout
+    }
+
+def attach_flat_model(name):
+    shm = shared_memory.SharedMemory(name=name)
+    # The creating process owns the segment; don't let this process unlink it on exit
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm, shared_flat_model_arrays(shm)
+
+# Compact model variant: fewer, shallower trees stored as float32
+def build_compact_model(scaler, X_train, y_train, n_estimators=None, max_depth=None, max_leaf_nodes=None):
+    from sklearn.ensemble import RandomForestRegressor
+
+    model = RandomForestRegressor(
+        n_estimators=n_estimators or current_app.config['COMPACT_N_ESTIMATORS'],
+        max_depth=max_depth or current_app.config['COMPACT_MAX_DEPTH'],
+        max_leaf_nodes=max_leaf_nodes or current_app.config['COMPACT_MAX_LEAF_NODES'],
+        random_state=42
+    )
+    model.fit(scaler.transform(X_train), y_train)
+    return flatten_model(model, scaler, dtype=np.float32)
+
+def get_compact_model():
+    compact_path = current_app.config['COMPACT_MODEL_PATH']
+    if os.path.exists(compact_path):
+        # Memory-mapped arrays are shared through the page cache by every process
+        return joblib.load(compact_path, mmap_mode='r')
+    _, full_scaler = get_ml_model()
+    X_train, _, y_train, _ = get_training_data()
+    compact = build_compact_model(full_scaler, X_train, y_train)
+    joblib.dump(compact, compact_path)
+    return compact
+
+# Size, load time, latency and accuracy of the full and compact models
+def model_variant_report(compact_path=None, repeats=200):
+    _, X_test, _, y_test = get_training_data()
+    X_test = X_test.to_numpy()
+    model_path = current_app.config['MODEL_PATH']
+    compact_path = compact_path or current_app.config['COMPACT_MODEL_PATH']
+
+    started = time.perf_counter()
+    full_model, full_scaler = joblib.load(model_path)
+    full_load = time.perf_counter() - started
+    started = time.perf_counter()
+    compact = joblib.load(compact_path)
+    compact_load = time.perf_counter() - started
+
+    def latency(predict):
+        started = time.perf_counter()
+        for row in X_test[:repeats]:
+            predict(row[None, :])
+        return (time.perf_counter() - started) / min(repeats, len(X_test))
+
+    full_predict = lambda X: full_model.predict(full_scaler.transform(X))
+    with warnings.catch_warnings():
+        # Same call as predict_savings_rate: plain arrays into a scaler fitted on a DataFrame
+        warnings.simplefilter('ignore', UserWarning)
+        full_predictions = full_predict(X_test)
+        full_latency = latency(full_predict)
+    compact_predictions = predict_flat(compact, X_test)
+    node_count = sum(estimator.tree_.node_count for estimator in full_model.estimators_)
+
+    return {
+        'full': {
+            'trees': len(full_model.estimators_),
+            'nodes': int(node_count),
+            'disk_bytes': os.path.getsize(model_path),
+            'load_seconds': full_load,
+            'latency_seconds': full_latency,
+            'mae_vs_actual': float(np.mean(np.abs(full_predictions - y_test.to_numpy()))),
+            'mae_vs_full': 0.0
+        },
+        'compact': {
+            'trees': int(compact['roots'].size),
+            'nodes': int(compact['left'].size),
+            'disk_bytes': os.path.getsize(compact_path),
+            'load_seconds': compact_load,
+            'latency_seconds': latency(lambda X: predict_flat(compact, X)),
+            'mae_vs_actual': float(np.mean(np.abs(compact_predictions - y_test.to_numpy()))),
+            'mae_vs_full': float(np.mean(np.abs(compact_predictions - full_predictions)))
+        }
+    }
+
+# Load the configured model variant unless it is already loaded
+def load_model():
+    global ml_model, scaler, flat_model
+    with model_lock:
+        if flat_model is not None or ml_model is not None:
+            return
+        with memory_section('model.load'):
+            if current_app.config['MODEL_VARIANT'] == 'compact':
+                flat_model = get_compact_model()
+            else:
+                ml_model, scaler = get_ml_model()
+
+# Load the model in the master process before workers are forked
+def preload_model():
+    global ml_model, scaler, flat_model, model_shm
+    if os.environ.get('MODEL_SHM_NAME'):
+        model_shm, flat_model = attach_flat_model(os.environ['MODEL_SHM_NAME'])
+    else:
+        load_model()
+        if flat_model is None:
+            flat_model = flatten_model(ml_model, scaler)
+        if current_app.config['MODEL_SHARED_MEMORY']:
+            model_shm = share_flat_model(flat_model)
+            flat_model = shared_flat_model_arrays(model_shm)
+    ml_model, scaler = None, None
+    gc.collect()
+    # Move everything allocated so far out of the collector's reach so that
+    # collections in the workers don't touch (and copy) the master's pages
+    gc.freeze()
+
+# Per-process memory usage from /proc/<pid>/smaps_rollup (Linux only)
+def process_memory(pid):
+    usage = {}
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                usage[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': usage.get('Rss', 0.0),
+        'pss_mb': usage.get('Pss', 0.0),
+        'shared_mb': usage.get('Shared_Clean', 0.0) + usage.get('Shared_Dirty', 0.0),
+        'private_mb': usage.get('Private_Clean', 0.0) + usage.get('Private_Dirty', 0.0)
+    }
+
+def memory_report(pids):
+    lines = [f"{'pid':>8} {'rss_mb':>10} {'pss_mb':>10} {'shared_mb':>10} {'private_mb':>10}"]
+    totals = {'rss_mb': 0.0, 'pss_mb': 0.0, 'shared_mb': 0.0, 'private_mb': 0.0}
+    for label, pid in pids:
+        try:
+            usage = process_memory(pid)
+        except OSError:
+            continue
+        for key in totals:
+            totals[key] += usage[key]
+        lines.append(f"{label:>8} {usage['rss_mb']:>10.1f} {usage['pss_mb']:>10.1f} "
+                     f"{usage['shared_mb']:>10.1f} {usage['private_mb']:>10.1f}")
+    lines.append(f"{'total':>8} {totals['rss_mb']:>10.1f} {totals['pss_mb']:>10.1f} "
+                 f"{totals['shared_mb']:>10.1f} {totals['private_mb']:>10.1f}")
+    return '\n'.join(lines)
+
+# The serve-prefork report: the master followed by each worker
+def prefork_memory_report(worker_pids):
+    return memory_report([('master', os.getpid())] + [(str(pid), pid) for pid in worker_pids])
 
 # Function to calculate financial health metrics
 def calculate_financial_health(income, expenses, debts, investments):
@@ -97,108 +975,1627 @@ def calculate_financial_health(income, expenses, debts, investments):
     return savings_rate, debt_to_income_ratio, investment_to_income_ratio
 
 # Function to predict savings rate using the trained model
-def predict_savings_rate(income, expenses, debts, investments):
-    input_data = np.array([[income, expenses, debts, investments]])
-    input_data_scaled = scaler.transform(input_data)
-    prediction = ml_model.predict(input_data_scaled)
-    return prediction[0]
+# With MODEL_FEATURES = 'history', pass user_id to add the user's precomputed features
+def predict_savings_rate(income, expenses, debts, investments, user_id=None):
+    load_model()
+    with memory_section('model.predict'):
+        input_data = np.array([model_inputs(income, expenses, debts, investments, user_id)])
+        if flat_model is not None:
+            return float(predict_flat(flat_model, input_data)[0])
+        input_data_scaled = scaler.transform(input_data)
+        prediction = ml_model.predict(input_data_scaled)
+        return prediction[0]
+
+# Function to read a number from a submitted form; missing (when required), non-numeric,
+# NaN and infinite values raise ValueError
+def form_number(form, name, required=True):
+    value = form.get(name, '').strip()
+    if not value:
+        if required:
+            raise ValueError(f'{name} is required')
+        return None
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number') from None
+    if not math.isfinite(number):
+        raise ValueError(f'{name} must be a finite number')
+    return number
+
+# Function to parse ?start=YYYY-MM-DD&end=YYYY-MM-DD or ?last=12m (d, w, m or y) into
+# a half-open [start, end) datetime range; either bound may be None
+def parse_date_range(args):
+    start = end = None
+    if args.get('last'):
+        match = re.fullmatch(r'(\d+)([dwmy])', args['last'].strip().lower())
+        if not match:
+            raise ValueError('last must look like 30d, 8w, 12m or 2y')
+        amount, unit = int(match.group(1)), match.group(2)
+        now = datetime.utcnow()
+        try:
+            if unit in 'dw':
+                start = now - timedelta(days=amount * (7 if unit == 'w' else 1))
+            else:
+                month = now.year * 12 + now.month - 1 - amount * (12 if unit == 'y' else 1)
+                start = datetime(month // 12, month % 12 + 1, 1)
+        except (OverflowError, ValueError):
+            raise ValueError('last reaches back before year 1') from None
+    if args.get('start'):
+        start = datetime.strptime(args['start'], '%Y-%m-%d')
+    if args.get('end'):
+        try:
+            end = datetime.strptime(args['end'], '%Y-%m-%d') + timedelta(days=1)
+        except OverflowError:
+            raise ValueError('end must be before 9999-12-31') from None
+    if start is not None and end is not None and start >= end:
+        raise ValueError('start must be on or before end')
+    return start, end
+
+def filter_date_range(query, start=None, end=None):
+    if start is not None:
+        query = query.filter(FinancialData.date >= start)
+    if end is not None:
+        query = query.filter(FinancialData.date < end)
+    return query
+
+def filter_archive_range(query, start=None, end=None, month=FinancialDataArchive.month):
+    if start is not None:
+        query = query.filter(month >= start.strftime('%Y-%m'))
+    if end is not None:
+        query = query.filter(month <= (end - timedelta(microseconds=1)).strftime('%Y-%m'))
+    return query
+
+# Start of the oldest month still kept row by row in the hot table
+def retention_cutoff():
+    now = datetime.utcnow()
+    month = now.year * 12 + now.month - 1 - current_app.config['RETENTION_MONTHS']
+    return datetime(month // 12, month % 12 + 1, 1)
 
 # Function to get historical financial data
-def get_historical_data(user_id):
-    user_data = FinancialData.query.filter_by(user_id=user_id).order_by(FinancialData.date).all()
-    
-    if not user_data:
+# Archived monthly aggregates in the range are returned, dated on the first of their
+# month, ahead of the hot rows.
+def get_historical_data(user_id, start=None, end=None):
+    user_data = filter_date_range(user_financial_data(user_id), start, end).order_by(FinancialData.date).all()
+
+    # The archive primary key (user_id, month) makes this a cheap range scan, and
+    # checking it even for recent ranges keeps results right if RETENTION_MONTHS changes
+    archive_query = financial_data_session(user_id).query(FinancialDataArchive).filter_by(user_id=user_id)
+    archived = filter_archive_range(archive_query, start, end).order_by(FinancialDataArchive.month).all()
+
+    if not user_data and not archived:
         return None
 
     data = {
-        'dates': [data.date.strftime('%Y-%m-%d') for data in user_data],
-        'incomes': [data.income for data in user_data],
-        'expenses': [data.expenses for data in user_data],
-        'debts': [data.debts for data in user_data],
-        'investments': [data.investments for data in user_data],
-        'savings_rates': [data.savings_rate for data in user_data]
+        'dates': [f'{data.month}-01' for data in archived] + [data.date.strftime('%Y-%m-%d') for data in user_data],
+        'incomes': [data.income for data in archived] + [data.income for data in user_data],
+        'expenses': [data.expenses for data in archived] + [data.expenses for data in user_data],
+        'debts': [data.debts for data in archived] + [data.debts for data in user_data],
+        'investments': [data.investments for data in archived] + [data.investments for data in user_data],
+        'savings_rates': [data.savings_rate for data in archived] + [data.savings_rate for data in user_data]
     }
 
     return data
 
+# Where a client's copy of the history ends: the last hot row it has and its number of
+# points (hot rows plus archived months)
+def history_cursor(user_id, start=None, end=None):
+    last_id, rows = filter_date_range(user_financial_data(user_id), start, end).with_entities(
+        db.func.max(FinancialData.id), db.func.count(FinancialData.id)).one()
+    archive_query = financial_data_session(user_id).query(FinancialDataArchive).filter_by(user_id=user_id)
+    return {'id': last_id or 0, 'points': rows + filter_archive_range(archive_query, start, end).count()}
+
+# Function to fetch the points added after a client's cursor, or None when the history
+# changed in some other way (compaction, a sliding range, a back-dated row) and the
+# client needs all of it again
+def history_since(user_id, cursor, start=None, end=None):
+    current = history_cursor(user_id, start, end)
+    query = filter_date_range(user_financial_data(user_id), start, end)
+    new_rows = query.filter(FinancialData.id > cursor['id']).order_by(FinancialData.date).all()
+    if cursor['points'] + len(new_rows) != current['points']:
+        return None, current
+    if new_rows:
+        last_date = query.filter(FinancialData.id <= cursor['id']).with_entities(db.func.max(FinancialData.date)).scalar()
+        if last_date is not None and new_rows[0].date < last_date:
+            return None, current
+    return {
+        'dates': [data.date.strftime('%Y-%m-%d') for data in new_rows],
+        'incomes': [data.income for data in new_rows],
+        'expenses': [data.expenses for data in new_rows],
+        'debts': [data.debts for data in new_rows],
+        'investments': [data.investments for data in new_rows],
+        'savings_rates': [data.savings_rate for data in new_rows]
+    }, current
+
+# The last point of a user's history in the range, shaped like get_historical_data()
+def latest_history_point(user_id, start=None, end=None):
+    latest = filter_date_range(user_financial_data(user_id), start, end).order_by(FinancialData.date.desc()).first()
+    if latest is None:
+        archive_query = financial_data_session(user_id).query(FinancialDataArchive).filter_by(user_id=user_id)
+        latest = filter_archive_range(archive_query, start, end).order_by(FinancialDataArchive.month.desc()).first()
+        if latest is None:
+            return None
+        date = f'{latest.month}-01'
+    else:
+        date = latest.date.strftime('%Y-%m-%d')
+    return {'dates': [date], 'incomes': [latest.income], 'expenses': [latest.expenses], 'debts': [latest.debts],
+            'investments': [latest.investments], 'savings_rates': [latest.savings_rate]}
+
+HISTORY_SORT_COLUMNS = ['date', 'income', 'expenses', 'debts', 'investments', 'savings_rate']
+
+# Function to fetch one sorted page of a user's history (hot rows and archived months)
+# and its total size; sorting, offset and limit all run in the database
+def history_page(user_id, start=None, end=None, sort='date', descending=True, offset=0, limit=50):
+    session = financial_data_session(user_id)
+    values = ['income', 'expenses', 'debts', 'investments', 'savings_rate']
+    hot = filter_date_range(session.query(
+        db.cast(FinancialData.date, db.String).label('date'), FinancialData.id.label('id'),
+        *[getattr(FinancialData, name).label(name) for name in values]
+    ).filter(FinancialData.user_id == user_id), start, end)
+    archived = filter_archive_range(session.query(
+        (FinancialDataArchive.month + '-01').label('date'), db.literal(0).label('id'),
+        *[getattr(FinancialDataArchive, name).label(name) for name in values]
+    ).filter(FinancialDataArchive.user_id == user_id), start, end)
+    history = hot.union_all(archived).subquery()
+
+    total = session.query(db.func.count()).select_from(history).scalar()
+    direction = db.desc if descending else db.asc
+    # Date and id break ties so that pages neither skip nor repeat rows
+    rows = (session.query(history)
+            .order_by(direction(history.c[sort]), direction(history.c.date), direction(history.c.id))
+            .offset(offset).limit(limit).all())
+    return total, [{'date': row.date[:10], **{name: getattr(row, name) for name in values}} for row in rows]
+
+# Function to compact hot rows older than the retention cutoff into the archive table
+def compact_history(session, cutoff):
+    month = db.func.strftime('%Y-%m', FinancialData.date)
+    aggregates = (session.query(FinancialData.user_id, month, db.func.count(),
+                                db.func.avg(FinancialData.income), db.func.avg(FinancialData.expenses),
+                                db.func.avg(FinancialData.debts), db.func.avg(FinancialData.investments),
+                                db.func.avg(FinancialData.savings_rate))
+                  .filter(FinancialData.date < cutoff)
+                  .group_by(FinancialData.user_id, month)
+                  .all())
+
+    for user_id, month, entries, income, expenses, debts, investments, savings_rate in aggregates:
+        archived = session.get(FinancialDataArchive, (user_id, month))
+        if archived is None:
+            session.add(FinancialDataArchive(user_id=user_id, month=month, entries=entries, income=income,
+                                             expenses=expenses, debts=debts, investments=investments,
+                                             savings_rate=savings_rate))
+            continue
+        # A late, back-dated row for a month that was already compacted: merge the means
+        total = archived.entries + entries
+        for name, value in (('income', income), ('expenses', expenses), ('debts', debts),
+                            ('investments', investments), ('savings_rate', savings_rate)):
+            setattr(archived, name, (getattr(archived, name) * archived.entries + value * entries) / total)
+        archived.entries = total
+
+    # The history of these users changes shape, which is a new version of their data
+    (session.query(UserFeatures)
+     .filter(UserFeatures.user_id.in_(db.select(FinancialData.user_id).where(FinancialData.date < cutoff)))
+     .update({UserFeatures.updated_at: datetime.utcnow()}, synchronize_session=False))
+
+    # The monthly category totals already cover these rows, so their items go with them
+    compacted = db.select(FinancialData.id).where(FinancialData.date < cutoff)
+    session.query(ExpenseItem).filter(ExpenseItem.financial_data_id.in_(compacted)).delete(synchronize_session=False)
+    removed = session.query(FinancialData).filter(FinancialData.date < cutoff).delete(synchronize_session=False)
+    session.commit()
+    return removed, len(aggregates)
+
+# Function to encode historical data as an Arrow IPC stream
+# Columns map one-to-one onto the JSON lists; the current metrics travel as schema metadata.
+def historical_data_to_arrow(historical_data, metrics):
+    table = pa.table({
+        'dates': pa.array(historical_data['dates']).cast(pa.date32()),
+        'incomes': pa.array(historical_data['incomes'], pa.float64()),
+        'expenses': pa.array(historical_data['expenses'], pa.float64()),
+        'debts': pa.array(historical_data['debts'], pa.float64()),
+        'investments': pa.array(historical_data['investments'], pa.float64()),
+        'savings_rates': pa.array(historical_data['savings_rates'], pa.float64())
+    }, metadata={key: str(float(value)) for key, value in metrics.items()})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+# Function to check whether the client asked for Arrow instead of JSON
+def wants_arrow():
+    if pa is None:
+        return False
+    best = request.accept_mimetypes.best_match(['application/json', ARROW_STREAM_MIMETYPE])
+    return best == ARROW_STREAM_MIMETYPE
+
+# Online anomaly scoring
+ANOMALY_FEATURES = ['income', 'expenses', 'savings_rate']
+
+def robust_anomaly_score(window, values):
+    if len(window) < current_app.config['ANOMALY_MIN_HISTORY']:
+        return None
+    window = np.asarray(window, dtype=np.float64)
+    median = np.median(window, axis=0)
+    # 1.4826 * MAD estimates the standard deviation for normally distributed data
+    spread = 1.4826 * np.median(np.abs(window - median), axis=0)
+    spread = np.maximum(spread, np.maximum(np.abs(median) * current_app.config['ANOMALY_MIN_RELATIVE_SCALE'], 1e-9))
+    return float(np.max(np.abs(np.asarray(values) - median) / spread))
+
+# Function to score a row before it is written against the user's last ANOMALY_WINDOW
+# rows, kept in the feature store (read from the table for users who have no features yet)
+def score_financial_data(session, user_id, income, expenses, savings_rate):
+    features = session.get(UserFeatures, user_id)
+    if features is not None:
+        window = json.loads(features.recent)
+    else:
+        window = (session.query(*[getattr(FinancialData, name) for name in ANOMALY_FEATURES])
+                  .filter_by(user_id=user_id)
+                  .order_by(FinancialData.date.desc())
+                  .limit(current_app.config['ANOMALY_WINDOW'])
+                  .all())
+    score = robust_anomaly_score(window, [income, expenses, savings_rate])
+    if score is None:
+        return None, None
+    return score, score > current_app.config['ANOMALY_THRESHOLD']
+
+# Function to score a whole history in date order, each row against the rows before it
+def replay_anomaly_scores(values):
+    window_size = current_app.config['ANOMALY_WINDOW']
+    scores = [robust_anomaly_score(values[max(0, i - window_size):i], values[i]) for i in range(len(values))]
+    return [(score, None if score is None else score > current_app.config['ANOMALY_THRESHOLD']) for score in scores]
+
+# Feature store
+FEATURE_WINDOWS = (3, 6, 12)
+FEATURE_MONTHS = max(FEATURE_WINDOWS)
+RAW_FEATURES = ['income', 'expenses', 'debts', 'investments']
+HISTORY_FEATURES = [f'{metric}_mean_{window}m' for metric in ('income', 'expenses', 'savings_rate')
+                    for window in FEATURE_WINDOWS] + ['savings_rate_volatility', 'expense_trend', 'debt_change']
+
+# Rolling features from monthly (income, expenses, savings_rate, debts, investments)
+# tuples, oldest first; windows count months that have data
+def compute_features(months):
+    months = months[-FEATURE_MONTHS:]
+    features = {'months': len(months)}
+    for i, metric in enumerate(('income', 'expenses', 'savings_rate')):
+        for window in FEATURE_WINDOWS:
+            values = [month[i] for month in months[-window:]]
+            features[f'{metric}_mean_{window}m'] = sum(values) / len(values)
+
+    rates = [month[2] for month in months]
+    mean_rate = features[f'savings_rate_mean_{FEATURE_MONTHS}m']
+    features['savings_rate_volatility'] = (sum((rate - mean_rate) ** 2 for rate in rates) / len(rates)) ** 0.5
+    if len(months) > 1:
+        # Least-squares slope of monthly expenses, and the average monthly change in debts
+        mean_x = (len(months) - 1) / 2
+        mean_expenses = features[f'expenses_mean_{FEATURE_MONTHS}m']
+        features['expense_trend'] = (sum((x - mean_x) * (month[1] - mean_expenses) for x, month in enumerate(months))
+                                     / sum((x - mean_x) ** 2 for x in range(len(months))))
+        features['debt_change'] = (months[-1][3] - months[0][3]) / (len(months) - 1)
+    else:
+        features['expense_trend'] = features['debt_change'] = 0.0
+    return features
+
+def set_features(session, user_id, months, recent):
+    features = session.get(UserFeatures, user_id)
+    if features is None:
+        features = UserFeatures(user_id=user_id)
+        session.add(features)
+    for name, value in compute_features(months).items():
+        setattr(features, name, value)
+    features.recent = json.dumps(recent[-current_app.config['ANOMALY_WINDOW']:])
+    features.updated_at = datetime.utcnow()
+    return features
+
+# Function to rebuild a user's monthly sums and features from their full history
+def build_user_features(session, user_id):
+    session.query(UserMonthlyStats).filter_by(user_id=user_id).delete(synchronize_session=False)
+    monthly = {}
+    for archived in session.query(FinancialDataArchive).filter_by(user_id=user_id):
+        monthly[archived.month] = UserMonthlyStats(
+            user_id=user_id, month=archived.month, entries=archived.entries,
+            income_sum=archived.income * archived.entries, expenses_sum=archived.expenses * archived.entries,
+            savings_rate_sum=archived.savings_rate * archived.entries,
+            debts=archived.debts, investments=archived.investments
+        )
+
+    rows = (session.query(FinancialData.date, FinancialData.income, FinancialData.expenses,
+                          FinancialData.savings_rate, FinancialData.debts, FinancialData.investments)
+            .filter_by(user_id=user_id).order_by(FinancialData.date).all())
+    for row in rows:
+        add_to_monthly_stats(monthly, user_id, row)
+    if not monthly:
+        session.query(UserFeatures).filter_by(user_id=user_id).delete(synchronize_session=False)
+        return None
+
+    session.add_all(monthly.values())
+    months = [monthly[month].means() for month in sorted(monthly)]
+    return set_features(session, user_id, months, [[row.income, row.expenses, row.savings_rate] for row in rows])
+
+def add_to_monthly_stats(monthly, user_id, row):
+    month = row.date.strftime('%Y-%m')
+    stats = monthly.get(month)
+    if stats is None:
+        stats = monthly[month] = UserMonthlyStats(user_id=user_id, month=month, entries=0, income_sum=0.0,
+                                                  expenses_sum=0.0, savings_rate_sum=0.0)
+    stats.entries += 1
+    stats.income_sum += row.income
+    stats.expenses_sum += row.expenses
+    stats.savings_rate_sum += row.savings_rate
+    stats.debts, stats.investments = row.debts, row.investments
+    return stats
+
+# Function to fold a new row into its user's monthly sums and features; reads at most
+# FEATURE_MONTHS monthly rows whatever the length of the history
+def update_features(session, row):
+    features = session.get(UserFeatures, row.user_id)
+    if features is None:
+        # First row since the feature store was added (or ever): start from the full history
+        return build_user_features(session, row.user_id)
+
+    month = row.date.strftime('%Y-%m')
+    stats = session.get(UserMonthlyStats, (row.user_id, month))
+    if stats is None:
+        session.add(add_to_monthly_stats({}, row.user_id, row))
+    else:
+        add_to_monthly_stats({month: stats}, row.user_id, row)
+    months = (session.query(UserMonthlyStats).filter_by(user_id=row.user_id)
+              .order_by(UserMonthlyStats.month.desc()).limit(FEATURE_MONTHS).all())
+    recent = json.loads(features.recent) + [[row.income, row.expenses, row.savings_rate]]
+    return set_features(session, row.user_id, [stats.means() for stats in reversed(months)], recent)
+
+# Function to split an entry's expenses by category: the given amounts plus whatever is
+# left over under the catch-all category
+def split_expenses(expenses, categories=None):
+    other = current_app.config['EXPENSE_CATEGORIES'][-1]
+    items = {}
+    for category, amount in (categories or {}).items():
+        if amount < 0:
+            raise ValueError(f'The amount for {category} cannot be negative')
+        if amount:
+            items[category] = amount
+    remainder = expenses - sum(items.values())
+    if remainder < -0.005:
+        raise ValueError('The category amounts add up to more than the total expenses')
+    if remainder > 0.005:
+        items[other] = items.get(other, 0) + remainder
+    return items
+
+# Function to add an entry's category amounts to its user's monthly category totals
+def update_category_totals(session, user_id, month, items):
+    for category, amount in items.items():
+        total = session.get(UserMonthlyCategoryTotal, (user_id, month, category))
+        if total is None:
+            session.add(UserMonthlyCategoryTotal(user_id=user_id, month=month, category=category,
+                                                 amount=amount, entries=1))
+        else:
+            total.amount += amount
+            total.entries += 1
+
+# Function to compute the expense breakdown of the months in a date range from the monthly
+# category totals: the total per category and, per category, the amount in every month
+def expense_breakdown(user_id, start=None, end=None):
+    query = (financial_data_session(user_id).query(UserMonthlyCategoryTotal.month, UserMonthlyCategoryTotal.category,
+                                                   UserMonthlyCategoryTotal.amount)
+             .filter(UserMonthlyCategoryTotal.user_id == user_id))
+    rows = filter_archive_range(query, start, end, UserMonthlyCategoryTotal.month).all()
+
+    months = sorted({row.month for row in rows})
+    present = {row.category for row in rows}
+    configured = current_app.config['EXPENSE_CATEGORIES']
+    categories = [category for category in configured if category in present] + sorted(present - set(configured))
+    trends = {category: [0.0] * len(months) for category in categories}
+    positions = {month: i for i, month in enumerate(months)}
+    for row in rows:
+        trends[row.category][positions[row.month]] += row.amount
+    return {
+        'categories': categories,
+        'totals': [sum(trends[category]) for category in categories],
+        'months': months,
+        'trends': trends
+    }
+
+# Function to build the model input row: the latest values, plus the user's features when
+# the model was trained on them (a user without history gets their latest values as means)
+def model_inputs(income, expenses, debts, investments, user_id=None):
+    inputs = [income, expenses, debts, investments]
+    if current_app.config['MODEL_FEATURES'] != 'history':
+        return inputs
+    features = financial_data_session(user_id).get(UserFeatures, user_id) if user_id is not None else None
+    if features is None:
+        savings_rate, _, _ = calculate_financial_health(income, expenses, debts, investments)
+        features = compute_features([(income, expenses, savings_rate, debts, investments)])
+        return inputs + [features[name] for name in HISTORY_FEATURES]
+    return inputs + [getattr(features, name) for name in HISTORY_FEATURES]
+
+# Training rows for the history model: at each month, the latest values and the features
+# of the months before it, labelled with the following month's savings rate
+def feature_training_rows(histories):
+    X, y = [], []
+    for months in histories:
+        for t in range(1, len(months)):
+            features = compute_features(months[max(0, t - FEATURE_MONTHS):t])
+            income, expenses, _, debts, investments = months[t - 1]
+            X.append([income, expenses, debts, investments] + [features[name] for name in HISTORY_FEATURES])
+            y.append(months[t][2])
+    return X, y
+
+# Simulated monthly histories for when the feature store is still too small to train on
+def simulate_histories(users=400, months=24, seed=42):
+    rng = np.random.default_rng(seed)
+    income = rng.normal(5000, 1500, (users, 1)).clip(1000) * np.cumprod(1 + rng.normal(0.003, 0.02, (users, months)), axis=1)
+    expenses = income * (rng.normal(0.6, 0.15, (users, 1)) + rng.normal(0, 0.05, (users, months))).clip(0.1, 1.2)
+    debts = (rng.normal(10000, 5000, (users, 1)) + np.cumsum(rng.normal(-100, 300, (users, months)), axis=1)).clip(0)
+    investments = (rng.normal(20000, 10000, (users, 1)) + np.cumsum(rng.normal(200, 300, (users, months)), axis=1)).clip(0)
+    savings_rate = ((income - expenses) / income * 100).clip(0, 100)
+    return [list(zip(*columns)) for columns in zip(income, expenses, savings_rate, debts, investments)]
+
+def feature_training_data():
+    def load(session):
+        rows = session.query(UserMonthlyStats).order_by(UserMonthlyStats.user_id, UserMonthlyStats.month)
+        return [[stats.means() for stats in user_rows]
+                for _, user_rows in itertools.groupby(rows, key=lambda stats: stats.user_id)]
+
+    X, y = feature_training_rows([months for histories in fan_out(load) for months in histories])
+    if len(y) < current_app.config['MODEL_TRAINING_MIN_ROWS']:
+        X, y = feature_training_rows(simulate_histories())
+    return pd.DataFrame(X, columns=RAW_FEATURES + HISTORY_FEATURES), pd.Series(y, name='savings_rate')
+
 # Improved anomaly detection function
-def anomaly_detection(user_id):
-    user_data = FinancialData.query.filter_by(user_id=user_id).order_by(FinancialData.date).all()
-    
-    if not user_data:
+def anomaly_detection(user_id, start=None, end=None):
+    query = filter_date_range(user_financial_data(user_id).filter_by(is_anomaly=True), start, end)
+    user_data = query.order_by(FinancialData.date).all()
+
+    return [
+        {
+            'date': data.date.strftime('%Y-%m-%d'),
+            'income': data.income,
+            'expenses': data.expenses,
+            'savings_rate': data.savings_rate,
+            'anomaly_score': data.anomaly_score,
+            'anomaly': -1
+        }
+        for data in user_data
+    ]
+
+# Batched seasonal forecasting
+FORECAST_METRICS = ['income', 'expenses', 'savings_rate']
+
+# Fit additive Holt-Winters to every row of Y (users x months, NaN where a month has no
+# data) for every parameter combination at once, keeping each user's best fit.
+# Columns are calendar months; season_offset is the calendar slot of column 0.
+def holt_winters_forecast(Y, horizon, season_length, season_offset=0):
+    grid = np.array(list(itertools.product(current_app.config['FORECAST_ALPHAS'], current_app.config['FORECAST_BETAS'],
+                                           current_app.config['FORECAST_GAMMAS'])))
+    alpha, beta, gamma = (grid[:, i][:, None] for i in range(3))
+    users, months = Y.shape
+
+    level = np.zeros((len(grid), users))
+    trend = np.zeros((len(grid), users))
+    seasonal = np.zeros((len(grid), users, season_length))
+    started = np.zeros(users, dtype=bool)
+    squared_error = np.zeros((len(grid), users))
+
+    with np.errstate(invalid='ignore'):
+        for t in range(months):
+            y = Y[:, t]
+            observed = ~np.isnan(y)
+            slot = (season_offset + t) % season_length
+            season = seasonal[:, :, slot]
+            update = observed & started
+
+            squared_error += np.where(update, (y - level - trend - season) ** 2, 0.0)
+            new_level = alpha * (y - season) + (1 - alpha) * (level + trend)
+            new_trend = beta * (new_level - level) + (1 - beta) * trend
+            new_season = gamma * (y - new_level) + (1 - gamma) * season
+
+            # Months without data carry the level forward along the trend
+            level = np.where(update, new_level, np.where(started, level + trend, np.where(observed, y, 0.0)))
+            trend = np.where(update, new_trend, trend)
+            seasonal[:, :, slot] = np.where(update, new_season, season)
+            started |= observed
+
+    best = np.argmin(squared_error, axis=0)
+    rows = np.arange(users)
+    steps = np.arange(1, horizon + 1)
+    slots = (season_offset + months - 1 + steps) % season_length
+    forecast = (level[best, rows][:, None] + steps * trend[best, rows][:, None]
+                + seasonal[best[:, None], rows[:, None], slots])
+    forecast[~started] = np.nan
+    return forecast
+
+# Function to load monthly means per user from whichever databases hold their rows
+def monthly_history(user_ids, start=None, end=None):
+    sessions = {}
+    for user_id in user_ids:
+        sessions.setdefault(financial_data_session(user_id), []).append(user_id)
+
+    frames = []
+    for session, session_users in sessions.items():
+        query = (session.query(FinancialData.user_id, FinancialData.date,
+                               *[getattr(FinancialData, name) for name in FORECAST_METRICS])
+                 .filter(FinancialData.user_id.in_(session_users)))
+        rows = filter_date_range(query, start, end).all()
+        frames.append(pd.DataFrame(rows, columns=['user_id', 'date'] + FORECAST_METRICS))
+
+        archive_query = (session.query(FinancialDataArchive.user_id, FinancialDataArchive.month,
+                                       *[getattr(FinancialDataArchive, name) for name in FORECAST_METRICS])
+                         .filter(FinancialDataArchive.user_id.in_(session_users)))
+        archived = filter_archive_range(archive_query, start, end).all()
+        archive_frame = pd.DataFrame(archived, columns=['user_id', 'date'] + FORECAST_METRICS)
+        archive_frame['date'] = pd.to_datetime(archive_frame['date'], format='%Y-%m')
+        frames.append(archive_frame)
+
+    df = pd.concat(frames, ignore_index=True)
+    if df.empty:
+        return df.set_index(['user_id', 'date'])[FORECAST_METRICS]
+    df['date'] = pd.to_datetime(df['date'])
+    df['month'] = df['date'].dt.year * 12 + df['date'].dt.month - 1
+    return df.groupby(['user_id', 'month'])[FORECAST_METRICS].mean()
+
+# Function to forecast a batch of users from their history in [start, end)
+# Forecasts start the month after end, or after the current month for open-ended ranges.
+def compute_forecasts(user_ids, start=None, end=None):
+    monthly = monthly_history(user_ids, start, end)
+    if monthly.empty:
+        return []
+
+    now = datetime.utcnow()
+    months = monthly.index.get_level_values('month')
+    first_month = months.min()
+    if end is None:
+        last_month = max(months.max(), now.year * 12 + now.month - 1)
+    else:
+        last_day = end - timedelta(microseconds=1)
+        last_month = last_day.year * 12 + last_day.month - 1
+    horizon = current_app.config['FORECAST_HORIZON']
+    season_length = current_app.config['FORECAST_SEASON_LENGTH']
+
+    forecasts = []
+    for metric in FORECAST_METRICS:
+        matrix = monthly[metric].unstack('month').reindex(columns=range(first_month, last_month + 1))
+        values = holt_winters_forecast(matrix.to_numpy(dtype=np.float64), horizon, season_length,
+                                       season_offset=first_month % season_length)
+        for user_id, user_values in zip(matrix.index, values):
+            for step, value in enumerate(user_values, start=1):
+                month = last_month + step
+                forecasts.append(Forecast(
+                    user_id=int(user_id), metric=metric, step=step,
+                    month=f'{month // 12:04d}-{month % 12 + 1:02d}',
+                    value=None if np.isnan(value) else float(value), generated_at=now
+                ))
+    return forecasts
+
+# Function to forecast a batch of users and replace their rows in the forecast table
+def store_forecasts(user_ids):
+    forecasts = compute_forecasts(user_ids)
+    Forecast.query.filter(Forecast.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.add_all(forecasts)
+    db.session.commit()
+    return forecasts
+
+# Improved financial forecasting function
+def financial_forecasting(user_id, start=None, end=None):
+    if start is not None or end is not None:
+        # Windowed forecasts are fitted on demand; the table only holds full-history forecasts
+        forecasts = compute_forecasts([user_id], start, end)
+    else:
+        forecasts = Forecast.query.filter_by(user_id=user_id).all()
+        # Recompute when the user's data has changed since the last batch run: going by when it
+        # was written, as imported and compacted rows carry past dates
+        version = data_version(user_id)
+        if not forecasts or (version is not None and min(f.generated_at for f in forecasts) < version):
+            forecasts = store_forecasts([user_id])
+
+    if not forecasts:
         return None
 
-    df = pd.DataFrame({
-        'income': [data.income for data in user_data],
-        'expenses': [data.expenses for data in user_data],
-        'savings_rate': [data.savings_rate for data in user_data]
+    forecasts.sort(key=lambda forecast: forecast.step)
+    result = {'months': sorted({forecast.month for forecast in forecasts})}
+    for metric in FORECAST_METRICS:
+        result[metric] = [forecast.value for forecast in forecasts if forecast.metric == metric]
+    return result
+
+# Simulate savings paths for goal-based planning
+# Each path is reduced to two numbers: the growth of the current savings (A) and the
+# growth of one unit contributed at the end of every month (B). Final wealth is then
+# A + contribution * B, so one simulation answers both "what are my odds" and
+# "how much do I need to save" for any contribution. With a time budget, fewer than n_paths
+# paths may come back, and how many depends on the load, so only unbudgeted results are
+# reproducible from the seed.
+def simulate_goal_paths(current_savings, months, expected_return, volatility, inflation,
+                        n_paths, seed, chunk_size, month_block, time_budget):
+    rng = np.random.default_rng(seed)
+    monthly_sigma = volatility / np.sqrt(12)
+    monthly_mu = (np.log1p(expected_return) - np.log1p(inflation)) / 12 - monthly_sigma ** 2 / 2
+
+    started = time.perf_counter()
+    savings_growth = []
+    contribution_growth = []
+    simulated = 0
+    while simulated < n_paths:
+        size = min(chunk_size, n_paths - simulated)
+        a = np.full(size, float(current_savings))
+        b = np.zeros(size)
+        for block_start in range(0, months, month_block):
+            block = min(month_block, months - block_start)
+            growth = np.exp(rng.normal(monthly_mu, monthly_sigma, (block, size)))
+            cumulative = np.cumprod(growth, axis=0)
+            total = cumulative[-1]
+            a *= total
+            b = total * (b + (1.0 / cumulative).sum(axis=0))
+        savings_growth.append(a)
+        contribution_growth.append(b)
+        simulated += size
+        if time_budget is not None and time.perf_counter() - started > time_budget:
+            break
+
+    return np.concatenate(savings_growth), np.concatenate(contribution_growth)
+
+# Enhanced goal-based planning function
+def goal_based_planning(target_amount, current_savings, years, monthly_contribution=None,
+                        expected_return=None, volatility=None, inflation=None):
+    months = int(round(years * 12))
+    required_savings_per_month = (target_amount - current_savings) / months
+
+    expected_return = current_app.config['MONTE_CARLO_EXPECTED_RETURN'] if expected_return is None else expected_return
+    volatility = current_app.config['MONTE_CARLO_VOLATILITY'] if volatility is None else volatility
+    inflation = current_app.config['MONTE_CARLO_INFLATION'] if inflation is None else inflation
+    if monthly_contribution is None:
+        monthly_contribution = max(required_savings_per_month, 0)
+
+    savings_growth, contribution_growth = simulate_goal_paths(
+        current_savings, months, expected_return, volatility, inflation,
+        n_paths=current_app.config['MONTE_CARLO_PATHS'],
+        seed=current_app.config['MONTE_CARLO_SEED'],
+        chunk_size=current_app.config['MONTE_CARLO_CHUNK_SIZE'],
+        month_block=current_app.config['MONTE_CARLO_MONTH_BLOCK'],
+        time_budget=current_app.config['MONTE_CARLO_TIME_BUDGET']
+    )
+
+    final_wealth = savings_growth + monthly_contribution * contribution_growth
+    required_per_path = np.maximum((target_amount - savings_growth) / contribution_growth, 0)
+
+    return {
+        'required_savings_per_month': required_savings_per_month,
+        'monthly_contribution': monthly_contribution,
+        'probability_of_success': float(np.mean(final_wealth >= target_amount)),
+        'median_final_wealth': float(np.median(final_wealth)),
+        'required_contribution': {
+            str(level): float(np.quantile(required_per_path, level))
+            for level in current_app.config['MONTE_CARLO_CONFIDENCE_LEVELS']
+        },
+        'paths': int(final_wealth.size)
+    }
+
+# Project a weight vector onto the long-only, fully invested simplex
+def project_to_simplex(weights):
+    sorted_weights = np.sort(weights)[::-1]
+    cumulative = np.cumsum(sorted_weights) - 1
+    index = np.arange(1, len(weights) + 1)
+    rho = index[sorted_weights - cumulative / index > 0][-1]
+    return np.maximum(weights - cumulative[rho - 1] / rho, 0)
+
+# Mean-variance optimal weights for a given risk aversion (projected gradient ascent)
+def mean_variance_weights(expected_returns, covariance, risk_aversion, iterations=500):
+    weights = np.full(len(expected_returns), 1.0 / len(expected_returns))
+    step = 1.0 / (risk_aversion * np.linalg.eigvalsh(covariance)[-1])
+    for _ in range(iterations):
+        gradient = expected_returns - risk_aversion * covariance @ weights
+        updated = project_to_simplex(weights + step * gradient)
+        if np.abs(updated - weights).max() < 1e-9:
+            return updated
+        weights = updated
+    return weights
+
+# Equal risk contribution weights
+def risk_parity_weights(covariance, iterations=200):
+    weights = 1.0 / np.sqrt(np.diag(covariance))
+    weights /= weights.sum()
+    for _ in range(iterations):
+        risk_contribution = weights * (covariance @ weights)
+        weights *= np.sqrt(risk_contribution.mean() / risk_contribution)
+        weights /= weights.sum()
+    return weights
+
+# Load the configured asset-class dataset
+def get_asset_classes():
+    assets = current_app.config['ASSET_CLASSES']
+    names = list(assets)
+    expected_returns = np.array([assets[name]['expected_return'] for name in names])
+    volatilities = np.array([assets[name]['volatility'] for name in names])
+    covariance = np.outer(volatilities, volatilities) * np.array(current_app.config['ASSET_CORRELATIONS'])
+    return names, expected_returns, covariance
+
+# The efficient frontier, computed on first use (during warmup, or the first robo-advisory
+# request when warmup is off) and cached per asset dataset
+_frontier_cache = {}
+
+def get_efficient_frontier():
+    cache_key = (repr(current_app.config['ASSET_CLASSES']), repr(current_app.config['ASSET_CORRELATIONS']),
+                 current_app.config['FRONTIER_POINTS'])
+    if cache_key in _frontier_cache:
+        return _frontier_cache[cache_key]
+
+    names, expected_returns, covariance = get_asset_classes()
+    points = []
+    for risk_aversion in np.geomspace(500, 0.5, current_app.config['FRONTIER_POINTS']):
+        weights = mean_variance_weights(expected_returns, covariance, risk_aversion)
+        points.append((np.sqrt(weights @ covariance @ weights), weights @ expected_returns, weights))
+    points.sort(key=lambda point: point[0])
+
+    parity = risk_parity_weights(covariance)
+    frontier = {
+        'assets': names,
+        'volatilities': np.array([point[0] for point in points]),
+        'returns': np.array([point[1] for point in points]),
+        'weights': np.array([point[2] for point in points]),
+        'risk_parity': parity,
+        'risk_parity_return': parity @ expected_returns,
+        'risk_parity_volatility': np.sqrt(parity @ covariance @ parity)
+    }
+    _frontier_cache.clear()
+    _frontier_cache[cache_key] = frontier
+    return frontier
+
+# Interpolate the allocation for a risk tolerance from the cached frontier
+def get_allocation(risk_tolerance):
+    frontier = get_efficient_frontier()
+    levels = current_app.config['RISK_TOLERANCE_LEVELS']
+    if risk_tolerance not in levels:
+        return (frontier['risk_parity'], frontier['risk_parity_return'],
+                frontier['risk_parity_volatility'])
+
+    volatilities = frontier['volatilities']
+    target = volatilities[0] + levels[risk_tolerance] * (volatilities[-1] - volatilities[0])
+    weights = np.array([np.interp(target, volatilities, column) for column in frontier['weights'].T])
+    weights /= weights.sum()
+    return weights, np.interp(target, volatilities, frontier['returns']), target
+
+# Enhanced robo-advisory function
+def robo_advisory(risk_tolerance, current_savings, investments):
+    frontier = get_efficient_frontier()
+    weights, expected_return, volatility = get_allocation(risk_tolerance)
+    investable = max(current_savings, 0) + max(investments, 0)
+
+    allocation = [
+        {'asset': asset, 'weight': float(weight), 'amount': float(weight * investable)}
+        for asset, weight in zip(frontier['assets'], weights)
+        if weight >= 0.005
+    ]
+    allocation.sort(key=lambda item: item['weight'], reverse=True)
+
+    recommendations = []
+    if current_savings < 1000:
+        recommendations.append('Increase savings before high-risk investments')
+    if investments < 5000:
+        recommendations.append('Consider diversifying investments')
+
+    return {
+        'allocation': allocation,
+        'expected_return': float(expected_return),
+        'volatility': float(volatility),
+        'recommendations': recommendations
+    }
+
+# In-process pub/sub for live dashboard updates
+# Each connected dashboard gets a bounded queue; a publish encodes the event once and
+# hands it to the queues of that user's connections only.
+class EventBroker:
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=self.max_queue_size)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, user_id, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[user_id]
+
+    def publish(self, user_id, event, data):
+        message = f'event: {event}\ndata: {current_app.json.dumps(data)}\n\n'
+        with self.lock:
+            subscriptions = list(self.subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                # The client stopped reading; close its stream so it reconnects and resyncs
+                self.unsubscribe(user_id, subscription)
+                with subscription.mutex:
+                    subscription.queue.clear()
+                subscription.put_nowait(None)
+
+event_broker = EventBroker()
+
+# Function to push a newly written row and the updated ratios to the user's dashboards
+def publish_financial_update(user_id, data):
+    savings_rate, debt_to_income_ratio, investment_to_income_ratio = calculate_financial_health(
+        data.income, data.expenses, data.debts, data.investments
+    )
+    event_broker.publish(user_id, 'financial_data', {
+        'row': {
+            'id': data.id,
+            'date': data.date.strftime('%Y-%m-%d'),
+            'income': data.income,
+            'expenses': data.expenses,
+            'debts': data.debts,
+            'investments': data.investments,
+            'savings_rate': data.savings_rate
+        },
+        'savings_rate': savings_rate,
+        'debt_to_income_ratio': debt_to_income_ratio,
+        'investment_to_income_ratio': investment_to_income_ratio,
+        'predicted_savings_rate': predict_savings_rate(data.income, data.expenses, data.debts, data.investments,
+                                                       user_id)
     })
 
-    clf = IsolationForest(contamination=0.1, random_state=42)
-    df['anomaly'] = clf.fit_predict(df[['income', 'expenses', 'savings_rate']])
+# Admission control
+# Every request takes one of `capacity` slots. Routes without a limit are admitted
+# immediately; limited routes wait (up to a timeout, in a bounded queue) until their own
+# limit, the shared limit for limited routes (capacity - reserved) and the total allow it.
+class AdmissionController:
+    def __init__(self, limits, capacity, reserved):
+        self.limits = limits
+        self.capacity = capacity
+        self.limited_capacity = max(capacity - reserved, 1)
+        self.condition = threading.Condition()
+        self.total = 0
+        self.limited = 0
+        self.in_flight = {route: 0 for route in limits}
+        self.waiting = {route: 0 for route in limits}
+        self.admitted = {}
+        self.shed = {}
 
-    anomalies = df[df['anomaly'] == -1]
-    return anomalies.to_dict('records')
+    def has_room(self, route):
+        return (self.in_flight[route] < self.limits[route]['concurrency']
+                and self.limited < self.limited_capacity and self.total < self.capacity)
 
-# Improved financial forecasting function
-def financial_forecasting(user_id):
-    user_data = FinancialData.query.filter_by(user_id=user_id).order_by(FinancialData.date).all()
-    
-    if not user_data:
+    def acquire(self, route, timeout):
+        with self.condition:
+            if route in self.limits:
+                if not self.has_room(route):
+                    if self.waiting[route] >= self.limits[route]['queue']:
+                        self.shed[(route, 'queue_full')] = self.shed.get((route, 'queue_full'), 0) + 1
+                        return False
+                    self.waiting[route] += 1
+                    try:
+                        admitted = self.condition.wait_for(lambda: self.has_room(route), timeout)
+                    finally:
+                        self.waiting[route] -= 1
+                    if not admitted:
+                        self.shed[(route, 'timeout')] = self.shed.get((route, 'timeout'), 0) + 1
+                        return False
+                self.in_flight[route] += 1
+                self.limited += 1
+            self.total += 1
+            self.admitted[route] = self.admitted.get(route, 0) + 1
+            return True
+
+    def release(self, route):
+        with self.condition:
+            self.total -= 1
+            if route in self.limits:
+                self.in_flight[route] -= 1
+                self.limited -= 1
+            if any(self.waiting.values()):
+                self.condition.notify_all()
+
+    # Prometheus text exposition of the counters and gauges
+    def metrics(self):
+        with self.condition:
+            lines = [
+                '# TYPE admission_capacity gauge',
+                f'admission_capacity {self.capacity}',
+                '# TYPE admission_in_flight_total gauge',
+                f'admission_in_flight_total {self.total}',
+                '# TYPE admission_in_flight gauge',
+                *[f'admission_in_flight{{route="{route}"}} {count}' for route, count in self.in_flight.items()],
+                '# TYPE admission_queue_depth gauge',
+                *[f'admission_queue_depth{{route="{route}"}} {count}' for route, count in self.waiting.items()],
+                '# TYPE admission_admitted_total counter',
+                *[f'admission_admitted_total{{route="{route}"}} {count}' for route, count in self.admitted.items()],
+                '# TYPE admission_shed_total counter',
+                *[f'admission_shed_total{{route="{route}",reason="{reason}"}} {count}'
+                  for (route, reason), count in self.shed.items()]
+            ]
+        return '\n'.join(lines) + '\n'
+
+@bp.before_app_request
+def admit_request():
+    if request.url_rule is None:
         return None
+    route = request.url_rule.rule
+    if not current_app.extensions['admission'].acquire(route, current_app.config['ADMISSION_QUEUE_TIMEOUT']):
+        return (jsonify({'error': 'The server is busy, please retry shortly'}), 503,
+                {'Retry-After': str(current_app.config['ADMISSION_RETRY_AFTER'])})
+    g.admission_route = route
+
+@bp.teardown_app_request
+def release_request(exception=None):
+    route = g.pop('admission_route', None)
+    if route is not None:
+        current_app.extensions['admission'].release(route)
+
+# Single-flight
+# Concurrent calls with the same key share one computation: the first caller runs it and
+# the others wait for its result (or exception). With a lock directory this extends across
+# processes: the process holding the key's flock computes and leaves the result, as JSON
+# through the app's provider, next to the lock for the processes that were waiting on it.
+class SingleFlight:
+    def __init__(self, lock_dir=None, timeout=30, result_ttl=60):
+        self.lock_dir = lock_dir if fcntl else None
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.led = 0
+        self.shared = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    # on_wait is called before a caller starts waiting on another caller's computation
+    def do(self, key, func, on_wait=None):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.led += 1
+
+        if not leader:
+            if on_wait is not None:
+                on_wait()
+            if not call['done'].wait(self.timeout):
+                return func()
+            with self.lock:
+                self.shared += 1
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = self.do_across_processes(key, func, on_wait) if self.lock_dir else func()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+        return call['result']
+
+    def do_across_processes(self, key, func, on_wait=None):
+        path = os.path.join(self.lock_dir, hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest())
+        started = time.time()
+        with open(path + '.lock', 'ab') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is computing; wait for it to let go of the lock
+                if on_wait is not None:
+                    on_wait()
+                deadline = time.monotonic() + self.timeout
+                while time.monotonic() < deadline:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        time.sleep(0.01)
+                        continue
+                    try:
+                        # Only a result written while we waited; none means the other process failed
+                        if os.stat(path + '.result').st_mtime >= started:
+                            with open(path + '.result', 'rb') as result_file:
+                                result = current_app.json.loads(result_file.read())
+                            with self.lock:
+                                self.shared += 1
+                            return result
+                    except FileNotFoundError:
+                        pass
+                    break
+                return func()
+
+            result = func()
+            temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temporary_path, 'w') as result_file:
+                result_file.write(current_app.json.dumps(result))
+            os.replace(temporary_path, path + '.result')
+            self.remove_expired()
+            return result
+
+    def remove_expired(self):
+        expired = time.time() - self.result_ttl
+        for entry in os.scandir(self.lock_dir):
+            try:
+                if entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def metrics(self):
+        with self.lock:
+            return ('# TYPE single_flight_in_flight gauge\n'
+                    f'single_flight_in_flight {len(self.calls)}\n'
+                    '# TYPE single_flight_leaders_total counter\n'
+                    f'single_flight_leaders_total {self.led}\n'
+                    '# TYPE single_flight_shared_total counter\n'
+                    f'single_flight_shared_total {self.shared}\n')
+
+# Version of a user's data: changes whenever a row is added or compacted, each of which
+# refreshes the user's features (or at least their timestamp), so reading it is one
+# primary-key lookup however long the history. A move to another shard keeps it, as the
+# features move along with the data they describe.
+def data_version(user_id):
+    return (financial_data_session(user_id).query(UserFeatures.updated_at)
+            .filter_by(user_id=user_id).scalar())
+
+# Function to share one computation between concurrent identical requests of a user
+def coalesce(name, user_id, func):
+    if not current_app.config['SINGLE_FLIGHT']:
+        return func()
+    key = (name, user_id, tuple(sorted(request.args.items(multi=True))), data_version(user_id))
+    # Waiting for someone else's result uses no CPU, so it shouldn't hold an admission slot
+    return current_app.extensions['single_flight'].do(key, func, on_wait=release_request)
+
+# Memory profiling
+# A profiled request (one at a time, chosen by MEMORY_PROFILE_SAMPLE_RATE) turns tracemalloc
+# on for its own duration, so its snapshot holds exactly the allocations it made that are
+# still alive, and tracing costs nothing between profiled requests. Nested sections such as
+# model calls report their own peak and retained memory, carrying the enclosing peak across
+# their peak resets. Allocations of other threads during a profiled request count towards it.
+# Diffs on demand need process-wide tracing, which the first snapshot request turns on.
+class MemoryProfiler:
+    def __init__(self, frames, top, sample_rate):
+        self.frames = frames
+        self.top = top
+        self.sample_rate = sample_rate
+        self.sampling = threading.Lock()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {}
+        self.filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        self.baseline = None
+
+    # Returns a frame to pass to finish(), or None when this call is not profiled. Only a root
+    # (a request) samples; other sections are profiled only inside a sampled root
+    def start(self, name, root=True):
+        stack = getattr(self.local, 'stack', None)
+        if not stack:
+            if not root or random.random() >= self.sample_rate:
+                return None
+            if not self.sampling.acquire(blocking=False):
+                return None
+            stack = self.local.stack = []
+        owner = not tracemalloc.is_tracing()
+        if owner:
+            tracemalloc.start(self.frames)
+        _, peak = tracemalloc.get_traced_memory()
+        for parent in stack:
+            parent['peak'] = max(parent['peak'], peak)
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        frame = {'name': name, 'owner': owner, 'start': current, 'peak': current}
+        stack.append(frame)
+        return frame
+
+    def finish(self, frame):
+        current, peak = tracemalloc.get_traced_memory()
+        stack = self.local.stack
+        stack.remove(frame)
+        peak = max(frame['peak'], peak)
+        for parent in stack:
+            parent['peak'] = max(parent['peak'], peak)
+        sites = []
+        if frame['owner']:
+            sites = self.snapshot().statistics('lineno')[:self.top]
+            tracemalloc.stop()
+        else:
+            tracemalloc.reset_peak()
+        if not stack:
+            self.sampling.release()
+        self.record(frame['name'], peak - frame['start'], current - frame['start'], sites)
+
+    @contextlib.contextmanager
+    def section(self, name):
+        frame = self.start(name, root=False)
+        try:
+            yield
+        finally:
+            if frame is not None:
+                self.finish(frame)
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self.filters)
+
+    def record(self, name, peak, retained, sites):
+        with self.lock:
+            stats = self.stats.setdefault(name, {'samples': 0, 'peak_bytes_max': 0, 'peak_bytes_total': 0,
+                                                 'retained_bytes_total': 0, 'sites': {}})
+            stats['samples'] += 1
+            stats['peak_bytes_max'] = max(stats['peak_bytes_max'], peak)
+            stats['peak_bytes_total'] += peak
+            stats['retained_bytes_total'] += retained
+            for stat in sites:
+                frame = stat.traceback[0]
+                site = stats['sites'].setdefault(f'{frame.filename}:{frame.lineno}', [0, 0])
+                site[0] += stat.size
+                site[1] += stat.count
+
+    # Per-name averages and the sites whose allocations outlived the most samples
+    def report(self):
+        with self.lock:
+            return {
+                'tracing': self.baseline is not None,
+                'profiles': {
+                    name: {
+                        'samples': stats['samples'],
+                        'peak_bytes_max': stats['peak_bytes_max'],
+                        'peak_bytes_mean': stats['peak_bytes_total'] / stats['samples'],
+                        'retained_bytes_mean': stats['retained_bytes_total'] / stats['samples'],
+                        'top_sites': [{'site': site, 'size_bytes': size, 'count': count}
+                                      for site, (size, count) in sorted(stats['sites'].items(),
+                                                                        key=lambda item: item[1][0],
+                                                                        reverse=True)[:self.top]]
+                    }
+                    for name, stats in self.stats.items()
+                }
+            }
+
+    # Difference between a new snapshot and the previous one. The first call turns on
+    # process-wide tracing (waiting for a profiled request to finish) and returns no
+    # differences; stop() turns it off again.
+    def diff(self, key_type='lineno', top=None, dump_dir=None):
+        with self.sampling:
+            if self.baseline is None:
+                tracemalloc.start(self.frames)
+                self.baseline = self.snapshot()
+                return {'pid': os.getpid(), 'tracing': 'started', 'dump': None, 'differences': []}
+            snapshot = self.snapshot()
+            differences = snapshot.compare_to(self.baseline, key_type)[:top or self.top]
+            self.baseline = snapshot
+        path = None
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+            path = os.path.join(dump_dir, f'memory-{os.getpid()}-{datetime.utcnow():%Y%m%dT%H%M%S%f}.snapshot')
+            snapshot.dump(path)
+        return {
+            'pid': os.getpid(),
+            'tracing': 'on',
+            'dump': path,
+            'differences': [{'traceback': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+                             'size_bytes': stat.size, 'size_diff_bytes': stat.size_diff,
+                             'count': stat.count, 'count_diff': stat.count_diff}
+                            for stat in differences]
+        }
+
+    def stop(self):
+        with self.sampling:
+            if self.baseline is not None:
+                tracemalloc.stop()
+                self.baseline = None
+
+    def metrics(self):
+        with self.lock:
+            lines = [
+                '# TYPE memory_profile_samples_total counter',
+                *[f'memory_profile_samples_total{{name="{name}"}} {stats["samples"]}'
+                  for name, stats in self.stats.items()],
+                '# TYPE memory_profile_peak_bytes_max gauge',
+                *[f'memory_profile_peak_bytes_max{{name="{name}"}} {stats["peak_bytes_max"]}'
+                  for name, stats in self.stats.items()],
+                '# TYPE memory_profile_retained_bytes_total counter',
+                *[f'memory_profile_retained_bytes_total{{name="{name}"}} {stats["retained_bytes_total"]}'
+                  for name, stats in self.stats.items()]
+            ]
+        return '\n'.join(lines) + '\n'
+
+# Registered by create_app only when MEMORY_PROFILING is on; the admin endpoints that
+# report on the profile are not profiled themselves
+def start_memory_profile():
+    if request.url_rule is not None and not request.url_rule.rule.startswith('/admin/'):
+        g.memory_profile = current_app.extensions['memory_profiler'].start(request.url_rule.rule)
+
+def finish_memory_profile(exception=None):
+    frame = g.pop('memory_profile', None)
+    if frame is not None:
+        current_app.extensions['memory_profiler'].finish(frame)
+
+# Profiles a block of work inside a profiled request, or on its own outside requests
+def memory_section(name):
+    profiler = current_app.extensions.get('memory_profiler')
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.section(name)
+
+# Write-behind journal
+# add_financial_data appends each entry to this process's journal and returns once it is
+# fsynced; appends that arrive while an fsync is running share the next one. A flusher
+# thread writes pending entries in one transaction per database, together with the
+# journal's checkpoint there, so a retried or replayed batch skips what was already
+# written. Each process holds an flock on its journal; a journal nobody holds belongs to
+# a process that died, and is replayed and removed by the next process that finds it.
+class WriteBehindJournal:
+    def __init__(self, directory, batch_size, interval, max_bytes):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.lock = threading.Condition()
+        self.sync_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.app = None
+        self.pid = None
+        self.name = None
+        self.file = None
+        self.pending = []
+        self.next_seq = 1
+        self.synced = 0
+        self.group_commits = 0
+        self.flushed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # Opens this process's journal and starts its flusher; called again after a fork
+    def start(self, app):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.app = app
+            self.pid = os.getpid()
+            self.name = f'{self.pid}-{time.time_ns()}.journal'
+            self.file = open(os.path.join(self.directory, self.name), 'ab')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            self.pending, self.next_seq, self.synced = [], 1, 0
+        atexit.register(self.close, self.pid)
+        threading.Thread(target=self.run, name='write-behind', daemon=True).start()
+
+    def append(self, user_id, date, income, expenses, debts, investments, categories=None):
+        if self.pid != os.getpid():
+            self.start(current_app._get_current_object())
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            entry = {'seq': seq, 'user_id': user_id, 'date': date.isoformat(), 'income': income,
+                     'expenses': expenses, 'debts': debts, 'investments': investments,
+                     'categories': categories}
+            self.file.write(json.dumps(entry).encode() + b'\n')
+            self.pending.append(entry)
+            if len(self.pending) >= self.batch_size:
+                self.lock.notify_all()
+        self.sync(seq)
+        return self.name, seq
+
+    # Group fsync: whoever gets the lock first covers every entry written before it
+    def sync(self, seq):
+        with self.sync_lock:
+            if self.synced >= seq:
+                return
+            with self.lock:
+                self.file.flush()
+                written = self.next_seq - 1
+            os.fsync(self.file.fileno())
+            self.synced = written
+
+    def run(self):
+        pid = self.pid
+        with self.app.app_context():
+            try:
+                self.recover_all()
+            except Exception:
+                self.app.logger.exception('Replaying write-behind journals failed')
+        while pid == os.getpid():
+            with self.lock:
+                self.lock.wait_for(lambda: len(self.pending) >= self.batch_size, self.interval)
+            try:
+                self.flush()
+            except Exception:
+                # The entries stay pending and are retried on the next round
+                self.app.logger.exception('Write-behind flush failed')
+                time.sleep(self.interval)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch = self.pending[:]
+            if not batch:
+                return 0
+            with self.app.app_context():
+                rows = apply_journal_entries(self.name, batch)
+                with self.lock:
+                    del self.pending[:len(batch)]
+                    self.group_commits += 1
+                    self.flushed += len(batch)
+                    if not self.pending and self.file.tell() >= self.max_bytes:
+                        self.file.truncate(0)
+                for row in rows:
+                    publish_financial_update(row.user_id, row)
+            return len(batch)
+
+    # Waits until the user's entry `seq` of journal `name` is in the database, flushing
+    # it right away when the journal is this process's own; False on timeout
+    def wait_applied(self, user_id, name, seq, timeout):
+        if name == self.name and self.pid == os.getpid():
+            self.flush()
+        session = financial_data_session(user_id)
+        path = os.path.join(self.directory, name)
+        deadline = time.monotonic() + timeout
+        while True:
+            applied = session.query(JournalCheckpoint.sequence).filter_by(journal=name).scalar()
+            # End the read transaction so the next check sees new commits
+            session.rollback()
+            if applied is not None and applied >= seq:
+                return True
+            # Replayed and removed after its process died
+            if not os.path.exists(path) or self.recover(path) is not None:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(min(self.interval, 0.01))
+
+    # Replays a journal whose process died; None while its process still holds it
+    def recover(self, path):
+        try:
+            journal = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with journal:
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if os.fstat(journal.fileno()).st_nlink == 0:
+                return None
+            entries = []
+            for line in journal:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A torn last line: that entry was never acknowledged
+                    break
+            name = os.path.basename(path)
+            rows = apply_journal_entries(name, entries) if entries else []
+            os.remove(path)
+            fan_out(lambda session: remove_journal_checkpoints(session, name))
+        return len(rows)
+
+    def recover_all(self):
+        replayed = {}
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.journal') and entry.name != self.name:
+                rows = self.recover(entry.path)
+                if rows is not None:
+                    replayed[entry.name] = rows
+        return replayed
+
+    # On a clean exit: write what is pending and remove the journal
+    def close(self, pid):
+        if pid != os.getpid() or self.file is None:
+            return
+        try:
+            self.flush()
+            with self.app.app_context():
+                fan_out(lambda session: remove_journal_checkpoints(session, self.name))
+            os.remove(os.path.join(self.directory, self.name))
+            self.file.close()
+            self.file = None
+        except Exception:
+            # Left for the next process to replay
+            self.app.logger.exception('Closing the write-behind journal failed')
+
+    def metrics(self):
+        with self.lock:
+            return ('# TYPE write_behind_pending gauge\n'
+                    f'write_behind_pending {len(self.pending)}\n'
+                    '# TYPE write_behind_group_commits_total counter\n'
+                    f'write_behind_group_commits_total {self.group_commits}\n'
+                    '# TYPE write_behind_rows_total counter\n'
+                    f'write_behind_rows_total {self.flushed}\n')
+
+# Function to write journal entries, one transaction per database, skipping the entries
+# the journal's checkpoint there says are already written
+def apply_journal_entries(name, entries):
+    groups = {}
+    for entry in entries:
+        groups.setdefault(financial_data_session(entry['user_id']), []).append(entry)
+
+    rows = []
+    for session, group in groups.items():
+        applied = session.query(JournalCheckpoint.sequence).filter_by(journal=name).scalar() or 0
+        group = [entry for entry in group if entry['seq'] > applied]
+        if not group:
+            continue
+        try:
+            written = [store_financial_data(session, entry['user_id'], datetime.fromisoformat(entry['date']),
+                                            entry['income'], entry['expenses'], entry['debts'], entry['investments'],
+                                            entry.get('categories'))
+                       for entry in group]
+            session.merge(JournalCheckpoint(journal=name, sequence=group[-1]['seq']))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        rows.extend(written)
+    return rows
+
+def remove_journal_checkpoints(session, name):
+    session.query(JournalCheckpoint).filter_by(journal=name).delete(synchronize_session=False)
+    session.commit()
+
+# Every serving process opens its journal (whose flusher first replays the journals of
+# dead processes) or, with write-behind off, still replays any left from when it was on
+def start_journal(app):
+    journal = app.extensions['write_behind']
+    if journal is not None:
+        journal.start(app)
+    elif fcntl and os.path.isdir(app.config['WRITE_BEHIND_DIR']):
+        threading.Thread(target=replay_journals, args=(app,), name='journal-replay', daemon=True).start()
+
+def replay_journals(app):
+    with app.app_context():
+        try:
+            return WriteBehindJournal(app.config['WRITE_BEHIND_DIR'], app.config['WRITE_BEHIND_BATCH_SIZE'],
+                                      app.config['WRITE_BEHIND_INTERVAL'],
+                                      app.config['WRITE_BEHIND_JOURNAL_MAX_BYTES']).recover_all()
+        except Exception:
+            app.logger.exception('Replaying write-behind journals failed')
+
+# Read-your-writes: a user's requests wait for the entries they queued to be written;
+# further entries don't need to, the journal keeps them in order
+@bp.before_app_request
+def apply_pending_writes():
+    pending = browser_session.get('pending_writes')
+    if not pending or request.endpoint == 'main.add_financial_data' or not current_user.is_authenticated:
+        return
+    journal = current_app.extensions['write_behind']
+    timeout = current_app.config['WRITE_BEHIND_READ_TIMEOUT']
+    remaining = {name: seq for name, seq in pending.items()
+                 if journal is not None and not journal.wait_applied(current_user.id, name, seq, timeout)}
+    if remaining:
+        browser_session['pending_writes'] = remaining
+    else:
+        browser_session.pop('pending_writes')
+
+# Page templates are compiled once per app rather than on every request
+def render_page(source, **context):
+    templates = current_app.extensions['page_templates']
+    template = templates.get(source)
+    if template is None:
+        template = templates[source] = current_app.jinja_env.from_string(source)
+    return render_template(template, **context)
+
+# Front-end assets
+# Logical asset name -> content-hashed file name, from the manifest bundle-assets writes
+def asset_manifest():
+    manifest = current_app.extensions['asset_manifest']
+    if manifest is None:
+        try:
+            with open(os.path.join(current_app.config['ASSET_DIR'], 'manifest.json')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        current_app.extensions['asset_manifest'] = manifest
+    return manifest
+
+@bp.app_template_global()
+def asset_url(name):
+    hashed = asset_manifest().get(name)
+    if hashed is None:
+        return current_app.config['VENDOR_ASSETS'][name]
+    return url_for('main.asset', filename=hashed)
+
+def hashed_asset_name(name, content):
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
 
-    df = pd.DataFrame({
-        'month': range(1, len(user_data) + 1),
-        'expenses': [data.expenses for data in user_data]
-    })
+# Writes an asset and its precompressed copies, keeping a copy only when it is smaller
+def write_asset(directory, name, content):
+    variants = {'': content, '.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content, quality=11)
+    for suffix, data in variants.items():
+        if suffix and len(data) >= len(content):
+            continue
+        with open(os.path.join(directory, name + suffix), 'wb') as f:
+            f.write(data)
+    return {suffix: len(data) for suffix, data in variants.items()}
 
-    X = df[['month']]
-    y = df['expenses']
+# Compresses HTML and JSON responses; files, streams and small bodies are sent as they are
+@bp.after_app_request
+def compress_response(response):
+    config = current_app.config
+    if (not config['COMPRESS'] or response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300 or 'Content-Encoding' in response.headers
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < config['COMPRESS_MIN_SIZE']:
+        return response
 
-    model = LinearRegression()
-    model.fit(X, y)
+    if brotli is not None and request.accept_encodings['br']:
+        encoding, data = 'br', brotli.compress(response.get_data(), quality=config['COMPRESS_BROTLI_QUALITY'])
+    elif request.accept_encodings['gzip']:
+        encoding, data = 'gzip', gzip.compress(response.get_data(), compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
 
-    future_months = np.array([[len(user_data) + 1], [len(user_data) + 2], [len(user_data) + 3]])
-    predicted_expenses = model.predict(future_months)
+# Warmup
+# Runs synthetic work through the paths a first request would otherwise pay for: mapper
+# configuration, model loading and prediction, the NumPy/pandas code behind anomaly
+# scoring and forecasting, the efficient frontier and the page templates. Nothing is
+# written; the database steps are skipped until some user has data.
+def warmup(app):
+    state = app.extensions['warmup']
+    state['status'] = 'running'
+    started = time.perf_counter()
+    try:
+        with app.app_context():
+            configure_mappers()
+            rng = np.random.default_rng(0)
+            with warnings.catch_warnings():
+                # The full model's scaler warns about plain arrays on every call
+                warnings.simplefilter('ignore', UserWarning)
+                for income, expenses, debts, investments in rng.uniform(
+                        [1000, 500, 0, 0], [10000, 8000, 50000, 100000], (app.config['WARMUP_PREDICTIONS'], 4)):
+                    predict_savings_rate(income, expenses, debts, investments)
+            robust_anomaly_score(rng.normal(100, 10, (app.config['ANOMALY_WINDOW'], 3)), [100, 100, 100])
+            get_efficient_frontier()
 
-    return predicted_expenses.tolist()
+            # A user who already has a shard assignment (or any row) so no directory entry is written
+            if app.config['FINANCIAL_DATA_SHARDS']:
+                user_id = db.session.query(ShardAssignment.user_id).limit(1).scalar()
+            else:
+                user_id = db.session.query(FinancialData.user_id).limit(1).scalar()
+            if user_id is not None:
+                get_historical_data(user_id)
+                anomaly_detection(user_id)
+                compute_forecasts([user_id])
+            db.session.remove()
 
-# Enhanced goal-based planning function
-def goal_based_planning(target_amount, current_savings, years):
-    months = years * 12
-    required_savings_per_month = (target_amount - current_savings) / months
-    return required_savings_per_month
+        for endpoint in ('main.index', 'main.register', 'main.login', 'main.dashboard'):
+            with app.test_request_context():
+                view = app.view_functions[endpoint]
+                # Render the page behind @login_required without a logged-in user
+                getattr(view, '__wrapped__', view)()
+    except Exception as e:
+        app.logger.exception('Warmup failed')
+        state.update(status='failed', error=str(e))
+    else:
+        state['status'] = 'ready'
+    state['seconds'] = time.perf_counter() - started
 
-# Enhanced robo-advisory function
-def robo_advisory(risk_tolerance, current_savings, investments):
-    recommendations = []
-    if risk_tolerance == 'high':
-        recommendations = ['Stocks', 'Cryptocurrency', 'High Yield Bonds']
-    elif risk_tolerance == 'medium':
-        recommendations = ['Mutual Funds', 'Index Funds', 'Real Estate']
-    elif risk_tolerance == 'low':
-        recommendations = ['Bonds', 'Fixed Deposits', 'Treasury Bills']
+def start_warmup(app):
+    mode = app.config['WARMUP']
+    if mode == 'off':
+        app.extensions['warmup']['status'] = 'ready'
+    elif mode == 'background':
+        threading.Thread(target=warmup, args=(app,), name='warmup', daemon=True).start()
     else:
-        recommendations = ['Savings Account', 'Fixed Deposits']
-    
-    if current_savings < 1000:
-        recommendations.append('Increase savings before high-risk investments')
-    if investments < 5000:
-        recommendations.append('Consider diversifying investments')
-    
-    return recommendations
+        warmup(app)
 
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
-    return render_template_string('''
+    return render_page('''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Financial Health Assessment</title>
-        <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+        <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
         <style>
             .dark-mode {
                 background-color: #1a202c;
@@ -214,8 +2611,8 @@ def index():
         <div class="container mx-auto mt-8 text-center">
             <h1 class="text-4xl font-bold mb-8">Welcome to Financial Health Assessment</h1>
             <div class="space-x-4">
-                <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
-                <a href="{{ url_for('register') }}" class="bg-green-500 hover:bg-green-700 text-white font-bold py-2 px-4 rounded">Register</a>
+                <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
+                <a href="{{ url_for('main.register') }}" class="bg-green-500 hover:bg-green-700 text-white font-bold py-2 px-4 rounded">Register</a>
                 <button onclick="toggleDarkMode()" class="bg-gray-500 hover:bg-gray-700 text-white font-bold py-2 px-4 rounded">Toggle Dark Mode</button>
             </div>
         </div>
@@ -229,27 +2626,27 @@ def index():
     </html>
     ''')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
         if User.query.filter_by(username=username).first():
-            return render_template_string('''
+            return render_page('''
             <!DOCTYPE html>
             <html lang="en">
             <head>
                 <meta charset="UTF-8">
                 <meta name="viewport" content="width=device-width, initial-scale=1.0">
                 <title>Register - Financial Health Assessment</title>
-                <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+                <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
             </head>
             <body class="bg-gray-100">
                 <div class="container mx-auto mt-8">
                     <h1 class="text-3xl font-bold mb-4">Register</h1>
                     <p class="text-red-500 mb-4">Username already exists</p>
-                    <a href="{{ url_for('register') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
+                    <a href="{{ url_for('main.register') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
                 </div>
             </body>
             </html>
@@ -260,33 +2657,33 @@ def register():
         db.session.add(new_user)
         db.session.commit()
 
-        return render_template_string('''
+        return render_page('''
         <!DOCTYPE html>
         <html lang="en">
         <head>
             <meta charset="UTF-8">
             <meta name="viewport" content="width=device-width, initial-scale=1.0">
             <title>Register - Financial Health Assessment</title>
-            <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+            <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
         </head>
         <body class="bg-gray-100">
             <div class="container mx-auto mt-8">
                 <h1 class="text-3xl font-bold mb-4">Register</h1>
                 <p class="text-green-500 mb-4">Registration successful. Please log in.</p>
-                <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
+                <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
             </div>
         </body>
         </html>
         ''')
 
-    return render_template_string('''
+    return render_page('''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Register - Financial Health Assessment</title>
-        <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+        <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
     </head>
     <body class="bg-gray-100">
         <div class="container mx-auto mt-8">
@@ -308,7 +2705,7 @@ def register():
                     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline" type="submit">
                         Register
                     </button>
-                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('login') }}">
+                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('main.login') }}">
                         Already have an account? Login
                     </a>
                 </div>
@@ -318,7 +2715,7 @@ def register():
     </html>
     ''')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -327,35 +2724,35 @@ def login():
 
         if user and user.check_password(password):
             login_user(user)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
-            return render_template_string('''
+            return render_page('''
             <!DOCTYPE html>
             <html lang="en">
             <head>
                 <meta charset="UTF-8">
                 <meta name="viewport" content="width=device-width, initial-scale=1.0">
                 <title>Login - Financial Health Assessment</title>
-                <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+                <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
             </head>
             <body class="bg-gray-100">
                 <div class="container mx-auto mt-8">
                     <h1 class="text-3xl font-bold mb-4">Login</h1>
                     <p class="text-red-500 mb-4">Invalid username or password</p>
-                    <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
+                    <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
                 </div>
             </body>
             </html>
             ''')
 
-    return render_template_string('''
+    return render_page('''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Login - Financial Health Assessment</title>
-        <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
+        <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
     </head>
     <body class="bg-gray-100">
         <div class="container mx-auto mt-8">
@@ -377,7 +2774,7 @@ def login():
                     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline" type="submit">
                         Sign In
                     </button>
-                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('register') }}">
+                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('main.register') }}">
                         Don't have an account? Register
                     </a>
                 </div>
@@ -387,31 +2784,31 @@ def login():
     </html>
     ''')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template_string('''
+    return render_page('''
     <!DOCTYPE html>
     <html lang="en">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>Dashboard - Financial Health Assessment</title>
-        <link href="https://cdn.jsdelivr.net/npm/tailwindcss@2.2.19/dist/tailwind.min.css" rel="stylesheet">
-        <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-        <script src="https://code.jquery.com/jquery-3.6.0.min.js"></script>
+        <link href="{{ asset_url('tailwind.min.css') }}" rel="stylesheet">
+        <script src="{{ asset_url('chart.js') }}"></script>
+        <script src="{{ asset_url('jquery.min.js') }}"></script>
     </head>
     <body class="bg-gray-100" id="body">
         <nav class="bg-blue-600 p-4 text-white">
             <div class="container mx-auto flex justify-between items-center">
                 <h1 class="text-2xl font-bold">Financial Health Dashboard</h1>
-                <a href="{{ url_for('logout') }}" class="bg-red-500 hover:bg-red-600 px-4 py-2 rounded">Logout</a>
+                <a href="{{ url_for('main.logout') }}" class="bg-red-500 hover:bg-red-600 px-4 py-2 rounded">Logout</a>
                 <button onclick="toggleDarkMode()" class="bg-gray-500 hover:bg-gray-700 text-white font-bold py-2 px-4 rounded">Toggle Dark Mode</button>
             </div>
         </nav>
@@ -444,6 +2841,22 @@ def dashboard():
                         </label>
                         <input class="shadow appearance-none border rounded w-full py-2 px-3 text-gray-700 leading-tight focus:outline-none focus:shadow-outline" id="investments" type="number" step="0.01" required>
                     </div>
+                    <div class="col-span-2">
+                        <details>
+                            <summary class="text-gray-700 text-sm font-bold mb-2 cursor-pointer" title="Optionally split your monthly expenses by category.">
+                                Expense Breakdown (optional)
+                            </summary>
+                            <div class="grid grid-cols-3 gap-4">
+                                {% for category in expense_categories %}
+                                <div>
+                                    <label class="block text-gray-700 text-sm mb-2" for="expense_{{ loop.index0 }}">{{ category }}</label>
+                                    <input class="expense-category shadow appearance-none border rounded w-full py-2 px-3 text-gray-700 leading-tight focus:outline-none focus:shadow-outline" id="expense_{{ loop.index0 }}" data-category="{{ category }}" type="number" step="0.01" min="0">
+                                </div>
+                                {% endfor %}
+                            </div>
+                            <p class="text-gray-600 text-xs mt-2">Expenses not assigned to a category count as {{ expense_categories[-1] }}.</p>
+                        </details>
+                    </div>
                     <div class="col-span-2">
                         <button type="submit" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline">
                             Submit
@@ -452,13 +2865,52 @@ def dashboard():
                 </form>
             </div>
 
+            <div class="bg-white shadow-md rounded px-8 pt-6 pb-8 mb-4">
+                <h2 class="text-xl font-bold mb-4">Import Bank Statement</h2>
+                <form id="statementImportForm" class="grid grid-cols-2 gap-4">
+                    <div class="col-span-2">
+                        <label class="block text-gray-700 text-sm font-bold mb-2" for="statement" title="A CSV or OFX/QFX export from your bank. Each month in it becomes one entry.">
+                            Statement File (CSV or OFX)
+                        </label>
+                        <input class="w-full text-gray-700" id="statement" type="file" accept=".csv,.ofx,.qfx" required>
+                    </div>
+                    <div>
+                        <label class="block text-gray-700 text-sm font-bold mb-2" for="importDebts" title="Leave empty to keep your latest total debts.">
+                            Total Debts (optional)
+                        </label>
+                        <input class="shadow appearance-none border rounded w-full py-2 px-3 text-gray-700 leading-tight focus:outline-none focus:shadow-outline" id="importDebts" type="number" step="0.01">
+                    </div>
+                    <div>
+                        <label class="block text-gray-700 text-sm font-bold mb-2" for="importInvestments" title="Leave empty to keep your latest total investments.">
+                            Total Investments (optional)
+                        </label>
+                        <input class="shadow appearance-none border rounded w-full py-2 px-3 text-gray-700 leading-tight focus:outline-none focus:shadow-outline" id="importInvestments" type="number" step="0.01">
+                    </div>
+                    <div class="col-span-2">
+                        <button type="submit" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline">
+                            Import
+                        </button>
+                        <span id="statementImportResult" class="ml-4 text-gray-700 text-sm"></span>
+                    </div>
+                </form>
+            </div>
+
             <div id="financialHealthResults" class="bg-white shadow-md rounded px-8 pt-6 pb-8 mb-4 hidden">
                 <h2 class="text-xl font-bold mb-4">Financial Health Assessment</h2>
                 <div id="results" class="grid grid-cols-2 gap-4"></div>
             </div>
 
             <div id="graphs" class="bg-white shadow-md rounded px-8 pt-6 pb-8 mb-4 hidden">
-                <h2 class="text-xl font-bold mb-4">Financial Trends</h2>
+                <div class="flex justify-between items-center mb-4">
+                    <h2 class="text-xl font-bold">Financial Trends</h2>
+                    <select id="historyRange" class="shadow border rounded py-1 px-2 text-gray-700" title="Limit charts, table and tools to a recent period.">
+                        <option value="">All history</option>
+                        <option value="3m">Last 3 months</option>
+                        <option value="6m">Last 6 months</option>
+                        <option value="12m">Last 12 months</option>
+                        <option value="2y">Last 2 years</option>
+                    </select>
+                </div>
                 <div class="grid grid-cols-2 gap-4">
                     <div>
                         <canvas id="incomeExpenseChart"></canvas>
@@ -477,19 +2929,24 @@ def dashboard():
 
             <div id="historicalData" class="bg-white shadow-md rounded px-8 pt-6 pb-8 mb-4 hidden">
                 <h2 class="text-xl font-bold mb-4">Historical Financial Data</h2>
-                <table id="dataTable" class="w-full">
+                <table id="dataTableHead" class="w-full" style="table-layout: fixed;">
                     <thead>
                         <tr>
-                            <th class="px-4 py-2">Date</th>
-                            <th class="px-4 py-2">Income</th>
-                            <th class="px-4 py-2">Expenses</th>
-                            <th class="px-4 py-2">Debts</th>
-                            <th class="px-4 py-2">Investments</th>
-                            <th class="px-4 py-2">Savings Rate</th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="date">Date <span></span></th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="income">Income <span></span></th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="expenses">Expenses <span></span></th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="debts">Debts <span></span></th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="investments">Investments <span></span></th>
+                            <th class="px-4 py-2 cursor-pointer" data-sort="savings_rate">Savings Rate <span></span></th>
                         </tr>
                     </thead>
-                    <tbody></tbody>
                 </table>
+                <div id="dataTableViewport" style="height: 480px; overflow-y: auto; position: relative;">
+                    <div id="dataTableSpacer"></div>
+                    <table id="dataTable" class="w-full" style="table-layout: fixed; position: absolute; top: 0; left: 0;">
+                        <tbody></tbody>
+                    </table>
+                </div>
             </div>
 
             <div id="additionalTools" class="bg-white shadow-md rounded px-8 pt-6 pb-8 mb-4">
@@ -521,47 +2978,210 @@ def dashboard():
             $(document).ready(function() {
                 $('#financialDataForm').on('submit', function(e) {
                     e.preventDefault();
+                    let data = {
+                        income: $('#income').val(),
+                        expenses: $('#expenses').val(),
+                        debts: $('#debts').val(),
+                        investments: $('#investments').val()
+                    };
+                    $('.expense-category').each(function() {
+                        if ($(this).val()) {
+                            data['expense_' + $(this).attr('data-category')] = $(this).val();
+                        }
+                    });
                     $.ajax({
                         url: '/add_financial_data',
                         method: 'POST',
-                        data: {
-                            income: $('#income').val(),
-                            expenses: $('#expenses').val(),
-                            debts: $('#debts').val(),
-                            investments: $('#investments').val()
-                        },
+                        data: data,
                         success: function(response) {
                             if (response.success) {
-                                alert('Financial data added successfully!');
+                                $('#financialDataForm')[0].reset();
+                                // Fetched even with a live event stream: the event comes from the
+                                // worker that stored the row, which needn't be the one streaming
+                                // to this page (applyFinancialUpdate skips rows we already have)
                                 updateFinancialHealth();
                             }
+                        },
+                        error: function(xhr) {
+                            if (xhr.responseJSON && xhr.responseJSON.error) {
+                                alert(xhr.responseJSON.error);
+                            }
+                        }
+                    });
+                });
+
+                const EXPENSE_COLORS = ['rgb(255, 99, 132)', 'rgb(54, 162, 235)', 'rgb(255, 206, 86)', 'rgb(75, 192, 192)', 'rgb(153, 102, 255)', 'rgb(255, 159, 64)'];
+                $('#statementImportForm').on('submit', function(e) {
+                    e.preventDefault();
+                    let data = new FormData();
+                    data.append('statement', $('#statement')[0].files[0]);
+                    data.append('debts', $('#importDebts').val());
+                    data.append('investments', $('#importInvestments').val());
+                    $('#statementImportResult').text('Importing...');
+                    $.ajax({
+                        url: '/import_statement',
+                        method: 'POST',
+                        data: data,
+                        processData: false,
+                        contentType: false,
+                        success: function(response) {
+                            let result = `Imported ${response.imported_months.length} months from ${response.transactions} transactions.`;
+                            if (response.skipped_months.length) {
+                                result += ` Skipped ${response.skipped_months.length} months that already had entries.`;
+                            }
+                            $('#statementImportResult').text(result);
+                            $('#statementImportForm')[0].reset();
+                            updateFinancialHealth(true);
+                        },
+                        error: function(xhr) {
+                            $('#statementImportResult').text(xhr.responseJSON && xhr.responseJSON.error ? xhr.responseJSON.error : 'The import failed.');
                         }
                     });
                 });
 
-                function updateFinancialHealth() {
+                let historicalData = null;
+                // Where our copy of the history ends; sent back to fetch only what was added
+                let historyCursor = null;
+                let charts = null;
+
+                if (window.EventSource) {
+                    let events = new EventSource('/events');
+                    events.addEventListener('financial_data', function(e) {
+                        applyFinancialUpdate(JSON.parse(e.data));
+                    });
+                }
+
+                function rangeParams() {
+                    let last = $('#historyRange').val();
+                    return last ? { last: last } : {};
+                }
+
+                $('#historyRange').on('change', function() {
+                    updateFinancialHealth(true);
+                });
+
+                function showResults(response) {
+                    $('#financialHealthResults').removeClass('hidden');
+                    $('#graphs').removeClass('hidden');
+                    $('#historicalData').removeClass('hidden');
+                    $('#results').html(`
+                        <p><strong>Savings Rate:</strong> ${response.savings_rate.toFixed(2)}%</p>
+                        <p><strong>Debt-to-Income Ratio:</strong> ${response.debt_to_income_ratio.toFixed(2)}%</p>
+                        <p><strong>Investment-to-Income Ratio:</strong> ${response.investment_to_income_ratio.toFixed(2)}%</p>
+                        <p><strong>Predicted Savings Rate:</strong> ${response.predicted_savings_rate.toFixed(2)}%</p>
+                    `);
+                }
+
+                // With full (or without a cursor yet) the whole history is fetched; otherwise the
+                // server sends only the points added since, or everything if it can't
+                function updateFinancialHealth(full) {
+                    let params = rangeParams();
+                    let sentCursor = null;
+                    if (!full && historyCursor !== null && historicalData !== null) {
+                        sentCursor = historyCursor.id;
+                        params.after_id = historyCursor.id;
+                        params.points = historyCursor.points;
+                    }
                     $.ajax({
                         url: '/get_financial_health',
                         method: 'GET',
+                        data: params,
+                        success: function(response) {
+                            if (response.error) {
+                                return;
+                            }
+                            if (response.append && historyCursor.id !== sentCursor) {
+                                // A live event extended the history while this request was out,
+                                // so the points may overlap it: start over from the full history
+                                updateFinancialHealth(true);
+                                return;
+                            }
+                            if (response.append && historicalData !== null) {
+                                appendHistory(response.historical_data);
+                            } else {
+                                historicalData = response.historical_data;
+                            }
+                            historyCursor = response.cursor;
+                            showResults(response);
+                            updateCharts(historicalData);
+                            updateExpenseBreakdown();
+                            reloadHistoryTable();
+                        }
+                    });
+                }
+
+                // The pie is filled from the monthly category totals of the selected range
+                function updateExpenseBreakdown() {
+                    $.ajax({
+                        url: '/expense_breakdown',
+                        method: 'GET',
+                        data: rangeParams(),
                         success: function(response) {
-                            $('#financialHealthResults').removeClass('hidden');
-                            $('#graphs').removeClass('hidden');
-                            $('#historicalData').removeClass('hidden');
-                            $('#results').html(`
-                                <p><strong>Savings Rate:</strong> ${response.savings_rate.toFixed(2)}%</p>
-                                <p><strong>Debt-to-Income Ratio:</strong> ${response.debt_to_income_ratio.toFixed(2)}%</p>
-                                <p><strong>Investment-to-Income Ratio:</strong> ${response.investment_to_income_ratio.toFixed(2)}%</p>
-                                <p><strong>Predicted Savings Rate:</strong> ${response.predicted_savings_rate.toFixed(2)}%</p>
-                            `);
-
-                            updateCharts(response.historical_data);
-                            updateHistoricalDataTable(response.historical_data);
+                            if (response.error || charts === null) {
+                                return;
+                            }
+                            charts.expenseBreakdown.data.labels = response.categories;
+                            charts.expenseBreakdown.data.datasets[0].data = response.totals;
+                            charts.expenseBreakdown.data.datasets[0].backgroundColor =
+                                response.categories.map((_, i) => EXPENSE_COLORS[i % EXPENSE_COLORS.length]);
+                            charts.expenseBreakdown.update();
                         }
                     });
                 }
 
+                function appendHistory(points) {
+                    for (let key in points) {
+                        historicalData[key].push(...points[key]);
+                    }
+                }
+
+                function applyFinancialUpdate(update) {
+                    if (historicalData === null) {
+                        updateFinancialHealth();
+                        return;
+                    }
+                    if (historyCursor !== null && update.row.id <= historyCursor.id) {
+                        // Already fetched after our own submit
+                        return;
+                    }
+                    appendHistory({
+                        dates: [update.row.date],
+                        incomes: [update.row.income],
+                        expenses: [update.row.expenses],
+                        debts: [update.row.debts],
+                        investments: [update.row.investments],
+                        savings_rates: [update.row.savings_rate]
+                    });
+                    if (historyCursor !== null) {
+                        historyCursor.id = Math.max(historyCursor.id, update.row.id);
+                        historyCursor.points++;
+                    }
+                    showResults(update);
+                    updateCharts(historicalData);
+                    updateExpenseBreakdown();
+                    reloadHistoryTable();
+                }
+
+                // The charts are created once; later calls point them at the current arrays and
+                // let Chart.js redraw only what changed
                 function updateCharts(data) {
-                    new Chart(document.getElementById('incomeExpenseChart'), {
+                    if (charts !== null) {
+                        charts.incomeExpense.data.labels = data.dates;
+                        charts.incomeExpense.data.datasets[0].data = data.incomes;
+                        charts.incomeExpense.data.datasets[1].data = data.expenses;
+                        charts.savingsRate.data.labels = data.dates;
+                        charts.savingsRate.data.datasets[0].data = data.savings_rates;
+                        charts.debtInvestment.data.labels = data.dates;
+                        charts.debtInvestment.data.datasets[0].data = data.debts;
+                        charts.debtInvestment.data.datasets[1].data = data.investments;
+                        charts.incomeExpense.update();
+                        charts.savingsRate.update();
+                        charts.debtInvestment.update();
+                        return;
+                    }
+                    charts = {};
+
+                    charts.incomeExpense = new Chart(document.getElementById('incomeExpenseChart'), {
                         type: 'line',
                         data: {
                             labels: data.dates,
@@ -589,7 +3209,7 @@ def dashboard():
                         }
                     });
 
-                    new Chart(document.getElementById('savingsRateChart'), {
+                    charts.savingsRate = new Chart(document.getElementById('savingsRateChart'), {
                         type: 'line',
                         data: {
                             labels: data.dates,
@@ -609,7 +3229,7 @@ def dashboard():
                         }
                     });
 
-                    new Chart(document.getElementById('debtInvestmentChart'), {
+                    charts.debtInvestment = new Chart(document.getElementById('debtInvestmentChart'), {
                         type: 'line',
                         data: {
                             labels: data.dates,
@@ -638,15 +3258,16 @@ def dashboard():
                     });
 
                     // Expense Breakdown Chart
+                    // Filled in by updateExpenseBreakdown
                     let expenseBreakdownData = {
-                        labels: ['Rent', 'Groceries', 'Utilities', 'Transport', 'Entertainment', 'Others'],
+                        labels: [],
                         datasets: [{
-                            data: [30, 20, 15, 10, 15, 10], // Example data
-                            backgroundColor: ['rgb(255, 99, 132)', 'rgb(54, 162, 235)', 'rgb(255, 206, 86)', 'rgb(75, 192, 192)', 'rgb(153, 102, 255)', 'rgb(255, 159, 64)'],
+                            data: [],
+                            backgroundColor: [],
                         }]
                     };
 
-                    new Chart(document.getElementById('expenseBreakdownChart'), {
+                    charts.expenseBreakdown = new Chart(document.getElementById('expenseBreakdownChart'), {
                         type: 'pie',
                         data: expenseBreakdownData,
                         options: {
@@ -659,27 +3280,133 @@ def dashboard():
                     });
                 }
 
-                function updateHistoricalDataTable(data) {
-                    let tableBody = $('#dataTable tbody');
-                    tableBody.empty();
-                    for (let i = 0; i < data.dates.length; i++) {
-                        tableBody.append(`
-                            <tr>
-                                <td class="border px-4 py-2">${data.dates[i]}</td>
-                                <td class="border px-4 py-2">$${data.incomes[i].toFixed(2)}</td>
-                                <td class="border px-4 py-2">$${data.expenses[i].toFixed(2)}</td>
-                                <td class="border px-4 py-2">$${data.debts[i].toFixed(2)}</td>
-                                <td class="border px-4 py-2">$${data.investments[i].toFixed(2)}</td>
-                                <td class="border px-4 py-2">${data.savings_rates[i].toFixed(2)}%</td>
-                            </tr>
-                        `);
+                // History table: rows come from the server a page at a time (sorted there) and
+                // only the rows in view, plus a margin, are in the DOM. At most
+                // HISTORY_MAX_PAGES pages are kept, so memory doesn't grow with the history.
+                const HISTORY_ROW_HEIGHT = 40;
+                const HISTORY_PAGE_SIZE = 100;
+                const HISTORY_MAX_PAGES = 10;
+                const HISTORY_MARGIN_ROWS = 10;
+                let historyTable = {
+                    sort: 'date', order: 'desc', total: 0,
+                    pages: new Map(), loading: new Set(), generation: 0, frame: null
+                };
+
+                function reloadHistoryTable() {
+                    historyTable.generation++;
+                    historyTable.pages.clear();
+                    historyTable.loading.clear();
+                    $('#dataTableHead th span').text('');
+                    $(`#dataTableHead th[data-sort="${historyTable.sort}"] span`).text(historyTable.order === 'desc' ? '\u25BC' : '\u25B2');
+                    scheduleHistoryRender();
+                }
+
+                function fetchHistoryPage(page) {
+                    if (historyTable.pages.has(page) || historyTable.loading.has(page)) {
+                        return;
+                    }
+                    historyTable.loading.add(page);
+                    let generation = historyTable.generation;
+                    $.ajax({
+                        url: '/financial_data_history',
+                        method: 'GET',
+                        data: Object.assign({
+                            offset: page * HISTORY_PAGE_SIZE,
+                            limit: HISTORY_PAGE_SIZE,
+                            sort: historyTable.sort,
+                            order: historyTable.order
+                        }, rangeParams()),
+                        success: function(response) {
+                            // A reload (new sort, range or data) happened since this request
+                            if (generation !== historyTable.generation) {
+                                return;
+                            }
+                            historyTable.loading.delete(page);
+                            historyTable.total = response.total;
+                            historyTable.pages.set(page, response.rows);
+                            let current = Math.floor(visibleHistoryRows()[0] / HISTORY_PAGE_SIZE);
+                            while (historyTable.pages.size > HISTORY_MAX_PAGES) {
+                                let furthest = [...historyTable.pages.keys()].reduce(
+                                    (a, b) => Math.abs(a - current) >= Math.abs(b - current) ? a : b);
+                                historyTable.pages.delete(furthest);
+                            }
+                            $('#dataTableSpacer').css('height', `${response.total * HISTORY_ROW_HEIGHT}px`);
+                            scheduleHistoryRender();
+                        },
+                        error: function() {
+                            if (generation === historyTable.generation) {
+                                historyTable.loading.delete(page);
+                            }
+                        }
+                    });
+                }
+
+                function visibleHistoryRows() {
+                    let viewport = document.getElementById('dataTableViewport');
+                    let first = Math.max(0, Math.floor(viewport.scrollTop / HISTORY_ROW_HEIGHT) - HISTORY_MARGIN_ROWS);
+                    let last = Math.ceil((viewport.scrollTop + viewport.clientHeight) / HISTORY_ROW_HEIGHT) + HISTORY_MARGIN_ROWS;
+                    return [first, last];
+                }
+
+                function scheduleHistoryRender() {
+                    if (historyTable.frame === null) {
+                        historyTable.frame = requestAnimationFrame(renderHistoryTable);
+                    }
+                }
+
+                // Builds the visible rows as one string and swaps them in with a single DOM update
+                function renderHistoryTable() {
+                    historyTable.frame = null;
+                    let [first, last] = visibleHistoryRows();
+                    if (historyTable.pages.size) {
+                        last = Math.min(last, historyTable.total);
+                    }
+                    let html = '';
+                    for (let i = first; i < last; i++) {
+                        let page = Math.floor(i / HISTORY_PAGE_SIZE);
+                        let rows = historyTable.pages.get(page);
+                        if (rows === undefined) {
+                            fetchHistoryPage(page);
+                            html += `<tr style="height: ${HISTORY_ROW_HEIGHT}px;"><td class="border px-4 py-2 text-gray-400" colspan="6">Loading...</td></tr>`;
+                            continue;
+                        }
+                        let row = rows[i % HISTORY_PAGE_SIZE];
+                        if (row === undefined) {
+                            break;
+                        }
+                        html += `
+                            <tr style="height: ${HISTORY_ROW_HEIGHT}px;">
+                                <td class="border px-4 py-2">${row.date}</td>
+                                <td class="border px-4 py-2">$${row.income.toFixed(2)}</td>
+                                <td class="border px-4 py-2">$${row.expenses.toFixed(2)}</td>
+                                <td class="border px-4 py-2">$${row.debts.toFixed(2)}</td>
+                                <td class="border px-4 py-2">$${row.investments.toFixed(2)}</td>
+                                <td class="border px-4 py-2">${row.savings_rate.toFixed(2)}%</td>
+                            </tr>`;
                     }
+                    document.getElementById('dataTable').style.transform = `translateY(${first * HISTORY_ROW_HEIGHT}px)`;
+                    document.querySelector('#dataTable tbody').innerHTML = html;
                 }
 
+                $('#dataTableViewport').on('scroll', scheduleHistoryRender);
+
+                $('#dataTableHead th[data-sort]').on('click', function() {
+                    let sort = $(this).data('sort');
+                    if (sort === historyTable.sort) {
+                        historyTable.order = historyTable.order === 'desc' ? 'asc' : 'desc';
+                    } else {
+                        historyTable.sort = sort;
+                        historyTable.order = 'desc';
+                    }
+                    document.getElementById('dataTableViewport').scrollTop = 0;
+                    reloadHistoryTable();
+                });
+
                 $('#anomalyDetectionBtn').on('click', function() {
                     $.ajax({
                         url: '/anomaly_detection',
                         method: 'GET',
+                        data: rangeParams(),
                         success: function(response) {
                             let anomaliesHTML = '<h3 class="text-xl font-bold mb-2">Detected Anomalies</h3>';
                             response.forEach(anomaly => {
@@ -694,9 +3421,14 @@ def dashboard():
                     $.ajax({
                         url: '/financial_forecasting',
                         method: 'GET',
+                        data: rangeParams(),
                         success: function(response) {
                             let forecastHTML = '<h3 class="text-xl font-bold mb-2">Financial Forecasting</h3>';
-                            forecastHTML += `<p>Predicted Expenses for the next three months: $${response[0].toFixed(2)}, $${response[1].toFixed(2)}, $${response[2].toFixed(2)}</p>`;
+                            forecastHTML += '<table class="w-full"><thead><tr><th class="px-4 py-2">Month</th><th class="px-4 py-2">Income</th><th class="px-4 py-2">Expenses</th><th class="px-4 py-2">Savings Rate</th></tr></thead><tbody>';
+                            response.months.forEach((month, i) => {
+                                forecastHTML += `<tr><td class="border px-4 py-2">${month}</td><td class="border px-4 py-2">$${response.income[i].toFixed(2)}</td><td class="border px-4 py-2">$${response.expenses[i].toFixed(2)}</td><td class="border px-4 py-2">${response.savings_rate[i].toFixed(2)}%</td></tr>`;
+                            });
+                            forecastHTML += '</tbody></table>';
                             $('#additionalToolsResults').html(forecastHTML);
                         }
                     });
@@ -715,7 +3447,20 @@ def dashboard():
                             years: years
                         },
                         success: function(response) {
-                            $('#additionalToolsResults').html(`<h3 class="text-xl font-bold mb-2">Goal-Based Planning</h3><p>You need to save $${response.toFixed(2)} per month to reach your target.</p>`);
+                            let planHTML = '<h3 class="text-xl font-bold mb-2">Goal-Based Planning</h3>';
+                            planHTML += `<p>Without investment returns you need to save $${response.required_savings_per_month.toFixed(2)} per month to reach your target.</p>`;
+                            planHTML += `<p>Saving $${response.monthly_contribution.toFixed(2)} per month gives a ${(response.probability_of_success * 100).toFixed(1)}% chance of reaching your target (${response.paths} simulated paths, after inflation).</p><ul>`;
+                            Object.entries(response.required_contribution).forEach(([level, amount]) => {
+                                let confidence = (parseFloat(level) * 100).toFixed(0);
+                                planHTML += `<li>${confidence}% confidence: save $${amount.toFixed(2)} per month</li>`;
+                            });
+                            planHTML += '</ul>';
+                            $('#additionalToolsResults').html(planHTML);
+                        },
+                        error: function(xhr) {
+                            if (xhr.responseJSON && xhr.responseJSON.error) {
+                                alert(xhr.responseJSON.error);
+                            }
                         }
                     });
                 });
@@ -729,8 +3474,13 @@ def dashboard():
                         method: 'POST',
                         data: { risk_tolerance: riskTolerance, current_savings: currentSavings, investments: investments },
                         success: function(response) {
-                            let advisoryHTML = '<h3 class="text-xl font-bold mb-2">Robo-Advisory Recommendations</h3><ul>';
-                            response.forEach(suggestion => {
+                            let advisoryHTML = '<h3 class="text-xl font-bold mb-2">Robo-Advisory Recommendations</h3>';
+                            advisoryHTML += `<p>Expected return ${(response.expected_return * 100).toFixed(1)}% per year, volatility ${(response.volatility * 100).toFixed(1)}%.</p><ul>`;
+                            response.allocation.forEach(item => {
+                                advisoryHTML += `<li>${item.asset}: ${(item.weight * 100).toFixed(1)}% ($${item.amount.toFixed(2)})</li>`;
+                            });
+                            advisoryHTML += '</ul><ul>';
+                            response.recommendations.forEach(suggestion => {
                                 advisoryHTML += `<li>${suggestion}</li>`;
                             });
                             advisoryHTML += '</ul>';
@@ -744,80 +3494,587 @@ def dashboard():
         </script>
     </body>
     </html>
-    ''')
+    ''', expense_categories=current_app.config['EXPENSE_CATEGORIES'])
 
-@app.route('/add_financial_data', methods=['POST'])
+@bp.route('/add_financial_data', methods=['POST'])
 @login_required
 def add_financial_data():
-    income = float(request.form.get('income'))
-    expenses = float(request.form.get('expenses'))
-    debts = float(request.form.get('debts'))
-    investments = float(request.form.get('investments'))
+    # Checked up front: with write-behind, the entry is journaled before it is ever stored
+    try:
+        income, expenses, debts, investments = (form_number(request.form, name)
+                                                for name in ('income', 'expenses', 'debts', 'investments'))
+
+        # Optional per-category split of the expenses; whatever is left over is counted as the catch-all
+        categories = {}
+        for category in current_app.config['EXPENSE_CATEGORIES']:
+            value = form_number(request.form, f'expense_{category}', required=False)
+            if value is not None:
+                categories[category] = value
+        split_expenses(expenses, categories)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    journal = current_app.extensions['write_behind']
+    if journal is not None:
+        name, seq = journal.append(current_user.id, datetime.utcnow(), income, expenses, debts, investments,
+                                   categories)
+        pending = browser_session.get('pending_writes', {})
+        pending[name] = seq
+        browser_session['pending_writes'] = pending
+        return jsonify({'success': True, 'queued': True})
+
+    session = financial_data_session(current_user.id)
+    new_data = store_financial_data(session, current_user.id, datetime.utcnow(), income, expenses, debts, investments,
+                                    categories)
+    session.commit()
 
+    publish_financial_update(current_user.id, new_data)
+
+    return jsonify({'success': True})
+
+# Function to score a new entry and add it, with its feature store and category totals updates, to the session
+# With online=False (a back-dated entry) it is neither scored nor folded into the features,
+# which assume it is the latest: the caller rebuilds them once its entries are written
+def store_financial_data(session, user_id, date, income, expenses, debts, investments, categories=None, online=True):
+    # The features, monthly stats and category totals are read, updated and written back;
+    # holding the write lock from the first read keeps concurrent writers from interleaving
+    begin_transaction(session, immediate=True)
     savings_rate, _, _ = calculate_financial_health(income, expenses, debts, investments)
+    anomaly_score, is_anomaly = None, None
+    if online:
+        anomaly_score, is_anomaly = score_financial_data(session, user_id, income, expenses, savings_rate)
 
     new_data = FinancialData(
-        user_id=current_user.id,
+        user_id=user_id,
+        date=date,
         income=income,
         expenses=expenses,
         debts=debts,
         investments=investments,
-        savings_rate=savings_rate
+        savings_rate=savings_rate,
+        anomaly_score=anomaly_score,
+        is_anomaly=is_anomaly
     )
+    items = split_expenses(expenses, categories)
+    new_data.expense_items = [ExpenseItem(category=category, amount=amount) for category, amount in items.items()]
 
-    db.session.add(new_data)
-    db.session.commit()
+    session.add(new_data)
+    if online:
+        update_features(session, new_data)
+    else:
+        # The features are rebuilt once the caller is done; the data version moves on now
+        (session.query(UserFeatures).filter_by(user_id=user_id)
+         .update({UserFeatures.updated_at: datetime.utcnow()}, synchronize_session=False))
+    update_category_totals(session, user_id, date.strftime('%Y-%m'), items)
+    return new_data
 
-    return jsonify({'success': True})
+# Statement import
+# Transactions are read a chunk at a time (CSV through pandas, OFX with a streaming tag
+# scanner), categorized a chunk at a time and folded into running per-month totals, so
+# memory depends on the chunk size and the number of months, not on the file size.
+# Credits count as income and debits as expenses; every month becomes one entry.
 
-@app.route('/get_financial_health', methods=['GET'])
-@login_required
-def get_financial_health():
-    latest_data = FinancialData.query.filter_by(user_id=current_user.id).order_by(FinancialData.date.desc()).first()
+# Function to build a regular expression matching any of the keywords, as a trie so
+# keywords sharing a prefix share the work of matching it
+def keyword_pattern(keywords):
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
 
-    if not latest_data:
-        return jsonify({'error': 'No financial data available'})
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ends here but longer ones continue: the rest is optional
+        return f'(?:{pattern})?' if '' in node else pattern
 
-    savings_rate, debt_to_income_ratio, investment_to_income_ratio = calculate_financial_health(
-        latest_data.income, latest_data.expenses, latest_data.debts, latest_data.investments
-    )
+    return r'\b' + build(trie) + r'\b'
 
-    predicted_savings_rate = predict_savings_rate(
-        latest_data.income, latest_data.expenses, latest_data.debts, latest_data.investments
-    )
+class TransactionCategorizer:
+    def __init__(self, keywords, patterns, default):
+        self.default = default
+        self.rules = []
+        for category in list(dict.fromkeys(list(keywords) + list(patterns))):
+            alternatives = [keyword_pattern(keywords[category])] if keywords.get(category) else []
+            alternatives += patterns.get(category, [])
+            self.rules.append((category, re.compile('|'.join(f'(?:{a})' for a in alternatives), re.IGNORECASE)))
+
+    # Descriptions repeat (the same shops and payees every month), so the rules run once
+    # per distinct description in the chunk and the result is mapped back to every row
+    def categorize(self, descriptions):
+        codes, uniques = pd.factorize(descriptions.fillna('').astype(str))
+        uniques = pd.Series(uniques)
+        matches = [uniques.str.contains(pattern, regex=True).to_numpy() for _, pattern in self.rules]
+        categories = np.select(matches, [category for category, _ in self.rules], self.default) if matches \
+            else np.full(len(uniques), self.default, dtype=object)
+        return pd.Series(np.asarray(categories, dtype=object)[codes], index=descriptions.index)
+
+# Column names recognised in CSV exports (compared in lower case)
+CSV_DATE_COLUMNS = ['date', 'transaction date', 'posted date', 'posting date', 'booking date', 'value date']
+CSV_DESCRIPTION_COLUMNS = ['description', 'details', 'name', 'payee', 'merchant', 'memo', 'narrative', 'reference']
+CSV_AMOUNT_COLUMNS = ['amount', 'transaction amount', 'value']
+CSV_DEBIT_COLUMNS = ['debit', 'debit amount', 'withdrawal', 'withdrawals', 'paid out', 'money out']
+CSV_CREDIT_COLUMNS = ['credit', 'credit amount', 'deposit', 'deposits', 'paid in', 'money in']
+
+def statement_format(filename):
+    return 'ofx' if os.path.splitext(filename)[1].lower() in ('.ofx', '.qfx') else 'csv'
+
+# A CSV amount: a number with thousands separators, signed by a leading or trailing minus or
+# by (accounting) parentheses, optionally with a currency symbol or code around it
+def amount_pattern(decimal_comma):
+    point, thousands = (',', r"[.\s\u00a0\u202f']") if decimal_comma else (r'\.', r"[,\s\u00a0\u202f']")
+    number = rf'(?:\d{{1,3}}(?:{thousands}\d{{3}})+|\d+)(?:{point}\d*)?|{point}\d+'
+    currency = r'(?:[$€£¥₹¢]|[A-Z]{3}|[A-Z]{1,2}\$)?'
+    return (rf'^\s*(?P<open>\()?\s*(?P<sign>[-+])?\s*{currency}\s*(?P<inner_sign>[-+])?\s*(?P<number>{number})'
+            rf'\s*(?P<trailing_sign>-)?\s*{currency}\s*(?P<close>\))?\s*$'), thousands, point
+
+# Function to parse a column of CSV amounts; anything that doesn't read unambiguously as an
+# amount (a decimal comma without IMPORT_DECIMAL_COMMA, a CR/DR suffix) becomes NaN and its
+# row is skipped rather than imported with the wrong value or sign
+def parse_amounts(values, decimal_comma=False):
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_numeric(values, errors='coerce')
+    # Most amounts are plain numbers, which to_numeric reads much faster than the pattern;
+    # with a decimal comma, a dot is a thousands separator and must go through the pattern
+    plain = values.where(~values.str.contains('.', regex=False, na=False)) if decimal_comma else values
+    amounts = pd.to_numeric(plain, errors='coerce').astype('float64')
+    amounts = amounts.where(np.isfinite(amounts))
+    rest = amounts.isna() & values.notna()
+    if not rest.any():
+        return amounts
+
+    pattern, thousands, point = amount_pattern(decimal_comma)
+    parts = values[rest].astype(object).str.extract(pattern)
+    number = parts['number'].str.replace(thousands, '', regex=True).str.replace(point, '.', regex=True)
+    parsed = pd.to_numeric(number, errors='coerce')
+    negative = (parts['open'].notna() | parts['sign'].eq('-') | parts['inner_sign'].eq('-')
+                | parts['trailing_sign'].eq('-'))
+    balanced = parts['open'].notna() == parts['close'].notna()
+    amounts[rest] = parsed.mask(negative, -parsed).where(balanced)
+    return amounts
+
+# OFX amounts carry no thousands separators; the format allows either decimal mark
+def parse_ofx_amounts(values):
+    return pd.to_numeric(values.str.strip().str.replace(',', '.', regex=False), errors='coerce')
+
+# Generator of DataFrames with date, description and amount (negative for debits) columns
+def csv_transaction_chunks(stream, chunk_rows, dayfirst=False, decimal_comma=False):
+    columns = None
+    for chunk in pd.read_csv(stream, chunksize=chunk_rows, dtype=str, skipinitialspace=True, encoding_errors='replace'):
+        if columns is None:
+            names = {name.strip().lower(): name for name in chunk.columns}
+            find = lambda candidates: next((names[c] for c in candidates if c in names), None)
+            columns = {'date': find(CSV_DATE_COLUMNS), 'description': find(CSV_DESCRIPTION_COLUMNS),
+                       'amount': find(CSV_AMOUNT_COLUMNS), 'debit': find(CSV_DEBIT_COLUMNS),
+                       'credit': find(CSV_CREDIT_COLUMNS)}
+            if columns['date'] is None or (columns['amount'] is None and columns['debit'] is None
+                                           and columns['credit'] is None):
+                raise ValueError('The CSV needs a date column and an amount (or debit/credit) column')
+        if columns['amount'] is not None:
+            amounts = parse_amounts(chunk[columns['amount']], decimal_comma)
+        else:
+            debits = parse_amounts(chunk[columns['debit']], decimal_comma).abs() if columns['debit'] else 0
+            credits = parse_amounts(chunk[columns['credit']], decimal_comma).abs() if columns['credit'] else 0
+            amounts = pd.Series(credits, index=chunk.index).fillna(0) - pd.Series(debits, index=chunk.index).fillna(0)
+            # Rows with neither a debit nor a credit are not transactions
+            filled = pd.Series(False, index=chunk.index)
+            for name in (columns['debit'], columns['credit']):
+                if name:
+                    filled |= parse_amounts(chunk[name], decimal_comma).notna()
+            amounts = amounts.where(filled)
+        yield pd.DataFrame({
+            'date': pd.to_datetime(chunk[columns['date']], errors='coerce', dayfirst=dayfirst),
+            'description': chunk[columns['description']] if columns['description'] else '',
+            'amount': amounts
+        })
+
+OFX_FIELD = re.compile(r'<(DTPOSTED|TRNAMT|NAME|MEMO)>([^<\r\n]*)', re.IGNORECASE)
+
+def ofx_transaction_chunks(stream, chunk_rows, block_size=1 << 20):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer, rows = '', []
+    while True:
+        block = stream.read(block_size)
+        buffer += decoder.decode(block, final=not block)
+        *transactions, buffer = re.split(r'</STMTTRN>', buffer, flags=re.IGNORECASE)
+        for transaction in transactions:
+            fields = {tag.upper(): value.strip() for tag, value in OFX_FIELD.findall(transaction)}
+            rows.append((fields.get('DTPOSTED', '')[:8], ' '.join(filter(None, (fields.get('NAME'), fields.get('MEMO')))),
+                         fields.get('TRNAMT')))
+        # Keep only the start of an unfinished transaction, so the buffer stays small
+        start = buffer.upper().rfind('<STMTTRN>')
+        buffer = buffer[start:] if start >= 0 else buffer[-len('</STMTTRN>'):]
+        if rows and (len(rows) >= chunk_rows or not block):
+            dates, descriptions, amounts = zip(*rows)
+            yield pd.DataFrame({
+                'date': pd.to_datetime(pd.Series(dates), format='%Y%m%d', errors='coerce'),
+                'description': pd.Series(descriptions, dtype=object),
+                'amount': parse_ofx_amounts(pd.Series(amounts, dtype=object))
+            })
+            rows = []
+        if not block:
+            return
+
+# Function to fold transaction chunks into per-month income and expenses by category
+def aggregate_transactions(chunks, categorizer):
+    months = {}
+    skipped = 0
+    for chunk in chunks:
+        valid = chunk['date'].notna() & chunk['amount'].notna()
+        skipped += int((~valid).sum())
+        chunk = chunk[valid]
+        if chunk.empty:
+            continue
+        month = chunk['date'].dt.year * 12 + chunk['date'].dt.month - 1
+        debits = (-chunk['amount']).clip(lower=0)
+        categories = categorizer.categorize(chunk['description'])
+        income = chunk['amount'].clip(lower=0).groupby(month).sum()
+        spent = debits[debits > 0].groupby([month[debits > 0], categories[debits > 0]]).sum()
+        counts = month.value_counts()
+        last = chunk['date'].groupby(month).max()
 
-    historical_data = get_historical_data(current_user.id)
+        for key, count in counts.items():
+            totals = months.setdefault(key, {'income': 0.0, 'categories': {}, 'transactions': 0, 'date': last[key]})
+            totals['income'] += float(income[key])
+            totals['transactions'] += int(count)
+            totals['date'] = max(totals['date'], last[key])
+        for (key, category), amount in spent.items():
+            categories_total = months[key]['categories']
+            categories_total[category] = categories_total.get(category, 0.0) + float(amount)
+    return months, skipped
 
-    return jsonify({
+def month_start(key):
+    return datetime(key // 12, key % 12 + 1, 1)
+
+# Function to import a statement: one entry per month it covers. Months the user already
+# has an entry for are skipped, so importing overlapping statements doesn't count twice.
+# Debts and investments are balances a statement doesn't show: the user's latest are used
+# unless given. Months older than the user's latest entry are left unscored (score-anomalies
+# fills them in) and the features are rebuilt from the whole history afterwards.
+def import_statement(user_id, stream, fmt='csv', debts=None, investments=None):
+    started = time.perf_counter()
+    chunk_rows = current_app.config['IMPORT_CHUNK_ROWS']
+    if fmt == 'ofx':
+        chunks = ofx_transaction_chunks(stream, chunk_rows)
+    else:
+        chunks = csv_transaction_chunks(stream, chunk_rows, current_app.config['IMPORT_DAYFIRST'],
+                                        current_app.config['IMPORT_DECIMAL_COMMA'])
+    months, skipped_rows = aggregate_transactions(chunks, current_app.extensions['categorizer'])
+
+    session = financial_data_session(user_id)
+    existing = set()
+    if months:
+        start, end = month_start(min(months)), month_start(max(months) + 1)
+        hot_month = db.func.strftime('%Y-%m', FinancialData.date)
+        existing = {month for (month,) in filter_date_range(
+            session.query(hot_month).filter(FinancialData.user_id == user_id), start, end).distinct()}
+        existing |= {month for (month,) in filter_archive_range(
+            session.query(FinancialDataArchive.month).filter(FinancialDataArchive.user_id == user_id), start, end)}
+
+    latest = (session.query(FinancialData).filter_by(user_id=user_id)
+              .order_by(FinancialData.date.desc()).first())
+    latest_archived = (session.query(FinancialDataArchive).filter_by(user_id=user_id)
+                       .order_by(FinancialDataArchive.month.desc()).first())
+    balances = latest or latest_archived
+    if debts is None:
+        debts = balances.debts if balances else 0.0
+    if investments is None:
+        investments = balances.investments if balances else 0.0
+    latest_dates = [latest.date] if latest else []
+    latest_dates += [datetime.strptime(latest_archived.month, '%Y-%m')] if latest_archived else []
+    latest_date = max(latest_dates, default=None)
+
+    imported, skipped_months = [], []
+    backdated = False
+    for key in sorted(months):
+        totals = months[key]
+        month = f'{key // 12:04d}-{key % 12 + 1:02d}'
+        if month in existing:
+            skipped_months.append(month)
+            continue
+        date = totals['date'].to_pydatetime()
+        online = latest_date is None or date > latest_date
+        backdated = backdated or not online
+        categories = {category: round(amount, 2) for category, amount in totals['categories'].items()}
+        store_financial_data(session, user_id, date, round(totals['income'], 2), round(sum(categories.values()), 2),
+                             debts, investments, categories, online=online)
+        imported.append(month)
+    if backdated:
+        build_user_features(session, user_id)
+    session.commit()
+
+    return {
+        'imported_months': imported,
+        'skipped_months': skipped_months,
+        'transactions': sum(totals['transactions'] for totals in months.values()),
+        'skipped_rows': skipped_rows,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+# Function to compute the history and current metrics shown by the dashboard
+# Given the client's cursor, the history holds only the points added since when that is
+# possible; the third value says which (append) and where the history now ends (cursor)
+def financial_health_metrics(user_id, start=None, end=None, cursor=None):
+    update = None
+    if cursor is not None:
+        update, cursor = history_since(user_id, cursor, start, end)
+    if update is not None and not update['dates']:
+        historical_data = update
+        latest = latest_history_point(user_id, start, end)
+    else:
+        historical_data = update or get_historical_data(user_id, start, end)
+        latest = historical_data
+
+    if not latest:
+        return None, None, None
+
+    # The history is ordered by date, so its last entry is the latest data in the range
+    latest_data = [latest[key][-1] for key in ('incomes', 'expenses', 'debts', 'investments')]
+
+    savings_rate, debt_to_income_ratio, investment_to_income_ratio = calculate_financial_health(*latest_data)
+
+    # The features describe the user's history up to now, so only open-ended ranges use them
+    predicted_savings_rate = predict_savings_rate(*latest_data, user_id=user_id if end is None else None)
+
+    metrics = {
         'savings_rate': savings_rate,
         'debt_to_income_ratio': debt_to_income_ratio,
         'investment_to_income_ratio': investment_to_income_ratio,
-        'predicted_savings_rate': predicted_savings_rate,
-        'historical_data': historical_data
-    })
+        'predicted_savings_rate': predicted_savings_rate
+    }
+    history = {'append': update is not None, 'cursor': cursor or history_cursor(user_id, start, end)}
+    return historical_data, metrics, history
 
-@app.route('/anomaly_detection', methods=['GET'])
+@bp.route('/get_financial_health', methods=['GET'])
+@login_required
+def get_financial_health():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+
+    # ?after_id=&points= (the cursor of the previous response) asks for just the new points
+    cursor = None
+    if 'after_id' in request.args and 'points' in request.args and not wants_arrow():
+        cursor = {'id': request.args.get('after_id', 0, type=int), 'points': request.args.get('points', 0, type=int)}
+
+    user_id = current_user.id
+    historical_data, metrics, history = coalesce('financial_health', user_id,
+                                                 lambda: financial_health_metrics(user_id, start, end, cursor))
+
+    if not historical_data:
+        return jsonify({'error': 'No financial data available'})
+
+    if wants_arrow():
+        response = current_app.response_class(historical_data_to_arrow(historical_data, metrics),
+                                              mimetype=ARROW_STREAM_MIMETYPE)
+    else:
+        response = jsonify({**metrics, 'historical_data': historical_data, **history})
+    response.vary.add('Accept')
+    return response
+
+@bp.route('/events')
+@login_required
+def events():
+    user_id = current_user.id
+    subscription = event_broker.subscribe(user_id)
+    heartbeat = current_app.config['SSE_HEARTBEAT_SECONDS']
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    message = subscription.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            event_broker.unsubscribe(user_id, subscription)
+
+    return current_app.response_class(stream(), mimetype='text/event-stream',
+                                      headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Bundled assets: immutable, and served from the .br or .gz copy the client accepts
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    directory = current_app.config['ASSET_DIR']
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings[encoding] and path is not None and os.path.isfile(path):
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetype,
+                                           max_age=current_app.config['ASSET_MAX_AGE'])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, mimetype=mimetype,
+                                       max_age=current_app.config['ASSET_MAX_AGE'])
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# One page of the history table: ?offset=&limit=&sort=<column>&order=asc|desc plus the
+# usual date range parameters
+@bp.route('/financial_data_history', methods=['GET'])
+@login_required
+def financial_data_history():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    sort = request.args.get('sort', 'date')
+    order = request.args.get('order', 'desc')
+    if sort not in HISTORY_SORT_COLUMNS or order not in ('asc', 'desc'):
+        return jsonify({'error': f"sort must be one of {', '.join(HISTORY_SORT_COLUMNS)} and order asc or desc"}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), current_app.config['HISTORY_PAGE_MAX'])
+
+    total, rows = history_page(current_user.id, start, end, sort, order == 'desc', offset, limit)
+    return jsonify({'total': total, 'offset': offset, 'limit': limit, 'sort': sort, 'order': order, 'rows': rows})
+
+# Expense totals by category over the months of the usual date range, with each
+# category's month-by-month trend; read from the monthly category totals
+@bp.route('/expense_breakdown', methods=['GET'])
+@login_required
+def expense_breakdown_route():
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    return jsonify(expense_breakdown(current_user.id, start, end))
+
+# Import a bank statement uploaded as `statement` (CSV, or OFX/QFX by file extension);
+# optional debts and investments override the balances carried over from the latest entry
+@bp.route('/import_statement', methods=['POST'])
+@login_required
+def import_statement_route():
+    if request.content_length and request.content_length > current_app.config['IMPORT_MAX_BYTES']:
+        return jsonify({'success': False, 'error': 'The statement file is too large'}), 413
+    upload = request.files.get('statement')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'error': 'Choose a statement file to import'}), 400
+    try:
+        summary = import_statement(current_user.id, upload.stream, statement_format(upload.filename),
+                                   request.form.get('debts', type=float), request.form.get('investments', type=float))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f'Could not read the statement: {e}'}), 400
+    return jsonify({'success': True, **summary})
+
+# Readiness probe for load balancers: 503 until this process has finished warming up
+@bp.route('/ready')
+def ready():
+    state = current_app.extensions['warmup']
+    return jsonify({'ready': state['status'] == 'ready', **state}), 200 if state['status'] == 'ready' else 503
+
+# Admission, single-flight, memory profiling and write-behind metrics of this process
+# (Prometheus text format)
+@bp.route('/metrics')
+def metrics():
+    body = current_app.extensions['admission'].metrics() + current_app.extensions['single_flight'].metrics()
+    if 'memory_profiler' in current_app.extensions:
+        body += current_app.extensions['memory_profiler'].metrics()
+    if current_app.extensions['write_behind'] is not None:
+        body += current_app.extensions['write_behind'].metrics()
+    return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+# Admin endpoints need the ADMIN_TOKEN bearer token, or a local request when none is set
+def admin_allowed():
+    token = current_app.config['ADMIN_TOKEN']
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+# Memory profile of this process: peak and retained memory and top allocation sites per
+# route and model call
+@bp.route('/admin/memory')
+def memory_profile_report():
+    profiler = current_app.extensions.get('memory_profiler')
+    if profiler is None:
+        return jsonify({'error': 'Memory profiling is off (set MEMORY_PROFILING=1)'}), 404
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return jsonify(profiler.report())
+
+# Takes a snapshot and returns what grew since the previous one (the first call starts
+# process-wide tracing); ?key_type=lineno, filename or traceback and ?top=N
+@bp.route('/admin/memory/snapshot', methods=['POST'])
+def memory_snapshot():
+    profiler = current_app.extensions.get('memory_profiler')
+    if profiler is None:
+        return jsonify({'error': 'Memory profiling is off (set MEMORY_PROFILING=1)'}), 404
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    key_type = request.args.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': 'key_type must be lineno, filename or traceback'}), 400
+    return jsonify(profiler.diff(key_type, request.args.get('top', type=int), current_app.config['MEMORY_PROFILE_DIR']))
+
+# Turns process-wide tracing off again after on-demand diffs
+@bp.route('/admin/memory/snapshot', methods=['DELETE'])
+def memory_snapshot_stop():
+    profiler = current_app.extensions.get('memory_profiler')
+    if profiler is None:
+        return jsonify({'error': 'Memory profiling is off (set MEMORY_PROFILING=1)'}), 404
+    if not admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    profiler.stop()
+    return jsonify({'tracing': 'stopped'})
+
+@bp.route('/anomaly_detection', methods=['GET'])
 @login_required
 def anomaly_detection_route():
-    anomalies = anomaly_detection(current_user.id)
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    user_id = current_user.id
+    anomalies = coalesce('anomaly_detection', user_id, lambda: anomaly_detection(user_id, start, end))
     return jsonify(anomalies)
 
-@app.route('/financial_forecasting', methods=['GET'])
+@bp.route('/financial_forecasting', methods=['GET'])
 @login_required
 def financial_forecasting_route():
-    forecast = financial_forecasting(current_user.id)
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid date range: {e}'}), 400
+    user_id = current_user.id
+    forecast = coalesce('financial_forecasting', user_id, lambda: financial_forecasting(user_id, start, end))
     return jsonify(forecast)
 
-@app.route('/goal_based_planning', methods=['POST'])
+@bp.route('/goal_based_planning', methods=['POST'])
 @login_required
 def goal_based_planning_route():
-    target_amount = float(request.form.get('target_amount'))
-    current_savings = float(request.form.get('current_savings'))
-    years = int(request.form.get('years'))
-    required_savings = goal_based_planning(target_amount, current_savings, years)
-    return jsonify(required_savings)
+    try:
+        target_amount, current_savings, years = (form_number(request.form, name)
+                                                 for name in ('target_amount', 'current_savings', 'years'))
+        monthly_contribution, expected_return, volatility, inflation = (
+            form_number(request.form, name, required=False)
+            for name in ('monthly_contribution', 'expected_return', 'volatility', 'inflation'))
+        if round(years * 12) < 1:
+            raise ValueError('years must be at least one month (1/12)')
+        if volatility is not None and volatility < 0:
+            raise ValueError('volatility cannot be negative')
+        # Rates are annual fractions; -1 (-100%) or below has no logarithm
+        for name, rate in (('expected_return', expected_return), ('inflation', inflation)):
+            if rate is not None and rate <= -1:
+                raise ValueError(f'{name} must be greater than -1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    plan = goal_based_planning(target_amount, current_savings, years, monthly_contribution,
+                               expected_return, volatility, inflation)
+    return jsonify(plan)
 
-@app.route('/robo_advisory', methods=['POST'])
+@bp.route('/robo_advisory', methods=['POST'])
 @login_required
 def robo_advisory_route():
     risk_tolerance = request.form.get('risk_tolerance').lower()
@@ -826,5 +4083,579 @@ def robo_advisory_route():
     suggestions = robo_advisory(risk_tolerance, current_savings, investments)
     return jsonify(suggestions)
 
+# Function to copy a user's rows with ids above after_id, with their category items, to
+# another shard; returns the source rows and items copied
+def copy_user_rows(source, target, user_id, after_id=0):
+    rows = (source.query(FinancialData).filter(FinancialData.user_id == user_id, FinancialData.id > after_id)
+            .order_by(FinancialData.id).all())
+    columns = [column.name for column in FinancialData.__table__.columns if column.name != 'id']
+    copies = [FinancialData(**{name: getattr(row, name) for name in columns}) for row in rows]
+    target.add_all(copies)
+    # Ids are not preserved, so the category items follow their rows to the new ids
+    target.flush()
+    new_ids = {row.id: copy.id for row, copy in zip(rows, copies)}
+    items = (source.query(ExpenseItem).join(FinancialData, ExpenseItem.financial_data_id == FinancialData.id)
+             .filter(FinancialData.user_id == user_id, FinancialData.id > after_id).all())
+    items = [item for item in items if item.financial_data_id in new_ids]
+    target.add_all([ExpenseItem(financial_data_id=new_ids[item.financial_data_id], category=item.category,
+                                amount=item.amount) for item in items])
+    return rows, items
+
+# Move one user's FinancialData rows to another shard
+def move_user(user_id, target_shard):
+    assignment = db.session.get(ShardAssignment, user_id)
+    # Users without an assignment still live in the main database
+    source = get_shard_session(assignment.shard) if assignment else db.session
+    target = get_shard_session(target_shard)
+
+    # Rows, archive, monthly stats, features and category totals are read from one snapshot,
+    # so the derived rows describe exactly the rows copied and move over unchanged
+    begin_transaction(source)
+    rows, _ = copy_user_rows(source, target, user_id)
+    for model in (FinancialDataArchive, UserMonthlyStats, UserFeatures, UserMonthlyCategoryTotal):
+        columns = [column.name for column in model.__table__.columns]
+        for row in source.query(model).filter_by(user_id=user_id):
+            target.merge(model(**{name: getattr(row, name) for name in columns}))
+    last_copied = rows[-1].id if rows else 0
+    moved = len(rows)
+    source.rollback()
+    target.commit()
+
+    if assignment is None:
+        db.session.add(ShardAssignment(user_id=user_id, shard=target_shard))
+    else:
+        assignment.shard = target_shard
+    db.session.commit()
+
+    # Writes that picked the source before the switch can still land there: keep moving
+    # what they add until a settle period passes without any
+    while True:
+        time.sleep(current_app.config['RESHARD_SETTLE_SECONDS'])
+        stragglers, items = copy_user_rows(source, target, user_id, last_copied)
+        if not stragglers:
+            break
+        # Folded into the features one by one, in the order they were written, as on the
+        # source; a user without features yet gets them built from every row at once
+        rebuild = target.get(UserFeatures, user_id) is None
+        for row in stragglers:
+            if not rebuild:
+                update_features(target, row)
+            update_category_totals(target, user_id, row.date.strftime('%Y-%m'),
+                                   {item.category: item.amount for item in items if item.financial_data_id == row.id})
+        if rebuild:
+            build_user_features(target, user_id)
+        target.commit()
+        last_copied = stragglers[-1].id
+        moved += len(stragglers)
+
+    copied = db.select(FinancialData.id).where(FinancialData.user_id == user_id, FinancialData.id <= last_copied)
+    source.query(ExpenseItem).filter(ExpenseItem.financial_data_id.in_(copied)).delete(synchronize_session=False)
+    source.query(FinancialData).filter(FinancialData.user_id == user_id,
+                                       FinancialData.id <= last_copied).delete(synchronize_session=False)
+    for model in (FinancialDataArchive, UserMonthlyStats, UserFeatures, UserMonthlyCategoryTotal):
+        source.query(model).filter_by(user_id=user_id).delete(synchronize_session=False)
+    source.commit()
+    return moved
+
+@bp.cli.command('reshard')
+@click.option('--user', 'user_ids', multiple=True, type=int, help='User to move (repeatable).')
+@click.option('--to', 'target_shard', type=int, help='Destination shard for --user.')
+@click.option('--rebalance', is_flag=True, help='Move every user to the shard its id hashes to for the current shard count.')
+def reshard(user_ids, target_shard, rebalance):
+    shard_count = current_app.config['FINANCIAL_DATA_SHARDS']
+    if not shard_count:
+        raise click.UsageError('Sharding is disabled; set FINANCIAL_DATA_SHARDS first.')
+
+    moves = []
+    if rebalance:
+        assignments = {a.user_id: a.shard for a in ShardAssignment.query.all()}
+        # Rows written before sharding was enabled are still in the main database
+        unassigned = {user_id for (user_id,) in db.session.query(FinancialData.user_id).distinct()}
+        for user_id in sorted(set(assignments) | unassigned):
+            target = hash_shard(user_id, shard_count)
+            if assignments.get(user_id) != target:
+                moves.append((user_id, target))
+    elif user_ids and target_shard is not None:
+        if not 0 <= target_shard < shard_count:
+            raise click.BadParameter(f'must be between 0 and {shard_count - 1}', param_hint='--to')
+        moves = [(user_id, target_shard) for user_id in user_ids]
+    else:
+        raise click.UsageError('Pass --rebalance, or --user with --to.')
+
+    for user_id, target in moves:
+        assignment = db.session.get(ShardAssignment, user_id)
+        if assignment is not None and assignment.shard == target:
+            continue
+        click.echo(f'user {user_id}: moved {move_user(user_id, target)} rows to shard {target}')
+
+# Score rows written before online anomaly scoring existed
+@bp.cli.command('score-anomalies')
+def score_anomalies():
+    def backfill(session):
+        users = [user_id for (user_id,) in session.query(FinancialData.user_id)
+                 .filter(FinancialData.anomaly_score.is_(None)).distinct()]
+        for user_id in users:
+            rows = session.query(FinancialData).filter_by(user_id=user_id).order_by(FinancialData.date).all()
+            values = [[getattr(row, name) for name in ANOMALY_FEATURES] for row in rows]
+            for row, (score, is_anomaly) in zip(rows, replay_anomaly_scores(values)):
+                row.anomaly_score, row.is_anomaly = score, is_anomaly
+            session.commit()
+        return len(users)
+
+    click.echo(f'Scored history for {sum(fan_out(backfill))} users')
+
+# Build the feature store for users whose rows were written before it existed
+@bp.cli.command('build-features')
+def build_features_command():
+    def build(session):
+        users = {user_id for (user_id,) in session.query(FinancialData.user_id).distinct()}
+        users |= {user_id for (user_id,) in session.query(FinancialDataArchive.user_id).distinct()}
+        for user_id in sorted(users):
+            build_user_features(session, user_id)
+        session.commit()
+        return len(users)
+
+    started = time.perf_counter()
+    click.echo(f'Built features for {sum(fan_out(build))} users in {time.perf_counter() - started:.1f}s')
+
+# Give entries written before expense categories existed a catch-all item, and their
+# months (including already compacted ones) their category totals
+@bp.cli.command('build-category-totals')
+def build_category_totals_command():
+    other = current_app.config['EXPENSE_CATEGORIES'][-1]
+
+    def build(session):
+        begin_transaction(session, immediate=True)
+        totals = {}
+        items = []
+        uncategorized = (session.query(FinancialData.id, FinancialData.user_id, FinancialData.date, FinancialData.expenses)
+                         .outerjoin(ExpenseItem, ExpenseItem.financial_data_id == FinancialData.id)
+                         .filter(ExpenseItem.financial_data_id.is_(None)))
+        for row in uncategorized:
+            if row.expenses > 0:
+                items.append({'financial_data_id': row.id, 'category': other, 'amount': row.expenses})
+                key = (row.user_id, row.date.strftime('%Y-%m'))
+                amount, entries = totals.get(key, (0.0, 0))
+                totals[key] = (amount + row.expenses, entries + 1)
+        # Archived months compacted before any of their entries had items
+        covered = (db.select(UserMonthlyCategoryTotal.month)
+                   .where(UserMonthlyCategoryTotal.user_id == FinancialDataArchive.user_id,
+                          UserMonthlyCategoryTotal.month == FinancialDataArchive.month))
+        for row in session.query(FinancialDataArchive).filter(~covered.exists()):
+            amount, entries = totals.get((row.user_id, row.month), (0.0, 0))
+            totals[(row.user_id, row.month)] = (amount + row.expenses * row.entries, entries + row.entries)
+
+        session.bulk_insert_mappings(ExpenseItem, items)
+        existing = {(total.user_id, total.month): total
+                    for total in session.query(UserMonthlyCategoryTotal).filter_by(category=other)}
+        for (user_id, month), (amount, entries) in totals.items():
+            total = existing.get((user_id, month))
+            if total is None:
+                session.add(UserMonthlyCategoryTotal(user_id=user_id, month=month, category=other,
+                                                     amount=amount, entries=entries))
+            else:
+                total.amount += amount
+                total.entries += entries
+        session.commit()
+        return len(items), len(totals)
+
+    started = time.perf_counter()
+    results = fan_out(build)
+    click.echo(f'Categorized {sum(items for items, _ in results)} entries across '
+               f'{sum(months for _, months in results)} months in {time.perf_counter() - started:.1f}s')
+
+# Import a bank statement file for a user (one entry per month it covers)
+@bp.cli.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Username to import the statement for.')
+@click.option('--debts', type=float, help='Total debts to record (default: the latest entry\'s).')
+@click.option('--investments', type=float, help='Total investments to record (default: the latest entry\'s).')
+def import_statement_command(path, username, debts, investments):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.BadParameter(f'no user named {username}', param_hint='--user')
+    try:
+        with open(path, 'rb') as stream:
+            summary = import_statement(user.id, stream, statement_format(path), debts, investments)
+    except ValueError as e:
+        raise click.ClickException(f'Could not read the statement: {e}')
+    click.echo(f"Imported {len(summary['imported_months'])} months from {summary['transactions']} transactions "
+               f"in {summary['seconds']:.1f}s")
+    if summary['skipped_months']:
+        click.echo(f"Skipped months that already have entries: {', '.join(summary['skipped_months'])}")
+    if summary['skipped_rows']:
+        click.echo(f"Skipped {summary['skipped_rows']} rows without a valid date or amount")
+
+# Replay the journals of write-behind processes that died (servers also do this on start)
+@bp.cli.command('replay-journal')
+def replay_journal_command():
+    if not fcntl:
+        raise click.ClickException('Write-behind journals need fcntl (Unix)')
+    journal = WriteBehindJournal(current_app.config['WRITE_BEHIND_DIR'], current_app.config['WRITE_BEHIND_BATCH_SIZE'],
+                                 current_app.config['WRITE_BEHIND_INTERVAL'],
+                                 current_app.config['WRITE_BEHIND_JOURNAL_MAX_BYTES'])
+    replayed = journal.recover_all()
+    for name, rows in replayed.items():
+        click.echo(f'{name}: {rows} rows written')
+    click.echo(f'Replayed {len(replayed)} journals')
+
+# Store the front-end libraries in ASSET_DIR so pages load them from this server. In an
+# air-gapped deployment, run it where the CDNs are reachable and copy ASSET_DIR over, or
+# pass --source with the files named as in VENDOR_ASSETS.
+@bp.cli.command('bundle-assets')
+@click.option('--source', default=None, help='Directory holding the asset files instead of downloading them.')
+def bundle_assets_command(source):
+    import urllib.request
+
+    directory = current_app.config['ASSET_DIR']
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, url in current_app.config['VENDOR_ASSETS'].items():
+        if source:
+            with open(os.path.join(source, name), 'rb') as f:
+                content = f.read()
+        else:
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as e:
+                raise click.ClickException(f'Could not download {url} ({e}); use --source with local copies')
+        manifest[name] = hashed_asset_name(name, content)
+        sizes = write_asset(directory, manifest[name], content)
+        sizes = ', '.join(f'{suffix or "raw"} {size / 1024:.1f} KiB' for suffix, size in sizes.items())
+        click.echo(f'{manifest[name]}: {sizes}')
+
+    # Older hashed files stay, for pages still open with their names
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    click.echo(f'Wrote {manifest_path}')
+
+@bp.cli.command('compact-history')
+@click.option('--vacuum', is_flag=True, help='Run VACUUM afterwards to return the freed space to the filesystem.')
+def compact_history_command(vacuum):
+    cutoff = retention_cutoff()
+
+    def compact(session):
+        removed, months = compact_history(session, cutoff)
+        if vacuum:
+            with session.get_bind().connect() as connection:
+                connection.execution_options(isolation_level='AUTOCOMMIT').execute(db.text('VACUUM'))
+        return removed, months
+
+    results = fan_out(compact)
+    if current_app.config['FINANCIAL_DATA_SHARDS']:
+        # Rows written before sharding was enabled are still in the main database
+        results.append(compact(db.session))
+    click.echo(f'Compacted {sum(r[0] for r in results)} rows older than {cutoff:%Y-%m-%d} '
+               f'into {sum(r[1] for r in results)} monthly aggregates')
+
+# Precompute forecasts for every user, FORECAST_BATCH_USERS users per NumPy pass
+@bp.cli.command('forecast')
+@click.option('--batch-users', default=None, type=int, help='Users per batch (default FORECAST_BATCH_USERS).')
+def forecast_command(batch_users):
+    batch_users = batch_users or current_app.config['FORECAST_BATCH_USERS']
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    started = time.perf_counter()
+    stored = 0
+    for start in range(0, len(user_ids), batch_users):
+        stored += len(store_forecasts(user_ids[start:start + batch_users]))
+    click.echo(f'Stored {stored} forecasts for {len(user_ids)} users in {time.perf_counter() - started:.1f}s')
+
+# Nightly anomaly sweep
+# Users are split into partitions by id; each partition runs in its own process, streams
+# its users' columns shard by shard, replays the online scoring over the full history and
+# writes the anomalies for a batch of users in the same transaction as its checkpoint, so
+# an interrupted sweep resumes after the last committed batch.
+# Worker process setup: the app context stays pushed for the life of the process
+def init_sweep_worker(app):
+    app.app_context().push()
+    # Connections inherited from the parent process must not be reused after fork
+    for engine in db.engines.values():
+        engine.dispose(close=False)
+
+def sweep_partition(sweep_id, partition, partitions, batch_size):
+    checkpoint = db.session.get(AnomalySweepCheckpoint, (sweep_id, partition))
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)
+                .filter(User.id > checkpoint.last_user_id, User.id % partitions == partition)
+                .order_by(User.id)]
+    scanned = flagged = 0
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        sessions = {}
+        for user_id in batch:
+            sessions.setdefault(financial_data_session(user_id), []).append(user_id)
+
+        anomalies = []
+        for session, session_users in sessions.items():
+            rows = (session.query(FinancialData.id, FinancialData.user_id, FinancialData.date,
+                                  *[getattr(FinancialData, name) for name in ANOMALY_FEATURES])
+                    .filter(FinancialData.user_id.in_(session_users))
+                    .order_by(FinancialData.user_id, FinancialData.date)
+                    .yield_per(10000))
+            for user_id, user_rows in itertools.groupby(rows, key=lambda row: row.user_id):
+                user_rows = list(user_rows)
+                scores = replay_anomaly_scores([row[3:] for row in user_rows])
+                scanned += len(user_rows)
+                anomalies.extend(
+                    {'sweep_id': sweep_id, 'user_id': user_id, 'financial_data_id': row.id,
+                     'date': row.date, 'score': score}
+                    for row, (score, is_anomaly) in zip(user_rows, scores) if is_anomaly
+                )
+
+        Anomaly.query.filter(Anomaly.user_id.in_(batch)).delete(synchronize_session=False)
+        if anomalies:
+            db.session.execute(db.insert(Anomaly), anomalies)
+        checkpoint.last_user_id = batch[-1]
+        db.session.commit()
+        flagged += len(anomalies)
+
+    checkpoint.done = True
+    db.session.commit()
+    return len(user_ids), scanned, flagged
+
+@bp.cli.command('anomaly-sweep')
+@click.option('--workers', default=os.cpu_count(), help='Number of partitions / worker processes for a new sweep.')
+@click.option('--batch-size', default=500, help='Users per committed batch.')
+@click.option('--restart', is_flag=True, help='Abandon an interrupted sweep instead of resuming it.')
+def anomaly_sweep(workers, batch_size, restart):
+    sweep = AnomalySweep.query.filter_by(status='running').order_by(AnomalySweep.id.desc()).first()
+    if sweep is not None and restart:
+        sweep.status = 'abandoned'
+        db.session.commit()
+        sweep = None
+
+    if sweep is None:
+        sweep = AnomalySweep(partitions=workers)
+        db.session.add(sweep)
+        db.session.flush()
+        db.session.add_all([AnomalySweepCheckpoint(sweep_id=sweep.id, partition=p) for p in range(workers)])
+        db.session.commit()
+    else:
+        click.echo(f'Resuming sweep {sweep.id} started at {sweep.started_at:%Y-%m-%d %H:%M}')
+
+    pending = [checkpoint.partition for checkpoint in
+               AnomalySweepCheckpoint.query.filter_by(sweep_id=sweep.id, done=False)]
+    started = time.perf_counter()
+    users = scanned = flagged = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=len(pending), mp_context=multiprocessing.get_context('fork'),
+                                 initializer=init_sweep_worker,
+                                 initargs=(current_app._get_current_object(),)) as pool:
+            futures = [pool.submit(sweep_partition, sweep.id, partition, sweep.partitions, batch_size)
+                       for partition in pending]
+            for future in futures:
+                partition_users, partition_rows, partition_flagged = future.result()
+                users += partition_users
+                scanned += partition_rows
+                flagged += partition_flagged
+
+    sweep.status = 'finished'
+    sweep.finished_at = datetime.utcnow()
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    click.echo(f'Sweep {sweep.id}: {users} users, {scanned} rows, {flagged} anomalies in {elapsed:.1f}s '
+               f'({users / elapsed if elapsed else 0:.0f} users/s)')
+
+# Analytics replica commands
+replica_cli = AppGroup('replica', help='Maintain the columnar analytics replica.')
+
+@replica_cli.command('export')
+@click.option('--full', is_flag=True, help='Rebuild the replica from scratch (needed after resharding).')
+def replica_export(full):
+    started = time.perf_counter()
+    exported = export_replica(full)
+    click.echo(f'Exported {exported} rows in {time.perf_counter() - started:.2f}s')
+
+@replica_cli.command('status')
+def replica_status():
+    lag = replica_lag()
+    seconds = lag['seconds_since_export']
+    click.echo(f"last export: {'never' if seconds is None else f'{seconds:.0f}s ago'}, "
+               f"rows pending: {lag['pending_rows']}")
+
+@replica_cli.command('benchmark')
+@click.option('--repeats', default=3)
+def replica_benchmark(repeats):
+    def row_store_scan():
+        totals = {}
+        for _, session in replica_sources():
+            query = session.query(
+                FinancialData.user_id, db.func.count(), db.func.sum(FinancialData.income),
+                db.func.sum(FinancialData.expenses), db.func.sum(FinancialData.savings_rate)
+            ).group_by(FinancialData.user_id)
+            for user_id, count, income, expenses, savings_rate in query:
+                previous = totals.get(user_id, (0, 0.0, 0.0, 0.0))
+                totals[user_id] = (previous[0] + count, previous[1] + income,
+                                   previous[2] + expenses, previous[3] + savings_rate)
+        return len(totals)
+
+    def replica_scan():
+        return len(query_replica('''
+            SELECT user_id, count(*), avg(income), avg(expenses), avg(savings_rate)
+            FROM financial_data GROUP BY user_id
+        '''))
+
+    timings = {}
+    for name, scan in (('row store', row_store_scan), ('replica', replica_scan)):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            users = scan()
+        timings[name] = (time.perf_counter() - started) / repeats
+        click.echo(f'{name:<10} {timings[name] * 1000:>10.1f} ms ({users} users)')
+    click.echo(f"speedup    {timings['row store'] / timings['replica']:>10.1f}x")
+
+bp.cli.add_command(replica_cli)
+
+# Build the compact model variant and compare it with the full model
+@bp.cli.command('compact-model')
+@click.option('--trees', default=None, type=int, help='Number of trees (default COMPACT_N_ESTIMATORS).')
+@click.option('--max-depth', default=None, type=int, help='Maximum tree depth (default COMPACT_MAX_DEPTH).')
+@click.option('--max-leaf-nodes', default=None, type=int, help='Maximum leaves per tree (default COMPACT_MAX_LEAF_NODES).')
+@click.option('--output', default=None, help='Where to write the compact model (default COMPACT_MODEL_PATH).')
+def compact_model_command(trees, max_depth, max_leaf_nodes, output):
+    full_model, full_scaler = joblib.load(current_app.config['MODEL_PATH'])
+    X_train, _, y_train, _ = get_training_data()
+    compact = build_compact_model(full_scaler, X_train, y_train, trees, max_depth, max_leaf_nodes)
+    output = output or current_app.config['COMPACT_MODEL_PATH']
+    joblib.dump(compact, output)
+
+    report = model_variant_report(output)
+    click.echo(f"{'variant':<10} {'trees':>6} {'nodes':>8} {'disk_kb':>10} {'load_ms':>9} {'latency_us':>11} {'mae':>8} {'mae_vs_full':>12}")
+    for variant, row in report.items():
+        click.echo(f"{variant:<10} {row['trees']:>6} {row['nodes']:>8} {row['disk_bytes'] / 1024:>10.1f} "
+                   f"{row['load_seconds'] * 1000:>9.2f} {row['latency_seconds'] * 1e6:>11.1f} "
+                   f"{row['mae_vs_actual']:>8.3f} {row['mae_vs_full']:>12.3f}")
+
+# Pre-forking server: the model is loaded once in the master and shared with the workers
+@bp.cli.command('serve-prefork')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=5000)
+@click.option('--workers', default=4)
+@click.option('--preload/--no-preload', default=True, help='Share a flat copy of the model across workers.')
+@click.option('--report-interval', default=0, help='Print RSS/PSS per worker every N seconds (SIGUSR1 prints on demand).')
+def serve_prefork(host, port, workers, preload, report_interval):
+    if preload and flat_model is None:
+        preload_model()
+
+    app = current_app._get_current_object()
+    # Warm the master before forking so every worker starts warm (and ready)
+    if app.config['WARMUP'] == 'off':
+        start_warmup(app)
+    else:
+        warmup(app)
+    if preload:
+        gc.freeze()
+    listener = socket.create_server((host, port), reuse_port=False)
+    listener.set_inheritable(True)
+
+    def start_worker():
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGUSR1):
+                signal.signal(signum, signal.SIG_DFL)
+            # Stop serving on SIGTERM, but write and remove the journal before exiting
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            start_journal(app)
+            try:
+                make_server(host, port, app, threaded=True, fd=listener.fileno()).serve_forever()
+            finally:
+                if app.extensions['write_behind'] is not None:
+                    app.extensions['write_behind'].close(os.getpid())
+                os._exit(0)
+        return pid
+
+    report_requested = []
+    signal.signal(signal.SIGUSR1, lambda signum, frame: report_requested.append(True))
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    worker_pids = [start_worker() for _ in range(workers)]
+    click.echo(f'Serving on http://{host}:{port} with {workers} workers (preload={preload})')
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(1)
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid in worker_pids:
+                worker_pids[worker_pids.index(pid)] = start_worker()
+            if report_requested or (report_interval and time.monotonic() - last_report >= report_interval):
+                report_requested.clear()
+                last_report = time.monotonic()
+                click.echo(prefork_memory_report(worker_pids))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in worker_pids:
+            os.kill(pid, signal.SIGTERM)
+        if model_shm is not None:
+            model_shm.close()
+            model_shm.unlink()
+
+# Import-time profile
+# Imports an app module in a fresh interpreter under `python -X importtime` and returns
+# its total import time plus the cumulative time of each module it imports directly.
+IMPORT_DEFERRED_MODULES = ['numpy', 'pandas', 'sklearn', 'joblib', 'pyarrow', 'duckdb', 'brotli']
+
+def import_time_profile(path):
+    directory, filename = os.path.split(os.path.abspath(path))
+    # __import__ rather than importlib.import_module, which -X importtime doesn't time
+    code = f'import sys; sys.path.insert(0, {directory!r}); __import__({os.path.splitext(filename)[0]!r})'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, cwd=directory)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {filename} failed:\n{result.stderr[-2000:]}')
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, self_us, cumulative_us, name = re.split(r'[:|]', line, maxsplit=3)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative_us) / 1000))
+
+    # Nested imports are printed before the module that imported them
+    module = os.path.splitext(filename)[0]
+    position = next(i for i, entry in enumerate(entries) if entry[0] == 0 and entry[1] == module)
+    children = []
+    for depth, name, cumulative_ms in reversed(entries[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((name, cumulative_ms))
+    children.sort(key=lambda child: child[1], reverse=True)
+    imported = {name.split('.')[0] for _, name, _ in entries}
+    return {
+        'total_ms': entries[position][2],
+        'imports': children,
+        'deferred_imported': [name for name in IMPORT_DEFERRED_MODULES if name in imported]
+    }
+
+@bp.cli.command('import-benchmark')
+@click.option('--module', 'paths', multiple=True, help='App module to profile (repeatable; default this one).')
+@click.option('--repeats', default=3, help='Fresh imports per module; the fastest is reported.')
+@click.option('--top', default=10, help='Number of direct imports to list.')
+@click.option('--budget-ms', default=None, type=float, help='Fail if an import takes longer than this.')
+def import_benchmark(paths, repeats, top, budget_ms):
+    failed = False
+    for path in paths or [__file__]:
+        profile = min((import_time_profile(path) for _ in range(repeats)), key=lambda p: p['total_ms'])
+        click.echo(f"{os.path.basename(path)}: {profile['total_ms']:.1f} ms")
+        for name, cumulative_ms in profile['imports'][:top]:
+            click.echo(f'  {cumulative_ms:>9.1f} ms  {name}')
+        if profile['deferred_imported']:
+            failed = True
+            click.echo(f"  imported at module load: {', '.join(profile['deferred_imported'])}")
+        if budget_ms is not None and profile['total_ms'] > budget_ms:
+            failed = True
+            click.echo(f'  over the {budget_ms:.0f} ms budget')
+    if failed:
+        sys.exit(1)
+
 if __name__ == '__main__':
+    app = create_app({'WARMUP': 'off'})
+    with app.app_context():
+        init_db()
+    warmup(app)
     app.run(debug=True)
@@ -1,24 +1,33 @@
-from flask import Flask, render_template_string, request, jsonify, redirect, url_for
+from flask import Flask, Blueprint, render_template_string, request, jsonify, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-import joblib
 from datetime import datetime, timedelta
 import os
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_secret_key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///financial_health.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+import threading
+import click
+
+# Application factory
+# pandas, NumPy, scikit-learn and joblib are imported where they are used, tables are
+# created by `flask init-db` and the model is loaded on the first prediction.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your_secret_key'
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///financial_health.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
+bp = Blueprint('main', __name__, cli_group=None)
 
 # User model
 class User(UserMixin, db.Model):
@@ -45,8 +54,10 @@ class FinancialData(db.Model):
     savings_rate = db.Column(db.Float, nullable=False)
 
 # Create database tables
-with app.app_context():
+@bp.cli.command('init-db')
+def init_db_command():
     db.create_all()
+    click.echo('Database tables are up to date')
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -54,6 +65,13 @@ def load_user(user_id):
 
 # Load or train the ML model
 def get_ml_model():
+    import numpy as np
+    import pandas as pd
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.preprocessing import StandardScaler
+
     model_path = 'financial_health_model.joblib'
     if os.path.exists(model_path):
         return joblib.load(model_path)
@@ -87,7 +105,16 @@ def get_ml_model():
         joblib.dump((model, scaler), model_path)
         return model, scaler
 
-ml_model, scaler = get_ml_model()
+# The model is loaded on first use by load_model()
+ml_model = None
+scaler = None
+model_lock = threading.Lock()
+
+def load_model():
+    global ml_model, scaler
+    with model_lock:
+        if ml_model is None:
+            ml_model, scaler = get_ml_model()
 
 # Function to calculate financial health metrics
 def calculate_financial_health(income, expenses, debts, investments):
@@ -98,6 +125,9 @@ def calculate_financial_health(income, expenses, debts, investments):
 
 # Function to predict savings rate using the trained model
 def predict_savings_rate(income, expenses, debts, investments):
+    import numpy as np
+
+    load_model()
     input_data = np.array([[income, expenses, debts, investments]])
     input_data_scaled = scaler.transform(input_data)
     prediction = ml_model.predict(input_data_scaled)
@@ -122,7 +152,7 @@ def get_historical_data(user_id):
     return data
 
 # Routes
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template_string('''
     <!DOCTYPE html>
@@ -137,15 +167,15 @@ def index():
         <div class="container mx-auto mt-8 text-center">
             <h1 class="text-4xl font-bold mb-8">Welcome to Financial Health Assessment</h1>
             <div class="space-x-4">
-                <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
-                <a href="{{ url_for('register') }}" class="bg-green-500 hover:bg-green-700 text-white font-bold py-2 px-4 rounded">Register</a>
+                <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
+                <a href="{{ url_for('main.register') }}" class="bg-green-500 hover:bg-green-700 text-white font-bold py-2 px-4 rounded">Register</a>
             </div>
         </div>
     </body>
     </html>
     ''')
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -165,7 +195,7 @@ def register():
                 <div class="container mx-auto mt-8">
                     <h1 class="text-3xl font-bold mb-4">Register</h1>
                     <p class="text-red-500 mb-4">Username already exists</p>
-                    <a href="{{ url_for('register') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
+                    <a href="{{ url_for('main.register') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
                 </div>
             </body>
             </html>
@@ -189,7 +219,7 @@ def register():
             <div class="container mx-auto mt-8">
                 <h1 class="text-3xl font-bold mb-4">Register</h1>
                 <p class="text-green-500 mb-4">Registration successful. Please log in.</p>
-                <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
+                <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Login</a>
             </div>
         </body>
         </html>
@@ -224,7 +254,7 @@ def register():
                     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline" type="submit">
                         Register
                     </button>
-                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('login') }}">
+                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('main.login') }}">
                         Already have an account? Login
                     </a>
                 </div>
@@ -234,7 +264,7 @@ def register():
     </html>
     ''')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -243,7 +273,7 @@ def login():
 
         if user and user.check_password(password):
             login_user(user)
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             return render_template_string('''
             <!DOCTYPE html>
@@ -258,7 +288,7 @@ def login():
                 <div class="container mx-auto mt-8">
                     <h1 class="text-3xl font-bold mb-4">Login</h1>
                     <p class="text-red-500 mb-4">Invalid username or password</p>
-                    <a href="{{ url_for('login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
+                    <a href="{{ url_for('main.login') }}" class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded">Try Again</a>
                 </div>
             </body>
             </html>
@@ -293,7 +323,7 @@ def login():
                     <button class="bg-blue-500 hover:bg-blue-700 text-white font-bold py-2 px-4 rounded focus:outline-none focus:shadow-outline" type="submit">
                         Sign In
                     </button>
-                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('register') }}">
+                    <a class="inline-block align-baseline font-bold text-sm text-blue-500 hover:text-blue-800" href="{{ url_for('main.register') }}">
                         Don't have an account? Register
                     </a>
                 </div>
@@ -303,13 +333,13 @@ def login():
     </html>
     ''')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
 def dashboard():
     return render_template_string('''
@@ -327,7 +357,7 @@ def dashboard():
         <nav class="bg-blue-600 p-4 text-white">
             <div class="container mx-auto flex justify-between items-center">
                 <h1 class="text-2xl font-bold">Financial Health Dashboard</h1>
-                <a href="{{ url_for('logout') }}" class="bg-red-500 hover:bg-red-600 px-4 py-2 rounded">Logout</a>
+                <a href="{{ url_for('main.logout') }}" class="bg-red-500 hover:bg-red-600 px-4 py-2 rounded">Logout</a>
             </div>
         </nav>
 
@@ -550,7 +580,7 @@ def dashboard():
     </html>
     ''')
 
-@app.route('/add_financial_data', methods=['POST'])
+@bp.route('/add_financial_data', methods=['POST'])
 @login_required
 def add_financial_data():
     income = float(request.form.get('income'))
@@ -574,7 +604,7 @@ def add_financial_data():
 
     return jsonify({'success': True})
 
-@app.route('/get_financial_health', methods=['GET'])
+@bp.route('/get_financial_health', methods=['GET'])
 @login_required
 def get_financial_health():
     latest_data = FinancialData.query.filter_by(user_id=current_user.id).order_by(FinancialData.date.desc()).first()
@@ -601,4 +631,7 @@ def get_financial_health():
     })
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        db.create_all()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(__file__), '..', 'Final Product Updated (Financial Health Advisor).py')
+
+# The app lives in a file whose name isn't importable, so load it once under a module name
+# the tests can import
+spec = importlib.util.spec_from_file_location('financial_health_app', APP_PATH)
+fha = importlib.util.module_from_spec(spec)
+sys.modules['financial_health_app'] = fha
+spec.loader.exec_module(fha)
+
+
+@pytest.fixture(scope='session')
+def model_dir(tmp_path_factory):
+    # Publishing a written row predicts with the model, trained on first use
+    return tmp_path_factory.mktemp('model')
+
+
+@pytest.fixture
+def config(request, tmp_path, model_dir):
+    # Tests override settings with @pytest.mark.parametrize('config', [{...}], indirect=True)
+    return {
+        'TESTING': True,
+        'WARMUP': 'off',
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'SQLALCHEMY_BINDS': {},
+        'WRITE_BEHIND_DIR': str(tmp_path / 'journal'),
+        'MODEL_PATH': str(model_dir / 'model.joblib'),
+        'COMPACT_MODEL_PATH': str(model_dir / 'model.compact.joblib'),
+        **getattr(request, 'param', {}),
+    }
+
+
+@pytest.fixture
+def app(config, monkeypatch):
+    # Not a serving process: tests that need journals open and replay them themselves
+    monkeypatch.setenv('FLASK_RUN_FROM_CLI', 'true')
+    app = fha.create_app(config)
+    with app.app_context():
+        fha.init_db()
+        user = fha.User(username='alice')
+        user.set_password('secret')
+        fha.db.session.add(user)
+        fha.db.session.commit()
+    yield app
+    with app.app_context():
+        for engine in fha.db.engines.values():
+            fha.shard_sessions.pop(engine, fha.db.session).remove()
+            engine.dispose()
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        return fha.User.query.filter_by(username='alice').one().id
+
+
+@pytest.fixture
+def client(app, user_id):
+    client = app.test_client()
+    client.post('/login', data={'username': 'alice', 'password': 'secret'})
+    return client
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import financial_health_app as fha
+
+ENTRY = {'income': '5000', 'expenses': '3000', 'debts': '100', 'investments': '200'}
+
+
+def stored_count(app, user_id):
+    with app.app_context():
+        return fha.FinancialData.query.filter_by(user_id=user_id).count()
+
+
+def test_valid_entry_is_stored(app, client, user_id):
+    response = client.post('/add_financial_data', data={**ENTRY, 'expense_Rent': '1000'})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True}
+    assert stored_count(app, user_id) == 1
+
+
+@pytest.mark.parametrize('field, value, error', [
+    ('income', None, 'income is required'),
+    ('expenses', '', 'expenses is required'),
+    ('income', 'abc', 'income must be a number'),
+    ('debts', 'nan', 'debts must be a finite number'),
+    ('investments', 'inf', 'investments must be a finite number'),
+    ('expense_Rent', '-Infinity', 'expense_Rent must be a finite number'),
+])
+def test_invalid_entry_is_rejected(app, client, user_id, field, value, error):
+    data = {**ENTRY, field: value}
+    if value is None:
+        del data[field]
+    response = client.post('/add_financial_data', data=data)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'success': False, 'error': error}
+    assert stored_count(app, user_id) == 0
+
+
+@pytest.mark.skipif(fha.fcntl is None, reason='write-behind journals need fcntl (Unix)')
+@pytest.mark.parametrize('config', [{'WRITE_BEHIND': True}], indirect=True)
+def test_invalid_entry_is_not_journaled(app, client):
+    journal = app.extensions['write_behind']
+    journal.start(app)
+    try:
+        assert client.post('/add_financial_data', data={**ENTRY, 'income': 'nan'}).status_code == 400
+        assert os.path.getsize(os.path.join(app.config['WRITE_BEHIND_DIR'], journal.name)) == 0
+        assert client.post('/add_financial_data', data=ENTRY).get_json() == {'success': True, 'queued': True}
+    finally:
+        journal.close(os.getpid())
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import financial_health_app as fha
+
+
+def add_months(app, user_id, year, income, online=True):
+    with app.app_context():
+        session = fha.financial_data_session(user_id)
+        for month in range(1, 13):
+            fha.store_financial_data(session, user_id, datetime(year, month, 1), income, income * 0.6, 100.0, 200.0,
+                                     online=online)
+            session.commit()
+        if not online:
+            fha.build_user_features(session, user_id)
+            session.commit()
+
+
+def stored_forecast(app, user_id):
+    with app.app_context():
+        return fha.financial_forecasting(user_id)
+
+
+def test_stored_forecast_is_served_until_the_data_changes(app, user_id):
+    add_months(app, user_id, 2023, 5000.0)
+    first = stored_forecast(app, user_id)
+    with app.app_context():
+        generated = {forecast.generated_at for forecast in fha.Forecast.query.filter_by(user_id=user_id)}
+
+    assert stored_forecast(app, user_id) == first
+    with app.app_context():
+        assert {forecast.generated_at for forecast in fha.Forecast.query.filter_by(user_id=user_id)} == generated
+
+
+def test_back_dated_rows_refresh_the_stored_forecast(app, user_id):
+    add_months(app, user_id, 2023, 5000.0)
+    before = stored_forecast(app, user_id)
+
+    # Like a statement import of an earlier year: every new row is dated before the forecast
+    add_months(app, user_id, 2022, 9000.0, online=False)
+    after = stored_forecast(app, user_id)
+
+    assert after['months'] == before['months']
+    assert after['income'] != before['income']
+    with app.app_context():
+        assert after == fha.financial_forecasting(user_id)
+        expected = {(f.metric, f.step): f.value for f in fha.compute_forecasts([user_id])}
+        assert {(f.metric, f.step): f.value for f in fha.Forecast.query.filter_by(user_id=user_id)} == expected
@@ -0,0 +1,42 @@
+import pytest
+
+GOAL = {'target_amount': '100000', 'current_savings': '5000', 'years': '10'}
+
+
+def test_goal_plan(client):
+    response = client.post('/goal_based_planning', data=GOAL)
+
+    assert response.status_code == 200
+    plan = response.get_json()
+    assert plan['paths'] == 10000
+    assert plan['required_savings_per_month'] == pytest.approx(95000 / 120)
+    assert 0 <= plan['probability_of_success'] <= 1
+    assert client.post('/goal_based_planning', data=GOAL).get_json() == plan
+
+
+def test_fractional_years(client):
+    response = client.post('/goal_based_planning', data={**GOAL, 'years': '0.5'})
+
+    assert response.status_code == 200
+    assert response.get_json()['required_savings_per_month'] == pytest.approx(95000 / 6)
+
+
+@pytest.mark.parametrize('field, value, error', [
+    ('years', '0', 'years must be at least one month (1/12)'),
+    ('years', '-3', 'years must be at least one month (1/12)'),
+    ('years', None, 'years is required'),
+    ('target_amount', 'lots', 'target_amount must be a number'),
+    ('current_savings', 'nan', 'current_savings must be a finite number'),
+    ('monthly_contribution', 'abc', 'monthly_contribution must be a number'),
+    ('volatility', '-0.1', 'volatility cannot be negative'),
+    ('expected_return', '-1', 'expected_return must be greater than -1'),
+    ('inflation', '-2', 'inflation must be greater than -1'),
+])
+def test_invalid_goal_is_rejected(client, field, value, error):
+    data = {**GOAL, field: value}
+    if value is None:
+        del data[field]
+    response = client.post('/goal_based_planning', data=data)
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+import financial_health_app as fha
+
+
+@pytest.mark.skipif(not os.path.exists(f'/proc/{os.getpid()}/smaps_rollup'), reason='needs /proc smaps_rollup (Linux)')
+def test_prefork_memory_report_lists_master_and_workers():
+    report = fha.prefork_memory_report([os.getppid()]).splitlines()
+
+    assert report[0].split() == ['pid', 'rss_mb', 'pss_mb', 'shared_mb', 'private_mb']
+    assert [line.split()[0] for line in report[1:]] == ['master', str(os.getppid()), 'total']
+
+
+def test_prefork_memory_report_skips_workers_that_exited():
+    # A worker that has just died is left out rather than failing the report
+    report = fha.prefork_memory_report([2 ** 22 + 1]).splitlines()
+
+    assert str(2 ** 22 + 1) not in ' '.join(line.split()[0] for line in report)
+
+
+def test_admin_memory_report_view(app):
+    assert app.view_functions['main.memory_profile_report'] is fha.memory_profile_report
+    response = app.test_client().get('/admin/memory')
+    assert response.status_code == 404
+    assert 'MEMORY_PROFILING' in response.get_json()['error']
@@ -0,0 +1,181 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import financial_health_app as fha
+
+SHARDED = {'FINANCIAL_DATA_SHARDS': 2, 'RESHARD_SETTLE_SECONDS': 0.2}
+
+
+@pytest.fixture
+def config(config, tmp_path):
+    return {**config, **SHARDED, 'SQLALCHEMY_BINDS': {f'shard_{shard}': f"sqlite:///{tmp_path / f'shard_{shard}.db'}"
+                                                     for shard in range(2)}}
+
+
+def write_entry(app, user_id, date, expenses=900.0, categories=None, session=None):
+    with app.app_context():
+        session = session or fha.financial_data_session(user_id)
+        fha.store_financial_data(session, user_id, date, 5000.0, expenses, 100.0, 200.0, categories or {'Rent': 400.0})
+        session.commit()
+
+
+def populate(app, user_id, compact=False):
+    for month in range(1, 13):
+        write_entry(app, user_id, datetime(2023, month, 3), 900.0 + month, {'Rent': 400.0, 'Transport': month})
+        write_entry(app, user_id, datetime(2023, month, 17), 800.0, {'Groceries': 120.5})
+    if compact:
+        # The first half-year goes to the archive
+        with app.app_context():
+            fha.compact_history(fha.financial_data_session(user_id), datetime(2023, 7, 1))
+
+
+def user_data(session, user_id):
+    """Everything stored for the user on one shard, without ids and timestamps"""
+    def rows(model, order):
+        columns = [c.name for c in model.__table__.columns if c.name not in ('id', 'updated_at')]
+        return [{name: getattr(row, name) for name in columns}
+                for row in session.query(model).filter_by(user_id=user_id).order_by(*order)]
+
+    entries = [(row.date, row.income, row.expenses, row.anomaly_score,
+                sorted((item.category, item.amount) for item in row.expense_items))
+               for row in session.query(fha.FinancialData).filter_by(user_id=user_id)
+               .order_by(fha.FinancialData.date, fha.FinancialData.id)]
+    return {
+        'entries': entries,
+        'archive': rows(fha.FinancialDataArchive, [fha.FinancialDataArchive.month]),
+        'stats': rows(fha.UserMonthlyStats, [fha.UserMonthlyStats.month]),
+        'features': rows(fha.UserFeatures, []),
+        'category_totals': rows(fha.UserMonthlyCategoryTotal, [fha.UserMonthlyCategoryTotal.month,
+                                                               fha.UserMonthlyCategoryTotal.category]),
+    }
+
+
+def rebuilt(session, user_id):
+    """The stats, features and category totals the user's rows add up to"""
+    session.begin_nested()
+    fha.build_user_features(session, user_id)
+    data = user_data(session, user_id)
+    session.rollback()
+    totals = {}
+    for row in session.query(fha.FinancialData).filter_by(user_id=user_id):
+        for item in row.expense_items:
+            key = (row.date.strftime('%Y-%m'), item.category)
+            totals[key] = totals.get(key, 0.0) + item.amount
+    return data['stats'], data['features'], totals
+
+
+def shards(app, user_id):
+    with app.app_context():
+        source = fha.shard_for_user(user_id)
+        return source, 1 - source
+
+
+def test_move_user_moves_everything(app, user_id):
+    populate(app, user_id, compact=True)
+    source, target = shards(app, user_id)
+    with app.app_context():
+        before = user_data(fha.get_shard_session(source), user_id)
+
+        assert fha.move_user(user_id, target) == 12
+        # Nothing new turned up, so the data (and its version) is just what it was
+
+        assert fha.db.session.get(fha.ShardAssignment, user_id).shard == target
+        assert fha.financial_data_session(user_id) is fha.get_shard_session(target)
+        assert user_data(fha.get_shard_session(target), user_id) == before
+        assert user_data(fha.get_shard_session(source), user_id) == {name: [] for name in before}
+        assert fha.get_shard_session(source).query(fha.ExpenseItem).count() == 0
+
+
+def derived_rows_match(session, user_id):
+    """The moved stats, features and category totals are what the moved rows add up to"""
+    data = user_data(session, user_id)
+    stats, features, totals = rebuilt(session, user_id)
+    assert data['stats'] == stats
+    assert data['features'] == features
+    assert {(row['month'], row['category']): row['amount'] for row in data['category_totals']} == pytest.approx(totals)
+
+
+def test_write_that_picked_the_old_shard_is_moved(app, user_id, monkeypatch):
+    populate(app, user_id)
+    source, target = shards(app, user_id)
+    picked, written = threading.Event(), threading.Event()
+    switched = threading.Event()
+
+    def late_writer():
+        with app.app_context():
+            # Routed before the switch, written after it
+            session = fha.financial_data_session(user_id)
+            picked.set()
+            switched.wait(5)
+            write_entry(app, user_id, datetime(2024, 2, 1), 700.0, {'Utilities': 55.0}, session=session)
+            written.set()
+
+    class SettleHook:
+        def __getattr__(self, name):
+            return getattr(time, name)
+
+        def sleep(self, seconds):
+            # move_user sleeps right after switching the assignment
+            switched.set()
+            written.wait(5)
+            time.sleep(seconds)
+
+    thread = threading.Thread(target=late_writer)
+    thread.start()
+    picked.wait(5)
+    monkeypatch.setattr(fha, 'time', SettleHook())
+    with app.app_context():
+        assert fha.move_user(user_id, target) == 25
+    thread.join()
+
+    with app.app_context():
+        target_session = fha.get_shard_session(target)
+        entries = user_data(target_session, user_id)['entries']
+        assert entries[-1][:3] == (datetime(2024, 2, 1), 5000.0, 700.0)
+        assert entries[-1][4] == [('Others', 645.0), ('Utilities', 55.0)]
+        derived_rows_match(target_session, user_id)
+        assert fha.get_shard_session(source).query(fha.FinancialData).filter_by(user_id=user_id).count() == 0
+
+
+def test_concurrent_writes_during_move(app, user_id):
+    populate(app, user_id)
+    source, target = shards(app, user_id)
+    stop, written = threading.Event(), []
+
+    def writer():
+        while not stop.is_set():
+            # Later dates than everything before, so the features fold rows in date order
+            write_entry(app, user_id, datetime(2024, 3, 1) + timedelta(hours=len(written)), 650.0, {'Transport': 5.0})
+            written.append(True)
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.05)
+    with app.app_context():
+        fha.move_user(user_id, target)
+    stop.set()
+    thread.join()
+
+    with app.app_context():
+        target_session = fha.get_shard_session(target)
+        assert target_session.query(fha.FinancialData).filter_by(user_id=user_id).count() == 24 + len(written)
+        assert fha.get_shard_session(source).query(fha.FinancialData).filter_by(user_id=user_id).count() == 0
+        derived_rows_match(target_session, user_id)
+
+
+def test_reshard_command(app, user_id):
+    populate(app, user_id)
+    source, target = shards(app, user_id)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['reshard', '--user', str(user_id), '--to', str(target)])
+    assert result.exit_code == 0, result.output
+    assert result.output == f'user {user_id}: moved 24 rows to shard {target}\n'
+
+    # Already there: nothing to do
+    assert runner.invoke(args=['reshard', '--user', str(user_id), '--to', str(target)]).output == ''
+    assert runner.invoke(args=['reshard', '--user', str(user_id), '--to', '5']).exit_code != 0
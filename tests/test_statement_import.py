@@ -0,0 +1,207 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import financial_health_app as fha
+
+
+def import_csv(app, user_id, text):
+    with app.app_context():
+        return fha.import_statement(user_id, io.BytesIO(text.encode()), 'csv')
+
+
+def stored_months(app, user_id):
+    with app.app_context():
+        rows = fha.FinancialData.query.filter_by(user_id=user_id).order_by(fha.FinancialData.date).all()
+        return {row.date.strftime('%Y-%m'): (row.income, row.expenses) for row in rows}
+
+
+@pytest.mark.parametrize('text, amount', [
+    ('12.00', 12.0), ('-12.00', -12.0), ('(12.00)', -12.0), ('12.00-', -12.0), ('+7', 7.0),
+    ('$1,234.56', 1234.56), ('-$1,234.56', -1234.56), ('(€ 1,000)', -1000.0), ('USD 10.50', 10.5),
+    ('1 234.5', 1234.5),
+])
+def test_parse_amounts(text, amount):
+    assert fha.parse_amounts(pd.Series([text], dtype=str)).tolist() == [amount]
+
+
+@pytest.mark.parametrize('text', ['1.234,56', '12,50', '12.00 DR', '(12.00', 'abc', '', 'inf'])
+def test_ambiguous_amounts_are_not_guessed(text):
+    assert fha.parse_amounts(pd.Series([text], dtype=str)).isna().all()
+
+
+@pytest.mark.parametrize('text, amount', [('1.234,56', 1234.56), ('(1.234,56)', -1234.56), ('12,50', 12.5),
+                                          ('1 234,5', 1234.5), ('12.500', 12500.0)])
+def test_parse_amounts_with_decimal_comma(text, amount):
+    assert fha.parse_amounts(pd.Series([text], dtype=str), decimal_comma=True).tolist() == [amount]
+
+
+def test_parenthesized_debit_counts_as_an_expense(app, user_id):
+    summary = import_csv(app, user_id, 'Date,Description,Amount\n'
+                                       '2024-01-05,Salary ACME,"3,000.00"\n'
+                                       '2024-01-10,Refund reversal,(12.00)\n'
+                                       '2024-01-11,Unknown sign,12.00 DR\n')
+
+    assert summary['skipped_rows'] == 1
+    assert stored_months(app, user_id) == {'2024-01': (3000.0, 12.0)}
+
+
+@pytest.mark.parametrize('config', [{'IMPORT_DECIMAL_COMMA': True}], indirect=True)
+def test_decimal_comma_statement(app, user_id):
+    import_csv(app, user_id, 'Date,Description,Amount\n'
+                             '2024-01-05,Gehalt,"3.000,00"\n'
+                             '2024-01-10,Miete,"-1.234,56"\n')
+
+    assert stored_months(app, user_id) == {'2024-01': (3000.0, 1234.56)}
+
+
+STATEMENT = [
+    ('2024-01-03', 'Salary ACME LTD', 3000.0),
+    ('2024-01-05', 'Landlord rent payment', -1000.0),
+    ('2024-01-09', 'TESCO STORES 3321', -80.5),
+    ('2024-01-20', 'Random Cafe', -4.5),
+    ('2024-02-03', 'Salary ACME LTD', 3100.0),
+    ('2024-02-05', 'Landlord rent payment', -1000.0),
+    ('2024-02-14', 'NETFLIX.COM', -15.99),
+    ('2024-03-03', 'Salary ACME LTD', 3200.0),
+    ('2024-03-05', 'Landlord rent payment', -1000.0),
+    ('2024-03-11', 'Uber *trip', -22.0),
+]
+
+EXPECTED = {
+    '2024-01': (3000.0, 1085.0, {'Rent': 1000.0, 'Groceries': 80.5, 'Others': 4.5}),
+    '2024-02': (3100.0, 1015.99, {'Rent': 1000.0, 'Entertainment': 15.99}),
+    '2024-03': (3200.0, 1022.0, {'Rent': 1000.0, 'Transport': 22.0}),
+}
+
+
+def statement_csv(transactions):
+    return 'Date,Description,Amount\n' + ''.join(f'{date},"{name}",{amount}\n' for date, name, amount in transactions)
+
+
+def statement_ofx(transactions):
+    body = ''.join(f'<STMTTRN>\n<TRNTYPE>OTHER\n<DTPOSTED>{date.replace("-", "")}120000\n<TRNAMT>{amount}\n'
+                   f'<NAME>{name}\n</STMTTRN>\n' for date, name, amount in transactions)
+    return ('OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            + body + '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n')
+
+
+def stored_entries(app, user_id):
+    with app.app_context():
+        rows = fha.FinancialData.query.filter_by(user_id=user_id).order_by(fha.FinancialData.date).all()
+        return {row.date.strftime('%Y-%m'): (row.income, round(row.expenses, 2),
+                                             {item.category: item.amount for item in row.expense_items})
+                for row in rows}
+
+
+def features_of(app, user_id):
+    with app.app_context():
+        features = fha.db.session.get(fha.UserFeatures, user_id)
+        return {column.name: getattr(features, column.name)
+                for column in fha.UserFeatures.__table__.columns if column.name != 'updated_at'}
+
+
+@pytest.mark.parametrize('config', [{'IMPORT_CHUNK_ROWS': 3}], indirect=True)
+def test_csv_import_makes_one_entry_per_month(app, user_id):
+    summary = import_csv(app, user_id, statement_csv(STATEMENT) + 'not a date,Broken row,x\n')
+
+    assert summary['imported_months'] == ['2024-01', '2024-02', '2024-03']
+    assert summary['skipped_months'] == []
+    assert summary['transactions'] == len(STATEMENT)
+    assert summary['skipped_rows'] == 1
+    assert stored_entries(app, user_id) == EXPECTED
+    with app.app_context():
+        totals = {(total.month, total.category): total.amount
+                  for total in fha.UserMonthlyCategoryTotal.query.filter_by(user_id=user_id)}
+    assert totals == {(month, category): amount
+                      for month, (_, _, categories) in EXPECTED.items() for category, amount in categories.items()}
+
+
+def test_csv_debit_and_credit_columns(app, user_id):
+    text = 'Posted Date,Payee,Money Out,Money In\n' + ''.join(
+        f'{date},"{name}",{-amount if amount < 0 else ""},{amount if amount > 0 else ""}\n'
+        for date, name, amount in STATEMENT)
+    import_csv(app, user_id, text)
+
+    assert stored_entries(app, user_id) == EXPECTED
+
+
+def test_csv_without_amount_column_is_rejected(app, user_id):
+    with pytest.raises(ValueError, match='amount'):
+        import_csv(app, user_id, 'Date,Description\n2024-01-03,Salary\n')
+
+
+@pytest.mark.parametrize('config', [{'IMPORT_CHUNK_ROWS': 4}], indirect=True)
+def test_ofx_import_matches_csv(app, user_id):
+    with app.app_context():
+        summary = fha.import_statement(user_id, io.BytesIO(statement_ofx(STATEMENT).encode()), 'ofx')
+
+    assert summary['imported_months'] == ['2024-01', '2024-02', '2024-03']
+    assert stored_entries(app, user_id) == EXPECTED
+
+
+@pytest.mark.parametrize('block_size', [1, 7, 64])
+def test_ofx_tags_split_across_blocks(block_size):
+    data = statement_ofx(STATEMENT).encode()
+    whole = pd.concat(fha.ofx_transaction_chunks(io.BytesIO(data), 1000))
+    split = pd.concat(fha.ofx_transaction_chunks(io.BytesIO(data), 3, block_size=block_size))
+
+    assert len(whole) == len(STATEMENT)
+    pd.testing.assert_frame_equal(split.reset_index(drop=True), whole.reset_index(drop=True))
+
+
+def test_reimport_skips_existing_months(app, user_id):
+    import_csv(app, user_id, statement_csv(STATEMENT[:7]))
+    before = stored_entries(app, user_id)
+
+    summary = import_csv(app, user_id, statement_csv(STATEMENT[4:]))
+
+    assert summary['imported_months'] == ['2024-03']
+    assert summary['skipped_months'] == ['2024-02']
+    assert stored_entries(app, user_id) == {**before, '2024-03': EXPECTED['2024-03']}
+
+
+def test_reimport_skips_archived_months(app, user_id):
+    import_csv(app, user_id, statement_csv(STATEMENT))
+    with app.app_context():
+        fha.compact_history(fha.db.session, datetime(2024, 3, 1))
+
+    summary = import_csv(app, user_id, statement_csv(STATEMENT))
+
+    assert summary['imported_months'] == []
+    assert summary['skipped_months'] == ['2024-01', '2024-02', '2024-03']
+
+
+def test_back_dated_import_rebuilds_features(app, user_id):
+    with app.app_context():
+        session = fha.financial_data_session(user_id)
+        fha.store_financial_data(session, user_id, datetime(2024, 6, 1), 4000.0, 2500.0, 700.0, 300.0)
+        session.commit()
+
+    import_csv(app, user_id, statement_csv(STATEMENT))
+
+    with app.app_context():
+        rows = fha.FinancialData.query.filter_by(user_id=user_id).order_by(fha.FinancialData.date).all()
+        # Older than the latest entry, so left for score-anomalies; balances carried over
+        assert [(row.is_anomaly, row.debts, row.investments) for row in rows[:3]] == [(None, 700.0, 300.0)] * 3
+        imported = features_of(app, user_id)
+        fha.build_user_features(fha.db.session, user_id)
+        fha.db.session.commit()
+    assert imported == features_of(app, user_id)
+    assert imported['months'] == 4
+
+
+def test_import_route(client, user_id, app):
+    response = client.post('/import_statement', data={
+        'statement': (io.BytesIO(statement_ofx(STATEMENT).encode()), 'march.qfx'), 'debts': '50'})
+
+    assert response.status_code == 200
+    assert response.get_json()['imported_months'] == ['2024-01', '2024-02', '2024-03']
+    with app.app_context():
+        assert {row.debts for row in fha.FinancialData.query.filter_by(user_id=user_id)} == {50.0}
+
+    response = client.post('/import_statement', data={'statement': (io.BytesIO(b'a,b\n1,2\n'), 'bad.csv')})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+import financial_health_app as fha
+
+pytestmark = pytest.mark.skipif(fha.fcntl is None, reason='write-behind journals need fcntl (Unix)')
+
+
+def new_journal(app, interval=60):
+    # A long interval and a large batch keep the flusher from writing on its own
+    return fha.WriteBehindJournal(app.config['WRITE_BEHIND_DIR'], 1000, interval,
+                                  app.config['WRITE_BEHIND_JOURNAL_MAX_BYTES'])
+
+
+def append_entries(journal, user_id, count, start=1):
+    return [journal.append(user_id, datetime(2024, month, 1), 5000.0, 3000.0, 100.0, 200.0, {'Rent': 1000.0})
+            for month in range(start, start + count)]
+
+
+def stored_rows(app, user_id):
+    with app.app_context():
+        rows = fha.FinancialData.query.filter_by(user_id=user_id).order_by(fha.FinancialData.date).all()
+        return [(row.date, [(item.category, item.amount) for item in row.expense_items]) for row in rows]
+
+
+def crash_with_entries(app, user_id, count):
+    """Append entries in a child process that dies without flushing; returns the journal path"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        journal = new_journal(app)
+        journal.start(app)
+        append_entries(journal, user_id, count)
+        os.write(write_end, journal.name.encode())
+        # Like a killed worker: no flush, no atexit handlers
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, 'rb') as pipe:
+        name = pipe.read().decode()
+    os.waitpid(pid, 0)
+    return os.path.join(app.config['WRITE_BEHIND_DIR'], name)
+
+
+def test_append_is_durable_before_it_is_written(app, user_id):
+    journal = new_journal(app)
+    journal.start(app)
+    acknowledged = append_entries(journal, user_id, 3)
+
+    assert [seq for _, seq in acknowledged] == [1, 2, 3]
+    with open(os.path.join(app.config['WRITE_BEHIND_DIR'], journal.name), 'rb') as f:
+        assert [json.loads(line)['seq'] for line in f] == [1, 2, 3]
+    assert stored_rows(app, user_id) == []
+
+    assert journal.flush() == 3
+    assert len(stored_rows(app, user_id)) == 3
+    with app.app_context():
+        assert fha.db.session.get(fha.JournalCheckpoint, journal.name).sequence == 3
+    journal.close(os.getpid())
+
+
+def test_crashed_journal_is_replayed(app, user_id):
+    path = crash_with_entries(app, user_id, 3)
+    assert os.path.exists(path)
+    assert stored_rows(app, user_id) == []
+
+    with app.app_context():
+        replayed = new_journal(app).recover_all()
+
+    assert replayed == {os.path.basename(path): 3}
+    rows = stored_rows(app, user_id)
+    assert [date.month for date, _ in rows] == [1, 2, 3]
+    assert all(sorted(items) == [('Others', 2000.0), ('Rent', 1000.0)] for _, items in rows)
+    assert not os.path.exists(path)
+    with app.app_context():
+        assert fha.JournalCheckpoint.query.count() == 0
+
+
+def test_replay_skips_checkpointed_entries(app, user_id):
+    path = crash_with_entries(app, user_id, 4)
+    with open(path, 'rb') as f:
+        entries = [json.loads(line) for line in f]
+    # The process died after a group commit of the first two entries
+    with app.app_context():
+        fha.apply_journal_entries(os.path.basename(path), entries[:2])
+    assert len(stored_rows(app, user_id)) == 2
+
+    with app.app_context():
+        assert new_journal(app).recover_all() == {os.path.basename(path): 2}
+    assert [date.month for date, _ in stored_rows(app, user_id)] == [1, 2, 3, 4]
+
+
+def test_torn_last_line_is_ignored(app, user_id):
+    path = crash_with_entries(app, user_id, 2)
+    with open(path, 'ab') as f:
+        f.write(b'{"seq": 3, "user_id": ')
+
+    with app.app_context():
+        assert new_journal(app).recover_all() == {os.path.basename(path): 2}
+    assert len(stored_rows(app, user_id)) == 2
+
+
+def test_live_journal_is_not_replayed(app, user_id):
+    journal = new_journal(app)
+    journal.start(app)
+    append_entries(journal, user_id, 2)
+
+    with app.app_context():
+        assert new_journal(app).recover(os.path.join(app.config['WRITE_BEHIND_DIR'], journal.name)) is None
+    assert stored_rows(app, user_id) == []
+    journal.close(os.getpid())
+    assert len(stored_rows(app, user_id)) == 2
+
+
+def test_serving_process_replays_with_write_behind_off(app, user_id):
+    path = crash_with_entries(app, user_id, 2)
+    assert app.extensions['write_behind'] is None
+
+    assert fha.replay_journals(app) == {os.path.basename(path): 2}
+    assert len(stored_rows(app, user_id)) == 2